@@ -0,0 +1,172 @@
+"""Download a year of Elenia readings for many accounts at once.
+
+Accounts come from a credentials manifest (ELENIA_ACCOUNTS_FILE, default
+elenia_accounts.json), a JSON list like
+
+    [
+        {"name": "home", "username": "me@example.com", "password_env": "ELENIA_PASSWORD_HOME"},
+        {"name": "cabin", "username": "cabin@example.com", "password": "..."}
+    ]
+
+Every account is logged in, and every customer id and metering point (GSRN)
+it has is downloaded to downloads/accounts/<name>/<customer_id>_<gsrn>_<kind>.json.
+Logins and downloads share a bounded thread pool, one token bucket and one
+circuit breaker (sahko/ratelimit.py), so the total request rate stays at
+--rate however many accounts there are, and a run of 504/429 answers pauses
+everyone instead of every worker hammering the API on its own:
+
+    python 1.2_elenia_batch.py --workers 4 --rate 2
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from dotenv import load_dotenv
+
+from sahko.elenia import EleniaError, fetch_year, login, metering_points
+from sahko.instrumentation import stage, add_rows, add_bytes_written
+from sahko.ratelimit import CircuitBreaker, TokenBucket
+
+# Set up logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+ACCOUNTS_FILE = os.getenv('ELENIA_ACCOUNTS_FILE', 'elenia_accounts.json')
+OUTPUT_DIR = 'downloads/accounts'
+RATE_LIMIT = float(os.getenv('ELENIA_RATE_LIMIT', 2))  # requests per second, all workers together
+BURST = int(os.getenv('ELENIA_BURST', 4))
+
+
+def load_accounts(path):
+    """Accounts of the manifest as dicts with name, username and password."""
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    accounts = []
+    names = set()
+    for index, entry in enumerate(entries):
+        username = entry.get('username')
+        password = entry.get('password') or (os.getenv(entry['password_env']) if entry.get('password_env') else None)
+        if not username or not password:
+            raise ValueError(f"Account {index} in {path} needs a username and a password or password_env")
+        # The name becomes a directory, so keep it to safe characters
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', entry.get('name') or username)
+        if name in names:
+            raise ValueError(f"Account name {name} appears twice in {path}")
+        names.add(name)
+        accounts.append({'name': name, 'username': username, 'password': password})
+    return accounts
+
+
+def discover(account, limiter, breaker):
+    """Log an account in and list its downloads as (customer_id, gsrn, kind)."""
+    headers, metadata = login(account['username'], account['password'], limiter, breaker)
+    jobs = []
+    for customer_id, customer_data in metadata.get('customer_datas', {}).items():
+        for gsrn, kind in metering_points(customer_data):
+            jobs.append((customer_id, gsrn, kind))
+    logger.info(f"{account['name']}: {len(jobs)} metering points under "
+                f"{len(metadata.get('customer_datas', {}))} customer ids")
+    return headers, jobs
+
+
+def download(account, headers, job, year, output_dir, limiter, breaker):
+    customer_id, gsrn, kind = job
+    directory = os.path.join(output_dir, account['name'])
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, f"{customer_id}_{gsrn}_{kind}.json")
+    result = {'account': account['name'], 'customer_id': customer_id, 'gsrn': gsrn, 'kind': kind,
+              'file': filename, 'hours': None}
+    try:
+        result['hours'] = fetch_year(headers, customer_id, gsrn, year, kind, filename, limiter, breaker)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"{account['name']} {gsrn}: {e}")
+    if result['hours'] is not None:
+        add_bytes_written(os.path.getsize(filename))
+        add_rows(result['hours'])
+    result['status'] = 'ok' if result['hours'] is not None else 'failed'
+    return result
+
+
+def run_batch(accounts, year, output_dir, workers, limiter, breaker):
+    """Log in every account and download all its metering points in one pool. Returns per-download results."""
+    results = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='elenia') as pool:
+        def submit(function, *args):
+            # Workers report into the running stage's metrics
+            return pool.submit(contextvars.copy_context().run, function, *args)
+
+        running = {submit(discover, account, limiter, breaker): ('login', account) for account in accounts}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, account = running.pop(future)
+                if kind == 'download':
+                    results.append(future.result())
+                    continue
+                try:
+                    headers, jobs = future.result()
+                except (EleniaError, requests.exceptions.RequestException) as e:
+                    logger.error(f"{account['name']}: {e}")
+                    results.append({'account': account['name'], 'customer_id': None, 'gsrn': None,
+                                    'kind': None, 'file': None, 'hours': None, 'status': 'login failed'})
+                    continue
+                for job in jobs:
+                    running[submit(download, account, headers, job, year, output_dir, limiter, breaker)] = \
+                        ('download', account)
+    return results
+
+
+def print_results(results):
+    print(f"\n{'Account':<20} {'Customer':<12} {'GSRN':<20} {'Kind':<12} {'Hours':>7}  Status")
+    for result in sorted(results, key=lambda r: (r['account'], r['customer_id'] or '', r['gsrn'] or '')):
+        hours = '' if result['hours'] is None else result['hours']
+        print(f"{result['account']:<20} {result['customer_id'] or '-':<12} {result['gsrn'] or '-':<20} "
+              f"{result['kind'] or '-':<12} {hours:>7}  {result['status']}")
+    failed = sum(result['status'] != 'ok' for result in results)
+    print(f"\n{len(results) - failed} downloads succeeded, {failed} failed")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Download Elenia readings for every account in a credentials manifest')
+    parser.add_argument('--accounts', default=ACCOUNTS_FILE, help='Credentials manifest (JSON list of accounts)')
+    parser.add_argument('--year', default=os.getenv('YEAR'), help='Year to download (default: YEAR)')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='Where the per-account files go')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent requests (default: 4)')
+    parser.add_argument('--rate', type=float, default=RATE_LIMIT,
+                        help='Requests per second over all workers (default: ELENIA_RATE_LIMIT or 2)')
+    parser.add_argument('--burst', type=int, default=BURST, help='Requests allowed back to back (default: 4)')
+    parser.add_argument('--failure-threshold', type=int, default=5,
+                        help='Consecutive failures that pause all requests (default: 5)')
+    parser.add_argument('--reset-timeout', type=float, default=30,
+                        help='Seconds to pause before probing the API again (default: 30)')
+    args = parser.parse_args(argv)
+
+    if not args.year:
+        parser.error("Set YEAR or pass --year")
+    try:
+        accounts = load_accounts(args.accounts)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    limiter = TokenBucket(args.rate, args.burst)
+    breaker = CircuitBreaker(args.failure_threshold, args.reset_timeout)
+    logger.info(f"Fetching {args.year} for {len(accounts)} accounts with {args.workers} workers at {args.rate:g} requests/s")
+    with stage("elenia_batch"):
+        results = run_batch(accounts, args.year, args.output_dir, args.workers, limiter, breaker)
+    print_results(results)
+    return 0 if all(result['status'] == 'ok' for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,56 +1,82 @@
 import sys
-import json
 import csv
-import requests
-from datetime import datetime
+import logging
+import argparse
 import os
 from dotenv import load_dotenv
+from sahko.instrumentation import stage, add_rows, add_bytes_written
+from sahko.prices import PriceClient, PriceSourceError, VAT_SCHEDULE_VERSION, with_vat
+from sahko.timeaxis import format_local
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
 
 load_dotenv()
 
-headers = {
-    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.182 Safari/537.36"
-}
+FIELDNAMES = ['timeStamp', 'timeStampDay', 'timeStampHour', 'value', 'priceArea', 'unit']
+
+
+def fetch_price_data(years, workers=4, client=None):
+    # One pool fetches every missing month of all the years; cached months
+    # are read from downloads/prices/ (see sahko/prices.py)
+    client = client or PriceClient()
+    years = sorted(int(year) for year in years)
+    epoch, prices = client.prices(f"{years[0]}-01-01", f"{years[-1]}-12-31", workers=workers)
+    print(f"Loaded {len(epoch)} prices, adding VAT (schedule v{VAT_SCHEDULE_VERSION})")
+    values = with_vat(epoch, prices).tolist()
+
+    data = {year: [] for year in years}
+    for timestamp, value in zip(format_local(epoch), values):
+        year = int(timestamp[:4])
+        if year in data:
+            data[year].append({'timeStamp': timestamp[:19], 'timeStampDay': timestamp[:10],
+                               'timeStampHour': timestamp[11:16], 'value': value, 'priceArea': 'FI',
+                               'unit': 'snt/kWh'})
+    return data
+
 
-# Get the current year
-#current_year = datetime.now().year
-current_year = os.getenv('YEAR')
-# Generate the start and end dates for the current year
-start_date = f"{current_year}-01-01"
-end_date = f"{current_year}-12-31"
+def save_price_data(data, current_year):
+    # ensure downloads folder exists
+    if not os.path.exists("downloads"):
+        os.makedirs("downloads")
 
-url = f"https://www.vattenfall.fi/api/price/spot/{start_date}/{end_date}?lang=fi"
-print(f"Loading data from {url}...")
-response = requests.get(url, headers=headers)
+    csv_filename = f"downloads/vattenfall_hinnat_{current_year}.csv"
 
-if response.status_code == 200:
-    data = response.json()  # Parse the JSON data from the response
-    print("Data has been loaded from the URL")
-else:
-    print("Error:", response.status_code)
-    exit()  # Exit the program if there is an error
+    # Write data to CSV file using semicolon as the separator
+    with open(csv_filename, mode='w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=FIELDNAMES, delimiter=';', quoting=csv.QUOTE_MINIMAL)
 
-# Add VAT (25.5%) to the values
-VAT_RATE = 0.255
-for row in data:
-    row['value'] = round(row['value'] * (1 + VAT_RATE), 2)
+        writer.writeheader()
 
-# ensure downloads folder exists
-if not os.path.exists("downloads"):
-    os.makedirs("downloads")
+        for row in data:
+            writer.writerow(row)
 
-csv_filename = f"downloads/vattenfall_hinnat_{current_year}.csv"
+    print(f"Data saved {csv_filename}")
+    return csv_filename
 
-# Extract the keys from the first dictionary to use as header
-fieldnames = data[0].keys()
 
-# Write data to CSV file using semicolon as the separator
-with open(csv_filename, mode='w', newline='') as csv_file:
-    writer = csv.DictWriter(csv_file, fieldnames=fieldnames, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Download spot prices (VAT included) to downloads/vattenfall_hinnat_<year>.csv')
+    parser.add_argument('--years', nargs='+', default=[os.getenv('YEAR')],
+                        help='Years to download, e.g. a backfill: --years 2021 2022 2023 (default: YEAR)')
+    parser.add_argument('--workers', type=int, default=4, help='Months fetched concurrently (default: 4)')
+    args = parser.parse_args(argv)
+    if not all(args.years):
+        parser.error("Set YEAR or pass --years")
 
-    writer.writeheader()
+    with stage("vattenfall_fetch"):
+        try:
+            data = fetch_price_data(args.years, args.workers)
+        except PriceSourceError as e:
+            print("Error:", e)
+            sys.exit(1)  # Exit the program if there is an error
+        for year, rows in data.items():
+            if not rows:
+                print(f"Error: no prices for {year}")
+                sys.exit(1)
+            csv_filename = save_price_data(rows, year)
+            add_rows(len(rows))
+            add_bytes_written(os.path.getsize(csv_filename))
 
-    for row in data:
-        writer.writerow(row)
 
-print(f"Data saved {csv_filename}")
+if __name__ == "__main__":
+    main()
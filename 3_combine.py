@@ -1,9 +1,15 @@
-import json
-import csv
 import os
-from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
+import numpy as np
 from dotenv import load_dotenv
+from sahko.changes import ChangeManifest, months_of, read_partitions, write_partitions
+from sahko.dayhash import column_day_hashes, drop_days, select_days
+from sahko.daymatrix import DEFAULT_MATRIX_DIR, write_matrices
+from sahko.instrumentation import stage, add_rows, add_bytes_read, add_bytes_written
+from sahko.payloads import build_aggregates, write_payload
+from sahko.rollups import RollupStore
+from sahko.raw import load_consumption, load_prices
+from sahko.series import HourlySeries
+from sahko.timeaxis import align, format_local, output_step, resample, utc_offsets
 
 # Load environment variables
 load_dotenv()
@@ -15,90 +21,164 @@ vattenfall_price_data_file = f'downloads/vattenfall_hinnat_{YEAR}.csv'
 elenia_consumption_data_file = 'downloads/consumption_data.json'
 combined_data_file = 'processed/combined_data.csv'
 
-# Load Elenia consumption data
-with open(elenia_consumption_data_file, 'r') as f:
-    consumption_raw = json.load(f)
-
-# Create dictionary for consumption data
-consumption_dict = {}
-
-# Process consumption data - use regular or netted hourly values if available
-for month in consumption_raw['months']:
-    # Prefer netted values if available
-    if 'hourly_values_netted' in month and month['hourly_values_netted']:
-        consumption_values = month['hourly_values_netted']
-    elif 'hourly_values' in month and month['hourly_values']:
-        consumption_values = month['hourly_values']
-    else:
-        continue
-    for hourly in consumption_values:
-        if 't' in hourly:
-            timestamp_str = hourly['t']
-        else:
-            # If no timestamp, construct it from the month data
-            # Assuming the values are in order starting from the beginning of the month
-            month_num = month['month']
-            hour_index = consumption_values.index(hourly)
-            timestamp = datetime(int(YEAR), month_num, 1) + timedelta(hours=hour_index)
-            timestamp_str = timestamp.strftime('%Y-%m-%dT%H:%M:%S')
-        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=ZoneInfo("Europe/Helsinki"))
-        consumption_dict[timestamp] = hourly['v'] / 1000  # Convert to kWh
-
-# Load Vattenfall price data
-price_data = {}
-with open(vattenfall_price_data_file, 'r') as f:
-    reader = csv.DictReader(f, delimiter=';')
-    for row in reader:
-        timestamp = datetime.strptime(row['timeStamp'], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=ZoneInfo("Europe/Helsinki"))
-        price_data[timestamp] = float(row['value'])
-
-# Add debug information
-print("\nDebug Information:")
-print("=================")
-print(f"\nNetted Consumption Data ({len(consumption_dict)} records):")
-print(f"First record: {min(consumption_dict.keys())}")
-print(f"Last record: {max(consumption_dict.keys())}")
-
-print(f"\nPrice Data ({len(price_data)} records):")
-print(f"First record: {min(price_data.keys())}")
-print(f"Last record: {max(price_data.keys())}")
-
-# Add more detailed debug information
-print("\nDetailed Debug Information:")
-print("=================")
-print(f"\nNetted Consumption Data Details:")
-print("Last 5 records:")
-last_keys = sorted(consumption_dict.keys())[-5:]
-for key in last_keys:
-    print(f"{key}: {consumption_dict[key]}")
-
-# Combine data
-combined_data = []
-for timestamp in consumption_dict:
-    net_consumption = consumption_dict[timestamp]
-    price = price_data.get(timestamp)
-    
-    if price is not None:
-        cost = net_consumption * (price + SPOT_MARGIN) / 100  # Convert cents to euros
-        combined_data.append({
-            'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S%z'),
-            'consumption_kWh': net_consumption,
-            'price_cents_per_kWh': price,
-            'cost_euros': cost
-        })
-
-# Sort the combined data by timestamp
-combined_data.sort(key=lambda x: x['timestamp'])
-
-# ensure processed folder exists
-if not os.path.exists("processed"):
-    os.makedirs("processed")
-
-# Write the combined data to a CSV file
-with open(combined_data_file, 'w', newline='') as f:
-    writer = csv.DictWriter(f, fieldnames=['timestamp', 'consumption_kWh', 
-                                         'price_cents_per_kWh', 'cost_euros'])
-    writer.writeheader()
-    writer.writerows(combined_data)
-
-print(f"Combined data has been written to {combined_data_file}")
+
+def load_consumption_data(filename):
+    # Load Elenia consumption data, netted values preferred (see sahko.raw)
+    consumption = load_consumption(filename, YEAR)
+    add_bytes_read(os.path.getsize(filename))
+    return consumption
+
+
+def load_price_data(filename):
+    # Load Vattenfall price data
+    prices = load_prices(filename)
+    add_bytes_read(os.path.getsize(filename))
+    return prices
+
+
+def print_debug_info(consumption, prices):
+    consumption_epoch, consumption_kwh, consumption_step = consumption
+    price_epoch, _, price_step = prices
+
+    # Add debug information
+    print("\nDebug Information:")
+    print("=================")
+    print(f"\nNetted Consumption Data ({len(consumption_epoch)} records, {consumption_step // 60} min):")
+    print(f"First record: {format_local(consumption_epoch[:1])[0]}")
+    print(f"Last record: {format_local(consumption_epoch[-1:])[0]}")
+
+    print(f"\nPrice Data ({len(price_epoch)} records, {price_step // 60} min):")
+    print(f"First record: {format_local(price_epoch[:1])[0]}")
+    print(f"Last record: {format_local(price_epoch[-1:])[0]}")
+
+    # Add more detailed debug information
+    print("\nDetailed Debug Information:")
+    print("=================")
+    print(f"\nNetted Consumption Data Details:")
+    print("Last 5 records:")
+    for timestamp, value in zip(format_local(consumption_epoch[-5:]), consumption_kwh[-5:].tolist()):
+        print(f"{timestamp}: {value}")
+
+
+def detect_changes(manifest, consumption, prices):
+    # Days of the year whose raw consumption or prices differ from the last run
+    inputs = {
+        'consumption': column_day_hashes(consumption[0], consumption[1]),
+        'prices': column_day_hashes(prices[0], prices[1]),
+    }
+    settings = {'spot_margin': SPOT_MARGIN, 'resolution_minutes': output_step() // 60}
+    changed = manifest.detect(inputs, settings)
+    return [day for day in changed if day.startswith(f"{YEAR}-")], list(inputs['consumption'])
+
+
+def raw_days(series, days):
+    # Raw (epoch, values, step) restricted to the given local days
+    epoch, values, step = series
+    local_days = ((epoch + utc_offsets(epoch)) // 86400).astype('datetime64[D]')
+    keep = np.isin(local_days, np.array(sorted(days), dtype='datetime64[D]'))
+    return epoch[keep], values[keep], step
+
+
+def combine_data(consumption, prices, target_step):
+    consumption_epoch, consumption_kwh, consumption_step = consumption
+    price_epoch, price_values, price_step = prices
+
+    # Match the two series at the finest resolution involved, so 15-minute
+    # prices are applied to the matching share of hourly consumption
+    fine_step = min(consumption_step, price_step, target_step)
+    consumption_epoch, consumption_kwh = resample(consumption_epoch, consumption_kwh, consumption_step, fine_step, 'sum')
+    price_epoch, price_values = resample(price_epoch, price_values, price_step, fine_step, 'mean')
+
+    consumption_index, price_index = align(consumption_epoch, price_epoch)
+    unmatched = len(consumption_epoch) - len(consumption_index)
+    if unmatched:
+        print(f"Warning: {unmatched} consumption intervals have no price and were skipped")
+
+    epoch = consumption_epoch[consumption_index]
+    net_consumption = consumption_kwh[consumption_index]
+    price = price_values[price_index]
+    cost = net_consumption * (price + SPOT_MARGIN) / 100  # Convert cents to euros
+
+    if fine_step != target_step:
+        # Costs are summed from the fine intervals; the price column is the
+        # average spot price of the output interval
+        _, cost = resample(epoch, cost, fine_step, target_step, 'sum')
+        _, price = resample(epoch, price, fine_step, target_step, 'mean')
+        epoch, net_consumption = resample(epoch, net_consumption, fine_step, target_step, 'sum')
+
+    # Rows come out sorted by time
+    return HourlySeries(epoch, net_consumption, price, cost, interval_hours=target_step / 3600)
+
+
+def write_combined_data(combined_data, filename):
+    # ensure processed folder exists
+    if not os.path.exists("processed"):
+        os.makedirs("processed")
+
+    # Write the combined data to a CSV file
+    combined_data.to_csv(filename)
+    add_bytes_written(os.path.getsize(filename))
+
+    print(f"Combined data has been written to {filename}")
+
+
+def update_rollups(combined_data, changed, old_rows, new_rows):
+    # Revised days are swapped in, then hours newer than the stored watermark are added
+    store = RollupStore.load()
+    settings = {'spot_margin': SPOT_MARGIN, 'resolution_minutes': output_step() // 60}
+    if any(store.data.get(key) != value for key, value in settings.items()):
+        # Costs depend on the margin and buckets on the row length, so
+        # changing either means rebuilding
+        store = RollupStore(store.path)
+        store.data.update(settings)
+    interval_hours = settings['resolution_minutes'] / 60
+    revised = store.revise(changed, old_rows.records(), new_rows.records(), interval_hours=interval_hours)
+    added = store.update(combined_data.after(store.data['watermark_epoch']).records(), interval_hours=interval_hours)
+    store.save()
+    print(f"Revised {len(revised)} days and added {added} new hours to rollups (up to {store.watermark})")
+    return store, revised
+
+
+def update_matrices(combined_data):
+    # Day x hour matrices for the heatmaps and calendar reports
+    days = write_matrices(combined_data)
+    print(f"Wrote {days} days to the day matrices in {DEFAULT_MATRIX_DIR}")
+
+
+def write_api_payloads(store):
+    # Small precompressed aggregates for the web API (/api/aggregates)
+    entry = write_payload('aggregates', build_aggregates(store))
+    sizes = ', '.join(f"{encoding} {size} B" for encoding, size in entry['sizes'].items())
+    print(f"API aggregates {entry['etag'][:12]}: {sizes}")
+
+
+def main():
+    with stage("combine"):
+        consumption = load_consumption_data(elenia_consumption_data_file)
+        prices = load_price_data(vattenfall_price_data_file)
+        print_debug_info(consumption, prices)
+
+        # Only days whose raw data changed are recombined; the rest comes
+        # from the monthly partitions written by earlier runs
+        manifest = ChangeManifest.load()
+        changed, consumption_days = detect_changes(manifest, consumption, prices)
+        stored = read_partitions([f"{YEAR}-{month:02d}" for month in range(1, 13)])
+        missing = set(consumption_days) - set(stored.field('day').astype(str).tolist())
+        changed = sorted(set(changed) | missing)
+        print(f"\n{len(changed)} days new or changed since the last run")
+
+        new_rows = combine_data(raw_days(consumption, changed), raw_days(prices, changed), output_step())
+        combined_data = HourlySeries.concat([drop_days(stored, changed), new_rows])
+        write_partitions(combined_data, months_of(changed))
+        write_combined_data(combined_data, combined_data_file)
+        update_matrices(combined_data)
+        store, revised = update_rollups(combined_data, changed, select_days(stored, changed), new_rows)
+        write_api_payloads(store)
+
+        manifest.record(changed, revised)
+        manifest.save()
+        add_rows(len(new_rows))
+
+
+if __name__ == "__main__":
+    main()
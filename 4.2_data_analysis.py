@@ -1,16 +1,25 @@
-import csv
+import argparse
 from datetime import datetime, timedelta
-from collections import defaultdict
-import matplotlib.pyplot as plt
-import requests
-import pytz
+from zoneinfo import ZoneInfo
 import os
+import numpy as np
 from dotenv import load_dotenv
-from dateutil.parser import isoparse
+from sahko.daymatrix import DEFAULT_MATRIX_DIR, DEFAULT_METER, DayMatrix
+from sahko.instrumentation import stage, add_rows, add_bytes_read, timed_import
+from sahko.rollups import RollupStore, DEFAULT_ROLLUP_FILE, average_price
+from sahko.series import HourlySeries
+from sahko.sketches import PriceSketch
+from sahko import db
+
+# matplotlib and requests are imported only by the code paths that need
+# them, so text-only reports start without paying for them.
 
 # Load environment variables
 load_dotenv()
 
+# Length of one combined row; 0.25 when RESOLUTION_MINUTES=15
+INTERVAL_HOURS = int(os.getenv('RESOLUTION_MINUTES', 60)) / 60
+
 # ANSI color codes
 class Colors:
     RESET = '\033[0m'
@@ -25,39 +34,124 @@ class Colors:
 
 def read_combined_data(filename='combined_data.csv'):
     filepath = os.path.join('processed', filename)
-    data = []
-    with open(filepath, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            timestamp = isoparse(row['timestamp'])
-            data.append({
-                'date': timestamp.date(),
-                'hour': timestamp.hour,
-                'consumption': float(row['consumption_kWh']),
-                'price': float(row['price_cents_per_kWh']),
-                'cost': float(row['cost_euros'])
-            })
-    return data
-
-def analyze_data(data):
-    total_consumption = sum(row['consumption'] for row in data)
-    total_cost = sum(row['cost'] for row in data)
-    average_price = sum(row['price'] for row in data) / len(data)
-
-    monthly_data = defaultdict(lambda: {'consumption': 0, 'cost': 0, 'hours': 0, 'daily_consumption': defaultdict(float), 'prices': []})
-    for row in data:
-        month = row['date'].strftime('%Y-%m')
-        monthly_data[month]['consumption'] += row['consumption']
-        monthly_data[month]['cost'] += row['cost']
-        monthly_data[month]['hours'] += 1
-        monthly_data[month]['prices'].append(row['price'])
-        monthly_data[month]['daily_consumption'][row['date'].strftime('%Y-%m-%d')] += row['consumption']
-
-    # Calculate monthly averages
-    for month, data in monthly_data.items():
-        num_days = len(data['daily_consumption'])
-        data['average_daily_consumption'] = data['consumption'] / num_days if num_days > 0 else 0
-        data['average_monthly_price'] = sum(data['prices']) / len(data['prices']) if data['prices'] else 0
+    add_bytes_read(os.path.getsize(filepath))
+    return HourlySeries.read_csv(filepath)
+
+def read_iceberg_data(year=None):
+    # Same series as read_combined_data, scanned directly from the Iceberg table
+    from sahko import iceberg  # pyiceberg is only needed for this source
+    return HourlySeries.from_records(iceberg.iter_rows(year))
+
+def price_sketches(series):
+    # Price sketches per month and per hour of the day, filled column-wise
+    monthly_sketches = {}
+    for month, rows in series.groupby('month'):
+        monthly_sketches[str(month)] = sketch = PriceSketch()
+        sketch.add_many(rows.price, rows.consumption, rows.interval_hours)
+    hour_sketches = {}
+    for hour, rows in series.groupby('hour'):
+        hour_sketches[f"{hour:02d}"] = sketch = PriceSketch()
+        sketch.add_many(rows.price, rows.consumption, rows.interval_hours)
+    return monthly_sketches, hour_sketches
+
+def year_range(year):
+    # [start, end) days of YEAR for the day matrices; everything if unset
+    if not year:
+        return None, None
+    return f"{int(year)}-01-01", f"{int(year) + 1}-01-01"
+
+def add_matrix_cells(sketch, matrix, start, end, hours=None):
+    # Slots holding one interval, plus each interval of the slots holding
+    # two (the repeated autumn hour) with its own price
+    single = matrix.select('rows', start, end, hours=hours) == 1
+    repeated = matrix.repeated(start, end, hours=hours)
+    prices = np.concatenate([matrix.select('price', start, end, hours=hours)[single], repeated['price']])
+    kwh = np.concatenate([matrix.select('kwh', start, end, hours=hours)[single], repeated['kwh']])
+    sketch.add_many(prices, kwh, matrix.interval_hours)
+
+def matrix_sketches(matrix, start=None, end=None):
+    # Same sketches as price_sketches: a month is a block of rows, an hour a column
+    monthly_sketches = {}
+    months = np.unique(matrix.days[matrix.rows(start, end)].astype('datetime64[M]'))
+    for month in months:
+        # start and end are whole years, so every month is complete
+        monthly_sketches[str(month)] = sketch = PriceSketch()
+        add_matrix_cells(sketch, matrix, month, month + 1)
+    hour_sketches = {}
+    for hour in range(24):
+        sketch = PriceSketch()
+        add_matrix_cells(sketch, matrix, start, end, hours=slice(hour, hour + 1))
+        if sketch.bins:
+            hour_sketches[f"{hour:02d}"] = sketch
+    return monthly_sketches, hour_sketches
+
+def analyze_matrix(matrix, year=None):
+    # Same result as analyze_data, reduced from the memory-mapped day matrices
+    start, end = year_range(year)
+    months, sums = matrix.aggregate('month', start, end)
+    if not len(months):
+        raise ValueError(f"No rows in the day matrices for year {year}")
+    months = months.astype(str).tolist()
+    day_keys, _ = matrix.aggregate('day', start, end)
+    day_months, days = np.unique(day_keys.astype('datetime64[M]'), return_counts=True)
+    days_per_month = dict(zip(day_months.astype(str).tolist(), days.tolist()))
+    monthly_sketches, hour_sketches = matrix_sketches(matrix, start, end)
+    fixed_price = float(os.getenv('FIXED_PRICE', 8.5))  # Default to 8.5 if not set
+
+    monthly_data = {}
+    for month, consumption, cost, hours, price_sum in zip(months, sums['consumption'].tolist(), sums['cost'].tolist(),
+                                                          sums['hours'].tolist(), sums['price_sum'].tolist()):
+        num_days = days_per_month.get(month, 0)
+        monthly_data[month] = {
+            'consumption': consumption,
+            'cost': cost,
+            'hours': hours,
+            'price_sum': price_sum,
+            'price_sketch': monthly_sketches[month],
+            'average_daily_consumption': consumption / num_days if num_days > 0 else 0,
+            'average_monthly_price': price_sum / hours if hours else 0,
+            'fixed_price_cost': consumption * fixed_price / 100,
+        }
+
+    total_consumption = float(sums['consumption'].sum())
+    total_cost = float(sums['cost'].sum())
+    fixed_price_total_cost = total_consumption * fixed_price / 100  # Convert to EUR
+    return {
+        'total_consumption': total_consumption,
+        'total_cost': total_cost,
+        'average_price': float(sums['price_sum'].sum() / sums['hours'].sum()),
+        'monthly_data': monthly_data,
+        'fixed_price_total_cost': fixed_price_total_cost,
+        'savings': fixed_price_total_cost - total_cost,
+        'fixed_price': fixed_price,
+        'hour_sketches': hour_sketches
+    }
+
+def analyze_data(series):
+    total_consumption = float(series.consumption.sum())
+    total_cost = float(series.cost.sum())
+    average_price = float(series.price.sum()) / len(series)
+
+    months, sums = series.aggregate('month')
+    months = months.astype(str).tolist()
+    # Days with data in each month, for the daily averages
+    day_months, days = np.unique(np.unique(series.field('day')).astype('datetime64[M]'), return_counts=True)
+    days_per_month = dict(zip(day_months.astype(str).tolist(), days.tolist()))
+    monthly_sketches, hour_sketches = price_sketches(series)
+
+    monthly_data = {}
+    for month, consumption, cost, hours, price_sum in zip(months, sums['consumption'].tolist(), sums['cost'].tolist(),
+                                                          sums['hours'].tolist(), sums['price_sum'].tolist()):
+        num_days = days_per_month.get(month, 0)
+        monthly_data[month] = {
+            'consumption': consumption,
+            'cost': cost,
+            'hours': hours,
+            'price_sum': price_sum,
+            'price_sketch': monthly_sketches[month],
+            'average_daily_consumption': consumption / num_days if num_days > 0 else 0,
+            'average_monthly_price': price_sum / hours if hours else 0,
+        }
 
     fixed_price = float(os.getenv('FIXED_PRICE', 8.5))  # Default to 8.5 if not set
     fixed_price_total_cost = total_consumption * fixed_price / 100  # Convert to EUR
@@ -75,25 +169,94 @@ def analyze_data(data):
         'monthly_data': monthly_data,
         'fixed_price_total_cost': fixed_price_total_cost,
         'savings': savings,
-        'fixed_price': fixed_price
+        'fixed_price': fixed_price,
+        'hour_sketches': hour_sketches
+    }
+
+def analyze_rollups(store, year=None):
+    # Same result as analyze_data, read from the precomputed monthly rollups
+    # of one year (the store keeps every year combined so far)
+    totals = store.totals(year)
+    fixed_price = float(os.getenv('FIXED_PRICE', 8.5))  # Default to 8.5 if not set
+
+    monthly_data = {}
+    for month, bucket in store.months(year):
+        num_days = bucket.get('days', 0)
+        monthly_data[month] = {
+            'consumption': bucket['consumption'],
+            'cost': bucket['cost'],
+            'hours': bucket['hours'],
+            'average_daily_consumption': bucket['consumption'] / num_days if num_days > 0 else 0,
+            'average_monthly_price': average_price(bucket),
+            'fixed_price_cost': bucket['consumption'] * fixed_price / 100,
+            'price_sketch': store.sketch('monthly', month),
+        }
+
+    # Hour-of-day buckets are not kept per year, so they only stand for YEAR
+    # when the store holds no other year
+    hour_sketches = {}
+    if year is None or set(store.years()) <= {year}:
+        hour_sketches = {hour: store.sketch('hour_of_day', hour) for hour in sorted(store.level('hour_of_day'))}
+
+    fixed_price_total_cost = totals['consumption'] * fixed_price / 100  # Convert to EUR
+    return {
+        'total_consumption': totals['consumption'],
+        'total_cost': totals['cost'],
+        'average_price': average_price(totals),
+        'monthly_data': monthly_data,
+        'fixed_price_total_cost': fixed_price_total_cost,
+        'savings': fixed_price_total_cost - totals['cost'],
+        'fixed_price': fixed_price,
+        'hour_sketches': hour_sketches
+    }
+
+def read_db_data(conn, year=None):
+    # Same series as read_combined_data, streamed from a server-side cursor
+    return HourlySeries.from_records(db.iter_rows(conn, year))
+
+def analyze_db(conn, year=None, with_sketches=False):
+    # Same result as analyze_data, with the sums computed by Postgres. The
+    # price sketches need the rows, which are streamed only when asked for.
+    monthly, totals = db.aggregates(conn, year)
+    if totals is None:
+        raise ValueError(f"No rows in the database for year {year}")
+    fixed_price = float(os.getenv('FIXED_PRICE', 8.5))  # Default to 8.5 if not set
+
+    monthly_data = {}
+    for month, bucket in monthly.items():
+        num_days = bucket['days']
+        monthly_data[month] = {
+            'consumption': bucket['consumption'],
+            'cost': bucket['cost'],
+            'hours': bucket['row_count'] * INTERVAL_HOURS,
+            'average_daily_consumption': bucket['consumption'] / num_days if num_days > 0 else 0,
+            'average_monthly_price': bucket['average_price'],
+            'fixed_price_cost': bucket['consumption'] * fixed_price / 100,
+            'price_sketch': PriceSketch(),
+        }
+    hour_sketches = {}
+    if with_sketches:
+        monthly_sketches, hour_sketches = price_sketches(read_db_data(conn, year))
+        for month, sketch in monthly_sketches.items():
+            if month in monthly_data:
+                monthly_data[month]['price_sketch'] = sketch
+
+    fixed_price_total_cost = totals['consumption'] * fixed_price / 100  # Convert to EUR
+    return {
+        'total_consumption': totals['consumption'],
+        'total_cost': totals['cost'],
+        'average_price': totals['average_price'],
+        'monthly_data': monthly_data,
+        'fixed_price_total_cost': fixed_price_total_cost,
+        'savings': fixed_price_total_cost - totals['cost'],
+        'fixed_price': fixed_price,
+        'hour_sketches': hour_sketches
     }
 
 def get_current_spot_price():
-    url = "https://api.porssisahko.net/v1/latest-prices.json"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        now = datetime.now(pytz.timezone('Europe/Helsinki'))
-        for price in data['prices']:
-            # Remove the 'Z' and parse the string
-            start_time = datetime.fromisoformat(price['startDate'].rstrip('Z')).replace(tzinfo=pytz.UTC)
-            end_time = datetime.fromisoformat(price['endDate'].rstrip('Z')).replace(tzinfo=pytz.UTC)
-            # Convert to Helsinki time
-            start_time = start_time.astimezone(pytz.timezone('Europe/Helsinki'))
-            end_time = end_time.astimezone(pytz.timezone('Europe/Helsinki'))
-            if start_time <= now < end_time:
-                return price['price']
-    return None
+    # porssisahko first, Vattenfall if it is down (see sahko/prices.py)
+    prices = timed_import('sahko.prices')
+    return prices.current_price()
 
 def print_current_spot_price(price):
     if price is not None:
@@ -101,9 +264,9 @@ def print_current_spot_price(price):
     else:
         print(f"\n{Colors.RED}Unable to fetch current spot price.{Colors.RESET}")
 
-def print_analysis(analysis):
+def print_analysis(analysis, show_spot_price=True):
     # Get the current time in Finland's timezone (EEST/EET)
-    finland_tz = pytz.timezone('Europe/Helsinki')
+    finland_tz = ZoneInfo('Europe/Helsinki')
     current_time = datetime.now(finland_tz)
 
     # Determine if it's EEST (UTC+3) or EET (UTC+2)
@@ -120,8 +283,9 @@ def print_analysis(analysis):
     print(f"{Colors.PURPLE}Analysis generated on: {Colors.YELLOW}{current_time_str}{Colors.RESET}")
 
     # Fetch and print current spot price
-    current_price = get_current_spot_price()
-    print_current_spot_price(current_price)
+    if show_spot_price:
+        current_price = get_current_spot_price()
+        print_current_spot_price(current_price)
 
     print(f"\n{Colors.CYAN}{'=' * 80}{Colors.RESET}")
     print(f"{Colors.YELLOW}Annual Summary{Colors.RESET}")
@@ -134,6 +298,10 @@ def print_analysis(analysis):
     average_year_price = analysis['total_cost'] / (analysis['total_consumption'] / 100)
     print(f"{Colors.CYAN}Average Year Actual Price: {Colors.YELLOW}{average_year_price:.2f} snt/kWh{Colors.RESET}")
     print(f"{Colors.CYAN}Spot price average for the whole year: {Colors.YELLOW}{analysis['average_price']:.2f} snt/kWh{Colors.RESET}")
+    print_monthly_analysis(analysis)
+    print_final_analysis(analysis)
+
+def print_monthly_analysis(analysis):
     print(f"\n{Colors.PURPLE}Monthly analysis:{Colors.RESET}")
     fixed_price = analysis['fixed_price']  # Use the fixed price from the analysis results
 
@@ -168,6 +336,7 @@ def print_analysis(analysis):
 
         print(f"{month_str:<{month_width}} {price_str:<{price_width}} {consumption_str:<{consumption_width}} {cost_str:<{cost_width}} {avg_cost_str:<{avg_cost_width}}")
 
+def print_final_analysis(analysis):
     print(f"\n{Colors.CYAN}Total consumption: {Colors.YELLOW}{analysis['total_consumption']:.2f} kWh{Colors.RESET}")
     print(f"{Colors.CYAN}Total cost with spot pricing: {Colors.YELLOW}{analysis['total_cost']:.2f} EUR{Colors.RESET}")
     print(f"{Colors.CYAN}Total cost with {analysis['fixed_price']} snt/kWh fixed price: {Colors.YELLOW}{analysis['fixed_price_total_cost']:.2f} EUR{Colors.RESET}")
@@ -187,12 +356,40 @@ def print_analysis(analysis):
     if percent_diff > 0:
         print(f"{Colors.WHITE}This is equivalent to a {Colors.GREEN}{abs(percent_diff):.2f}% decrease{Colors.WHITE} in your total electricity cost.{Colors.RESET}")
     else:
-        print(f"{Colors.WHITE}This is equivalent to a {Colors.RED}{abs(percent_diff)::.2f}% increase{Colors.WHITE} in your total electricity cost.{Colors.RESET}")
+        print(f"{Colors.WHITE}This is equivalent to a {Colors.RED}{abs(percent_diff):.2f}% increase{Colors.WHITE} in your total electricity cost.{Colors.RESET}")
 
     # Update the conclusion line
     print(f"\n{Colors.YELLOW}Conclusion: {Colors.WHITE}The {'spot' if analysis['savings'] > 0 else 'fixed'} price contract was more beneficial for you this year.{Colors.RESET}")
 
-def plot_monthly_analysis(analysis):
+def print_price_distribution(analysis, above):
+    # Percentiles come from the mergeable price sketches, so the year row is
+    # simply the monthly sketches merged
+    print(f"\n{Colors.CYAN}{'=' * 80}{Colors.RESET}")
+    print(f"{Colors.YELLOW}Spot Price Distribution (snt/kWh){Colors.RESET}")
+    print(f"{Colors.CYAN}{'=' * 80}{Colors.RESET}")
+    header = f"{'P10':>8} {'P50':>8} {'P90':>8} {'kWh P50':>9} {f'kWh > {above:g}':>11}"
+
+    def row(label, sketch):
+        stats = sketch.summary(above)
+        if stats['p50'] is None:
+            return f"{Colors.BLUE}{label:<10}{Colors.RESET} {'-':>8}"
+        return (f"{Colors.BLUE}{label:<10}{Colors.RESET} {Colors.YELLOW}{stats['p10']:>8.2f} {stats['p50']:>8.2f} "
+                f"{stats['p90']:>8.2f} {stats['kwh_p50']:>9.2f} {stats['share_above']:>10.1%}{Colors.RESET}")
+
+    print(f"{'Month':<10} {header}")
+    sketches = [data['price_sketch'] for data in analysis['monthly_data'].values()]
+    for month, data in analysis['monthly_data'].items():
+        print(row(month, data['price_sketch']))
+    print(row('Year', PriceSketch.merged(sketches)))
+
+    print(f"\n{'Hour':<10} {header}")
+    if not analysis['hour_sketches']:
+        print("Not available: the rollups keep hours of the day across all years (use --source csv)")
+    for hour, sketch in analysis['hour_sketches'].items():
+        print(row(f"{hour}:00", sketch))
+
+def plot_monthly_analysis(analysis, output=None):
+    plt = timed_import('matplotlib.pyplot')
     fixed_price = analysis['fixed_price']
     monthly_summary = []
 
@@ -248,12 +445,77 @@ def plot_monthly_analysis(analysis):
 
     # Adjust layout and display the plot
     plt.tight_layout()
-    plt.show()
+    if output:
+        plt.savefig(output)
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Spot vs fixed price analysis with monthly averages')
+    parser.add_argument('--source', choices=['auto', 'csv', 'rollups', 'matrix', 'db', 'iceberg'], default='auto',
+                        help='Read the combined CSV, the precomputed rollups, the day matrices, aggregate in Postgres '
+                             'or scan the Iceberg table (auto: rollups if present and holding no year but YEAR; '
+                             'matrix, db and iceberg read the YEAR rows)')
+    parser.add_argument('--meter', default=DEFAULT_METER, help='Meter of the day matrices (default: combined)')
+    subparsers = parser.add_subparsers(dest='command')
+    summary_parser = subparsers.add_parser('summary', help='Print the annual summary and monthly breakdown')
+    summary_parser.add_argument('--no-spot-price', action='store_true', help='Do not fetch the current spot price')
+    subparsers.add_parser('monthly', help='Print the monthly breakdown only')
+    distribution_parser = subparsers.add_parser('distribution', help='Print spot price percentiles per month and hour of day')
+    distribution_parser.add_argument('--above', type=float, default=float(os.getenv('PRICE_THRESHOLD', 15.0)),
+                                     help='Report the share of kWh bought above this price (snt/kWh, default: PRICE_THRESHOLD or 15)')
+    plot_parser = subparsers.add_parser('plot', help='Plot monthly savings, costs and average daily consumption')
+    plot_parser.add_argument('--output', help='Save the figure to this file instead of showing it')
+    args = parser.parse_args(argv)
+
+    with stage(f"analysis_{args.command}" if args.command else "analysis"):
+        year = os.getenv('YEAR')
+        store = None
+        if args.source == 'rollups' or (args.source == 'auto' and os.path.exists(DEFAULT_ROLLUP_FILE)):
+            store = RollupStore.load()
+            if args.source == 'auto' and year and set(store.years()) - {year}:
+                # The hour-of-day buckets mix in the other years; read the YEAR rows instead
+                store = None
+        if args.source == 'db':
+            conn = db.connect()
+            try:
+                analysis = analyze_db(conn, os.getenv('YEAR'), with_sketches=args.command == 'distribution')
+            finally:
+                conn.close()
+            add_rows(len(analysis['monthly_data']))
+        elif args.source == 'iceberg':
+            data = read_iceberg_data(os.getenv('YEAR'))
+            add_rows(len(data))
+            analysis = analyze_data(data)
+        elif args.source == 'matrix':
+            matrix = DayMatrix.open(args.meter, DEFAULT_MATRIX_DIR)
+            analysis = analyze_matrix(matrix, os.getenv('YEAR'))
+            add_rows(len(analysis['monthly_data']))
+        elif store is not None:
+            analysis = analyze_rollups(store, year)
+            add_rows(len(analysis['monthly_data']))
+        else:
+            data = read_combined_data()
+            add_rows(len(data))
+            analysis = analyze_data(data)
+
+        if args.command == 'summary':
+            print_analysis(analysis, show_spot_price=not args.no_spot_price)
+        elif args.command == 'monthly':
+            print_monthly_analysis(analysis)
+        elif args.command == 'distribution':
+            print_price_distribution(analysis, args.above)
+        elif args.command == 'plot':
+            plot_monthly_analysis(analysis, args.output)
+
+    # Without a subcommand keep the original behaviour: report, then plot
+    if args.command is None:
+        print_analysis(analysis)
+        plot_monthly_analysis(analysis)
 
 
 # Main execution
 if __name__ == "__main__":
-    data = read_combined_data()
-    analysis = analyze_data(data)
-    print_analysis(analysis)
-    plot_monthly_analysis(analysis)
\ No newline at end of file
+    main()
\ No newline at end of file
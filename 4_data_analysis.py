@@ -1,16 +1,24 @@
-import csv
+import argparse
 from datetime import datetime, timedelta
-from collections import defaultdict
-import matplotlib.pyplot as plt
-import requests
-import pytz
+from zoneinfo import ZoneInfo
 import os
 from dotenv import load_dotenv
-from dateutil.parser import isoparse  # Add this import
+from sahko.instrumentation import stage, add_rows, add_bytes_read, timed_import
+from sahko.rollups import RollupStore, DEFAULT_ROLLUP_FILE, average_price
+from sahko.risk import SEASON_WINDOW, block_costs, load_price_history, risk_summary, simulate
+from sahko.series import HourlySeries
+from sahko.tariff import FIXED_PRICE, SPOT_MARGIN, bill, load_tariffs
+from sahko import db
+
+# matplotlib and requests are imported only by the code paths that need
+# them, so text-only reports start without paying for them.
 
 # Load environment variables
 load_dotenv()
 
+# Length of one combined row; 0.25 when RESOLUTION_MINUTES=15
+INTERVAL_HOURS = int(os.getenv('RESOLUTION_MINUTES', 60)) / 60
+
 # ANSI color codes
 class Colors:
     RESET = '\033[0m'
@@ -25,31 +33,24 @@ class Colors:
 
 def read_combined_data(filename='combined_data.csv'):
     filepath = os.path.join('processed', filename)
-    data = []
-    with open(filepath, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            timestamp = isoparse(row['timestamp'])
-            data.append({
-                'date': timestamp.date(),
-                'hour': timestamp.hour,
-                'consumption': float(row['consumption_kWh']),
-                'price': float(row['price_cents_per_kWh']),
-                'cost': float(row['cost_euros'])
-            })
-    return data
-
-def analyze_data(data):
-    total_consumption = sum(row['consumption'] for row in data)
-    total_cost = sum(row['cost'] for row in data)
-    average_price = sum(row['price'] for row in data) / len(data)
-
-    monthly_data = defaultdict(lambda: {'consumption': 0, 'cost': 0, 'hours': 0})
-    for row in data:
-        month = row['date'].strftime('%Y-%m')
-        monthly_data[month]['consumption'] += row['consumption']
-        monthly_data[month]['cost'] += row['cost']
-        monthly_data[month]['hours'] += 1
+    add_bytes_read(os.path.getsize(filepath))
+    return HourlySeries.read_csv(filepath)
+
+def read_iceberg_data(year=None):
+    # Same series as read_combined_data, scanned directly from the Iceberg table
+    from sahko import iceberg  # pyiceberg is only needed for this source
+    return HourlySeries.from_records(iceberg.iter_rows(year))
+
+def analyze_data(series):
+    total_consumption = float(series.consumption.sum())
+    total_cost = float(series.cost.sum())
+    average_price = float(series.price.sum()) / len(series)
+
+    monthly_data = {}
+    months, sums = series.aggregate('month')
+    for month, consumption, cost, hours in zip(months.astype(str).tolist(), sums['consumption'].tolist(),
+                                               sums['cost'].tolist(), sums['hours'].tolist()):
+        monthly_data[month] = {'consumption': consumption, 'cost': cost, 'hours': hours}
 
     fixed_price = float(os.getenv('FIXED_PRICE', 8.5))  # Default to 8.5 if not set
     fixed_price_total_cost = total_consumption * fixed_price / 100  # Convert to EUR
@@ -69,22 +70,75 @@ def analyze_data(data):
         'fixed_price': fixed_price  # Add this line to include the fixed price in the analysis results
     }
 
+def analyze_rollups(store, year=None):
+    # Same result as analyze_data, read from the precomputed monthly rollups
+    # of one year (the store keeps every year combined so far)
+    totals = store.totals(year)
+    fixed_price = float(os.getenv('FIXED_PRICE', 8.5))  # Default to 8.5 if not set
+
+    monthly_data = {}
+    for month, bucket in store.months(year):
+        monthly_data[month] = {
+            'consumption': bucket['consumption'],
+            'cost': bucket['cost'],
+            'hours': bucket['hours'],
+            'fixed_price_cost': bucket['consumption'] * fixed_price / 100,
+        }
+
+    fixed_price_total_cost = totals['consumption'] * fixed_price / 100  # Convert to EUR
+    return {
+        'total_consumption': totals['consumption'],
+        'total_cost': totals['cost'],
+        'average_price': average_price(totals),
+        'monthly_data': monthly_data,
+        'fixed_price_total_cost': fixed_price_total_cost,
+        'savings': fixed_price_total_cost - totals['cost'],
+        'fixed_price': fixed_price
+    }
+
+def analyze_db(conn, year=None):
+    # Same result as analyze_data, with the sums computed by Postgres
+    monthly, totals = db.aggregates(conn, year)
+    if totals is None:
+        raise ValueError(f"No rows in the database for year {year}")
+    fixed_price = float(os.getenv('FIXED_PRICE', 8.5))  # Default to 8.5 if not set
+
+    monthly_data = {}
+    for month, bucket in monthly.items():
+        monthly_data[month] = {
+            'consumption': bucket['consumption'],
+            'cost': bucket['cost'],
+            'hours': bucket['row_count'] * INTERVAL_HOURS,
+            'fixed_price_cost': bucket['consumption'] * fixed_price / 100,
+        }
+
+    fixed_price_total_cost = totals['consumption'] * fixed_price / 100  # Convert to EUR
+    return {
+        'total_consumption': totals['consumption'],
+        'total_cost': totals['cost'],
+        'average_price': totals['average_price'],
+        'monthly_data': monthly_data,
+        'fixed_price_total_cost': fixed_price_total_cost,
+        'savings': fixed_price_total_cost - totals['cost'],
+        'fixed_price': fixed_price
+    }
+
+def read_series(source):
+    # Rows for the reports that need them; the rollups only hold aggregates
+    if source == 'db':
+        conn = db.connect()
+        try:
+            return HourlySeries.from_records(db.iter_rows(conn, os.getenv('YEAR')))
+        finally:
+            conn.close()
+    if source == 'iceberg':
+        return read_iceberg_data(os.getenv('YEAR'))
+    return read_combined_data()
+
 def get_current_spot_price():
-    url = "https://api.porssisahko.net/v1/latest-prices.json"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        now = datetime.now(pytz.timezone('Europe/Helsinki'))
-        for price in data['prices']:
-            # Remove the 'Z' and parse the string
-            start_time = datetime.fromisoformat(price['startDate'].rstrip('Z')).replace(tzinfo=pytz.UTC)
-            end_time = datetime.fromisoformat(price['endDate'].rstrip('Z')).replace(tzinfo=pytz.UTC)
-            # Convert to Helsinki time
-            start_time = start_time.astimezone(pytz.timezone('Europe/Helsinki'))
-            end_time = end_time.astimezone(pytz.timezone('Europe/Helsinki'))
-            if start_time <= now < end_time:
-                return price['price']
-    return None
+    # porssisahko first, Vattenfall if it is down (see sahko/prices.py)
+    prices = timed_import('sahko.prices')
+    return prices.current_price()
 
 def print_current_spot_price(price):
     if price is not None:
@@ -92,9 +146,9 @@ def print_current_spot_price(price):
     else:
         print(f"\n{Colors.RED}Unable to fetch current spot price.{Colors.RESET}")
 
-def print_analysis(analysis):
+def print_analysis(analysis, show_spot_price=True):
     # Get the current time in Finland's timezone (EEST/EET)
-    finland_tz = pytz.timezone('Europe/Helsinki')
+    finland_tz = ZoneInfo('Europe/Helsinki')
     current_time = datetime.now(finland_tz)
     
     # Determine if it's EEST (UTC+3) or EET (UTC+2)
@@ -111,8 +165,9 @@ def print_analysis(analysis):
     print(f"{Colors.PURPLE}Analysis generated on: {Colors.YELLOW}{current_time_str}{Colors.RESET}")
 
     # Fetch and print current spot price
-    current_price = get_current_spot_price()
-    print_current_spot_price(current_price)
+    if show_spot_price:
+        current_price = get_current_spot_price()
+        print_current_spot_price(current_price)
 
     print(f"\n{Colors.CYAN}{'=' * 80}{Colors.RESET}")
     print(f"{Colors.YELLOW}Annual Summary{Colors.RESET}")
@@ -125,6 +180,10 @@ def print_analysis(analysis):
     average_year_price = analysis['total_cost'] / (analysis['total_consumption'] / 100)
     print(f"{Colors.CYAN}Average Year Actual Price: {Colors.YELLOW}{average_year_price:.2f} snt/kWh{Colors.RESET}")
     print(f"{Colors.CYAN}Spot price average for the whole year: {Colors.YELLOW}{analysis['average_price']:.2f} snt/kWh{Colors.RESET}")
+    print_monthly_analysis(analysis)
+    print_final_analysis(analysis)
+
+def print_monthly_analysis(analysis):
     print(f"\n{Colors.PURPLE}Monthly analysis:{Colors.RESET}")
     fixed_price = analysis['fixed_price']  # Use the fixed price from the analysis results
     
@@ -151,6 +210,7 @@ def print_analysis(analysis):
         
         print(f"{month_str:<{month_width}} {price_str:<{price_width}} {consumption_str:<{consumption_width}} {cost_str:<{cost_width}}")
 
+def print_final_analysis(analysis):
     print(f"\n{Colors.CYAN}Total consumption: {Colors.YELLOW}{analysis['total_consumption']:.2f} kWh{Colors.RESET}")
     print(f"{Colors.CYAN}Total cost with spot pricing: {Colors.YELLOW}{analysis['total_cost']:.2f} EUR{Colors.RESET}")
     print(f"{Colors.CYAN}Total cost with {analysis['fixed_price']} snt/kWh fixed price: {Colors.YELLOW}{analysis['fixed_price_total_cost']:.2f} EUR{Colors.RESET}")
@@ -175,7 +235,61 @@ def print_analysis(analysis):
     # Update the conclusion line
     print(f"\n{Colors.YELLOW}Conclusion: {Colors.WHITE}The {'spot' if analysis['savings'] > 0 else 'fixed'} price contract was more beneficial for you this year.{Colors.RESET}")
 
-def plot_monthly_analysis(analysis):
+def print_bills(series, tariffs, names):
+    # Full monthly bill per tariff, then the tariffs side by side
+    totals = {}
+    for name in names:
+        months, sums = bill(series, tariffs[name])
+        components = [component for component in sums if component != 'total']
+        totals[name] = float(sums['total'].sum())
+
+        print(f"\n{Colors.CYAN}{'=' * 80}{Colors.RESET}")
+        print(f"{Colors.YELLOW}Bill with tariff '{name}' (EUR){Colors.RESET}")
+        print(f"{Colors.CYAN}{'=' * 80}{Colors.RESET}")
+        print(f"{'Month':<10}" + ''.join(f"{component:>16}" for component in components) + f"{'Total':>12}")
+        for index, month in enumerate(months):
+            values = ''.join(f"{sums[component][index]:>16.2f}" for component in components)
+            print(f"{Colors.BLUE}{month:<10}{Colors.RESET}{values}{Colors.YELLOW}{sums['total'][index]:>12.2f}{Colors.RESET}")
+        values = ''.join(f"{sums[component].sum():>16.2f}" for component in components)
+        print(f"{'Total':<10}{values}{Colors.YELLOW}{totals[name]:>12.2f}{Colors.RESET}")
+
+    consumption = float(series.consumption.sum())
+    print(f"\n{Colors.PURPLE}Tariff comparison ({consumption:.2f} kWh):{Colors.RESET}")
+    cheapest = min(totals.values())
+    for name, total in sorted(totals.items(), key=lambda item: item[1]):
+        difference = f"{Colors.GREEN}cheapest{Colors.RESET}" if total == cheapest else f"{Colors.RED}+{total - cheapest:.2f} EUR{Colors.RESET}"
+        average = total / consumption * 100 if consumption else 0.0
+        print(f"{Colors.BLUE}{name:<20}{Colors.RESET} {Colors.YELLOW}{total:>10.2f} EUR{Colors.RESET} "
+              f"({average:.2f} snt/kWh all-in)  {difference}")
+
+def print_risk(summary, consumption, block):
+    # Scenario distribution of the spot cost against the fixed price offer
+    print(f"\n{Colors.CYAN}{'=' * 80}{Colors.RESET}")
+    print(f"{Colors.YELLOW}Spot vs Fixed Price Risk ({summary['scenarios']} scenarios, resampled {block}s){Colors.RESET}")
+    print(f"{Colors.CYAN}{'=' * 80}{Colors.RESET}")
+    print(f"{Colors.CYAN}Consumption: {Colors.YELLOW}{consumption:.2f} kWh{Colors.RESET}")
+    print(f"{Colors.CYAN}Fixed price cost ({FIXED_PRICE} snt/kWh): {Colors.YELLOW}{summary['fixed_cost']:.2f} EUR{Colors.RESET}")
+    print(f"{Colors.CYAN}Spot cost, mean: {Colors.YELLOW}{summary['mean']:.2f} EUR{Colors.RESET}")
+    print(f"{Colors.CYAN}Spot cost, median (5% - 95%): {Colors.YELLOW}{summary['median']:.2f} EUR "
+          f"({summary['p5']:.2f} - {summary['p95']:.2f}){Colors.RESET}")
+    confidence = summary['confidence'] * 100
+    print(f"{Colors.CYAN}Value at risk ({confidence:g}%): {Colors.YELLOW}{summary['var']:.2f} EUR{Colors.RESET}")
+    print(f"{Colors.CYAN}Conditional value at risk ({confidence:g}%): {Colors.YELLOW}{summary['cvar']:.2f} EUR{Colors.RESET}")
+
+    probability = summary['probability_spot_cheaper'] * 100
+    color = Colors.GREEN if probability >= 50 else Colors.RED
+    print(f"\n{Colors.WHITE}Probability that spot is cheaper: {color}{probability:.1f}%{Colors.RESET}")
+    if summary['expected_savings'] > 0:
+        print(f"{Colors.WHITE}Expected savings with spot: {Colors.GREEN}{summary['expected_savings']:.2f} EUR{Colors.RESET}")
+    else:
+        print(f"{Colors.WHITE}Expected extra cost with spot: {Colors.RED}{-summary['expected_savings']:.2f} EUR{Colors.RESET}")
+    extra = summary['cvar'] - summary['fixed_cost']
+    if extra > 0:
+        print(f"{Colors.GRAY}In the worst {100 - confidence:g}% of scenarios spot costs on average "
+              f"{extra:.2f} EUR more than the fixed price.{Colors.RESET}")
+
+def plot_monthly_analysis(analysis, output=None):
+    plt = timed_import('matplotlib.pyplot')
     fixed_price = analysis['fixed_price']  # Use the fixed price from the analysis results
     monthly_summary = []
     
@@ -221,12 +335,109 @@ def plot_monthly_analysis(analysis):
 
     # Adjust layout and display the plot
     plt.tight_layout()
-    plt.show()
+    if output:
+        plt.savefig(output)
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Spot vs fixed price analysis of the combined data')
+    parser.add_argument('--source', choices=['auto', 'csv', 'rollups', 'db', 'iceberg'], default='auto',
+                        help='Read the combined CSV, the precomputed rollups, aggregate in Postgres or scan the '
+                             'Iceberg table (auto: rollups if present and holding no year but YEAR; db and iceberg read '
+                             'the YEAR rows)')
+    subparsers = parser.add_subparsers(dest='command')
+    summary_parser = subparsers.add_parser('summary', help='Print the annual summary and monthly breakdown')
+    summary_parser.add_argument('--no-spot-price', action='store_true', help='Do not fetch the current spot price')
+    subparsers.add_parser('monthly', help='Print the monthly breakdown only')
+    plot_parser = subparsers.add_parser('plot', help='Plot the monthly savings and costs')
+    plot_parser.add_argument('--output', help='Save the figure to this file instead of showing it')
+    bill_parser = subparsers.add_parser('bill', help='Full bill (energy, transfer, tax, base fees) under each tariff')
+    bill_parser.add_argument('--tariff', nargs='+',
+                             help='Tariffs to compute (default: all defaults plus those in TARIFF_FILE)')
+    risk_parser = subparsers.add_parser('risk', help='Bootstrap the spot cost over historical price weeks or months')
+    risk_parser.add_argument('--scenarios', type=int, default=100000, help='Number of scenarios (default: 100000)')
+    risk_parser.add_argument('--block', choices=['week', 'month'], default='week',
+                             help='Resample whole weeks or calendar months of price history (default: week)')
+    risk_parser.add_argument('--window', type=int, default=SEASON_WINDOW,
+                             help='Draw weeks at most this many weeks of the year away (default: 2)')
+    risk_parser.add_argument('--confidence', type=float, default=0.95, help='VaR / CVaR level (default: 0.95)')
+    risk_parser.add_argument('--seed', type=int, help='Random seed for reproducible scenarios')
+    risk_parser.add_argument('--workers', type=int, help='Worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'risk':
+        with stage("analysis_risk"):
+            series = read_series(args.source)
+            add_rows(len(series))
+            price_epoch, prices = load_price_history(interval_hours=series.interval_hours)
+            costs, candidates = block_costs(series.epoch, series.consumption, price_epoch, prices,
+                                            args.block, args.window, series.interval_hours)
+            consumption = float(series.consumption.sum())
+            try:
+                spot_costs = simulate(costs, candidates, args.scenarios, args.seed, args.workers)
+            except ValueError as e:
+                parser.error(str(e))
+            spot_costs += SPOT_MARGIN * consumption / 100
+            summary = risk_summary(spot_costs, consumption * FIXED_PRICE / 100, args.confidence)
+            print_risk(summary, consumption, args.block)
+        return
+
+    if args.command == 'bill':
+        # Needs the rows, so read the CSV (or Postgres / Iceberg) rather than the rollups
+        tariffs = load_tariffs()
+        names = args.tariff or list(tariffs)
+        unknown = [name for name in names if name not in tariffs]
+        if unknown:
+            parser.error(f"Unknown tariff(s): {', '.join(unknown)}; known: {', '.join(tariffs)}")
+        with stage("analysis_bill"):
+            series = read_series(args.source)
+            add_rows(len(series))
+            print_bills(series, tariffs, names)
+        return
+
+    with stage(f"analysis_{args.command}" if args.command else "analysis"):
+        year = os.getenv('YEAR')
+        store = None
+        if args.source == 'rollups' or (args.source == 'auto' and os.path.exists(DEFAULT_ROLLUP_FILE)):
+            store = RollupStore.load()
+            if args.source == 'auto' and year and set(store.years()) - {year}:
+                # The hour-of-day buckets mix in the other years; read the YEAR rows instead
+                store = None
+        if args.source == 'db':
+            conn = db.connect()
+            try:
+                analysis = analyze_db(conn, os.getenv('YEAR'))
+            finally:
+                conn.close()
+            add_rows(len(analysis['monthly_data']))
+        elif args.source == 'iceberg':
+            data = read_iceberg_data(os.getenv('YEAR'))
+            add_rows(len(data))
+            analysis = analyze_data(data)
+        elif store is not None:
+            analysis = analyze_rollups(store, year)
+            add_rows(len(analysis['monthly_data']))
+        else:
+            data = read_combined_data()
+            add_rows(len(data))
+            analysis = analyze_data(data)
+
+        if args.command == 'summary':
+            print_analysis(analysis, show_spot_price=not args.no_spot_price)
+        elif args.command == 'monthly':
+            print_monthly_analysis(analysis)
+        elif args.command == 'plot':
+            plot_monthly_analysis(analysis, args.output)
+
+    # Without a subcommand keep the original behaviour: report, then plot
+    if args.command is None:
+        print_analysis(analysis)
+        plot_monthly_analysis(analysis)
 
 
 # Main execution
 if __name__ == "__main__":
-    data = read_combined_data()
-    analysis = analyze_data(data)
-    print_analysis(analysis)
-    plot_monthly_analysis(analysis)
+    main()
@@ -1,12 +1,14 @@
 import os
 from dotenv import load_dotenv
 import shutil
-import pandas as pd
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 import argparse
 import logging
-import numpy as np
+from sahko.dayhash import changed_days, day_hashes, select_days
+from sahko.db import DB_CONFIG
+from sahko.series import HourlySeries
 
 # Configure logging
 logging.basicConfig(
@@ -24,13 +26,19 @@ load_dotenv()
 # Configuration
 SOURCE_DIR = "processed"
 DEST_DIR = "moved_to_db"
-DB_CONFIG = {
-    "dbname": os.getenv('DATABASE'),
-    "user": os.getenv('DATABASE_USER'),
-    "password": os.getenv('DATABASE_PASSWORD'),
-    "host": os.getenv('DATABASE_HOST'),
-    "port": "5432"
-}
+INSERT_PAGE_SIZE = 1000
+
+# Timestamps are sent as epoch seconds and converted by Postgres
+INSERT_QUERY = """
+    INSERT INTO consumption_data
+    (timestamp, consumption_kWh, price_cents_per_kWh, cost_euros)
+    VALUES %s
+    ON CONFLICT (timestamp) DO UPDATE SET
+        consumption_kWh = EXCLUDED.consumption_kWh,
+        price_cents_per_kWh = EXCLUDED.price_cents_per_kWh,
+        cost_euros = EXCLUDED.cost_euros
+"""
+INSERT_TEMPLATE = "(to_timestamp(%s), %s, %s, %s)"
 
 def delete_database():
     postgres_config = DB_CONFIG.copy()
@@ -106,6 +114,17 @@ def init_database():
         );
         """
         cur.execute(create_table_query)
+
+        # Content hash of each loaded day, so incremental loads can skip
+        # the days that have not changed (see sahko/dayhash.py)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS consumption_day_hashes (
+            day DATE PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            loaded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        );
+        """)
         conn.commit()
         
         cur.close()
@@ -120,8 +139,10 @@ def drop_table():
         cur = conn.cursor()
         
         cur.execute("DROP TABLE IF EXISTS consumption_data")
+        # The hashes describe the dropped rows; keeping them would make the next incremental load skip everything
+        cur.execute("DROP TABLE IF EXISTS consumption_day_hashes")
         conn.commit()
-        logging.info("Table 'consumption_data' has been dropped")
+        logging.info("Tables 'consumption_data' and 'consumption_day_hashes' have been dropped")
         
         cur.close()
         conn.close()
@@ -129,12 +150,57 @@ def drop_table():
         logging.error(f"Error dropping table: {e}", exc_info=True)
         raise
 
-def main():
+def stored_day_hashes(cur, first_day, last_day):
+    cur.execute(
+        "SELECT day, content_hash FROM consumption_day_hashes WHERE day BETWEEN %s AND %s",
+        (first_day, last_day)
+    )
+    return {day.isoformat(): content_hash for day, content_hash in cur.fetchall()}
+
+def save_day_hashes(cur, hashes, row_counts):
+    execute_values(cur, """
+        INSERT INTO consumption_day_hashes (day, content_hash, row_count)
+        VALUES %s
+        ON CONFLICT (day) DO UPDATE SET
+            content_hash = EXCLUDED.content_hash,
+            row_count = EXCLUDED.row_count,
+            loaded_at = now()
+    """, [(day, content_hash, row_counts[day]) for day, content_hash in hashes.items()])
+
+def load_series(cur, series, incremental=False):
+    """Upsert the rows of ``series``; with ``incremental`` only the days whose hash changed.
+
+    Returns (days, rows) sent.
+    """
+    hashes = day_hashes(series)
+    if not hashes:
+        return 0, 0
+    days = sorted(hashes)
+    if incremental:
+        days = changed_days(hashes, stored_day_hashes(cur, days[0], days[-1]))
+        series = select_days(series, days)
+    if not days:
+        return 0, 0
+
+    execute_values(cur, INSERT_QUERY, zip(series.epoch.tolist(), series.consumption.tolist(),
+                                          series.price.tolist(), series.cost.tolist()),
+                   template=INSERT_TEMPLATE, page_size=INSERT_PAGE_SIZE)
+    day_keys, sums = series.aggregate('day')
+    row_counts = dict(zip(day_keys.astype(str).tolist(), sums['rows'].tolist()))
+    save_day_hashes(cur, {day: hashes[day] for day in days}, row_counts)
+    return len(days), len(series)
+
+def main(argv=None):
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Process consumption data and manage database.')
     parser.add_argument('--delete-db', action='store_true', help='Delete the database and exit')
     parser.add_argument('--drop-table', action='store_true', help='Drop the consumption_data table and exit')
-    args = parser.parse_args()
+    parser.add_argument('--incremental', action='store_true',
+                        help='Send only the days that are new or changed since the last load (compared by content hash)')
+    parser.add_argument('--keep', action='store_true',
+                        help=f'Copy processed files to {DEST_DIR} instead of moving them (the pipeline keeps '
+                             'the combined CSV in place for its next run)')
+    args = parser.parse_args(argv)
 
     if args.delete_db:
         delete_database()
@@ -162,62 +228,21 @@ def main():
                 filepath = os.path.join(SOURCE_DIR, filename)
                 
                 try:
-                    # Read CSV into DataFrame
-                    df = pd.read_csv(filepath)
-                    
-                    # Log DataFrame info before conversion
-                    logging.debug(f"DataFrame dtypes before conversion:\n{df.dtypes}")
-                    
-                    # Convert numerical columns to float
-                    df['consumption_kWh'] = df['consumption_kWh'].astype(float)
-                    df['price_cents_per_kWh'] = df['price_cents_per_kWh'].astype(float)
-                    df['cost_euros'] = df['cost_euros'].astype(float)
-                    
-                    # Convert timestamp column to datetime with UTC
-                    df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
-                    
-                    # Log DataFrame info after conversion
-                    logging.debug(f"DataFrame dtypes after conversion:\n{df.dtypes}")
-                    
-                    # Sample data check
-                    logging.debug(f"First row data:\n{df.iloc[0]}")
-                    logging.debug(f"Data types of first row:\n{df.iloc[0].apply(type)}")
-                    
-                    year = df['timestamp'].dt.year.iloc[0]
-                    
-                    # Delete existing data for the year before inserting new data
-                    #cur.execute(
-                    #    "DELETE FROM consumption_data WHERE EXTRACT(YEAR FROM timestamp) = %s",
-                    #    (year,)
-                    #)
-                    logging.info(f"Deleted existing data for year {year}")
-
-                    # Convert DataFrame to list of tuples with Python native types
-                    data_tuples = [(
-                        row['timestamp'].to_pydatetime(),
-                        float(row['consumption_kWh']),
-                        float(row['price_cents_per_kWh']),
-                        float(row['cost_euros'])
-                    ) for _, row in df.iterrows()]
-
-                    # Modified insert query (specify columns explicitly)
-                    insert_query = """
-                        INSERT INTO consumption_data 
-                        (timestamp, consumption_kWh, price_cents_per_kWh, cost_euros)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (timestamp) DO UPDATE SET
-                            consumption_kWh = EXCLUDED.consumption_kWh,
-                            price_cents_per_kWh = EXCLUDED.price_cents_per_kWh,
-                            cost_euros = EXCLUDED.cost_euros
-                    """
-                    
-                    cur.executemany(insert_query, data_tuples)
+                    series = HourlySeries.read_csv(filepath)
+                    logging.debug(f"Read {len(series)} rows from {filename}")
+
+                    days, rows = load_series(cur, series, incremental=args.incremental)
+                    logging.info(f"Upserted {rows} rows for {days} days from {filename}"
+                                 + (" (changed days only)" if args.incremental else ""))
 
                     # Commit the transaction
                     conn.commit()
 
-                    # Move the processed file
-                    shutil.move(filepath, os.path.join(DEST_DIR, filename))
+                    # Move (or copy) the processed file
+                    if args.keep:
+                        shutil.copy2(filepath, os.path.join(DEST_DIR, filename))
+                    else:
+                        shutil.move(filepath, os.path.join(DEST_DIR, filename))
                     logging.info(f"Successfully processed {filename}")
 
                 except (ValueError, AttributeError) as e:
@@ -1,10 +1,11 @@
 import logging
-from pyhive import hive
 import pandas as pd
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import argparse
+from sahko.changes import ChangeManifest, day_ranges
+from sahko.hive import HiveClient
 
 # Set up logging
 logging.basicConfig(
@@ -12,13 +13,12 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Connections are opened on first use and reused across queries
+hive_client = HiveClient()
+
 def query_hive(query):
-    logging.info(f"Executing query: {query}")
     try:
-        conn = hive.Connection(host='ristoserver', port=10000, database='nyc')
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
+        return hive_client.query(query)
     except Exception as e:
         logging.error(f"Error executing query: {str(e)}")
         raise
@@ -40,6 +40,7 @@ def create_database_and_table(conn):
                 price_cents_per_kWh DOUBLE,
                 cost_euros DOUBLE
             )
+            PARTITIONED BY SPEC (month(ts_time))
             STORED BY ICEBERG
             TBLPROPERTIES (
                 'format-version' = '2',
@@ -95,6 +96,45 @@ def convert_timestamp(ts_str):
     utc_dt = dt.astimezone(pytz.UTC)
     return utc_dt.strftime('%Y-%m-%d %H:%M:%S')
 
+def day_start_utc(day):
+    # Local midnight of a 'YYYY-MM-DD' day as a Hive UTC timestamp
+    local = pytz.timezone('Europe/Helsinki').localize(datetime.fromisoformat(day))
+    return local.astimezone(pytz.UTC).strftime('%Y-%m-%d %H:%M:%S')
+
+def delete_days(conn, days):
+    # Consecutive days go in one DELETE; Iceberg rewrites only the month
+    # partitions the ranges fall in
+    cursor = conn.cursor()
+    try:
+        cursor.execute("USE electricity")
+        for first, last in day_ranges(days):
+            end = (datetime.fromisoformat(last) + timedelta(days=1)).strftime('%Y-%m-%d')
+            logging.info(f"Deleting rows of {first} - {last}")
+            cursor.execute(f"""
+            DELETE FROM consumption
+            WHERE ts_time >= '{day_start_utc(first)}' AND ts_time < '{day_start_utc(end)}'
+            """)
+    except Exception as e:
+        logging.error(f"Error in delete_days: {str(e)}")
+        raise
+    finally:
+        cursor.close()
+
+def upload_changed_days(conn, df):
+    # Replace only the days the combine stage marked as changed
+    manifest = ChangeManifest.load()
+    years = set(df['timestamp'].str[:4])
+    days = [day for day in manifest.pending('iceberg') if day[:4] in years]
+    if not days:
+        logging.info("No changed days to upload")
+        return
+    rows = df[df['timestamp'].str[:10].isin(days)]
+    delete_days(conn, days)
+    insert_data_to_hive(conn, rows)
+    manifest.mark_pushed('iceberg', days)
+    manifest.save()
+    logging.info(f"Replaced {len(days)} changed days ({len(rows)} rows)")
+
 def insert_data_to_hive(conn, df):
     cursor = conn.cursor()
     try:
@@ -126,40 +166,50 @@ def insert_data_to_hive(conn, df):
     finally:
         cursor.close()
 
-if __name__ == "__main__":
+def manage_tables(conn, args):
+    if args.drop_table:
+        drop_table(conn)
+    if args.drop_database:
+        drop_database(conn)
+    if args.upload:
+        # Read local CSV
+        logging.info("Reading local CSV file")
+        data_df = read_local_csv()
+        
+        # Create database and table structure
+        logging.info("Setting up database and table")
+        create_database_and_table(conn)
+        
+        # Insert data
+        if args.changed:
+            upload_changed_days(conn, data_df)
+            return
+        logging.info("Starting data insertion")
+        insert_data_to_hive(conn, data_df)
+        logging.info("Successfully inserted data into Hive table")
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Manage electricity consumption data in Hive/Iceberg')
     parser.add_argument('--drop-table', action='store_true', help='Drop the consumption table')
     parser.add_argument('--drop-database', action='store_true', help='Drop the electricity database')
     parser.add_argument('--upload', action='store_true', help='Upload data from CSV to Hive')
-    args = parser.parse_args()
+    parser.add_argument('--changed', action='store_true',
+                        help='With --upload, replace only the days 3_combine.py found new or changed')
+    args = parser.parse_args(argv)
 
+    # Table management runs before the electricity database may exist
+    admin_client = HiveClient(database='default', pool_size=1)
     try:
-        conn = hive.Connection(host='ristoserver', port=10000)
-
-        if args.drop_table:
-            drop_table(conn)
-        if args.drop_database:
-            drop_database(conn)
-        if args.upload:
-            # Read local CSV
-            logging.info("Reading local CSV file")
-            data_df = read_local_csv()
-            
-            # Create database and table structure
-            logging.info("Setting up database and table")
-            create_database_and_table(conn)
-            
-            # Insert data
-            logging.info("Starting data insertion")
-            insert_data_to_hive(conn, data_df)
-            logging.info("Successfully inserted data into Hive table")
-        
+        with admin_client.connection() as conn:
+            manage_tables(conn, args)
         if not any([args.drop_table, args.drop_database, args.upload]):
             parser.print_help()
-
     except Exception as e:
         logging.error(f"Fatal error: {str(e)}", exc_info=True)
         raise
     finally:
-        conn.close()
+        admin_client.close()
         logging.info("Connection closed")
+
+if __name__ == "__main__":
+    main()
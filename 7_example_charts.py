@@ -1,39 +1,96 @@
 import logging
-from pyhive import hive
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime, timedelta
 import argparse
+from sahko.daymatrix import DayMatrix
+from sahko.hive import HiveClient
+from sahko.rendering import density, plot_line
+from sahko.rollups import RollupStore
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def get_data_from_hive(days=30):
-    """Fetch recent data from Hive"""
-    try:
-        conn = hive.Connection(host='ristoserver', port=10000, database='electricity')
-        query = f"""
-        SELECT *
+# One query per chart input. Daily and hourly sums are computed in Hive, so
+# only the price chart transfers individual rows.
+HIVE_QUERIES = {
+    'daily': """
+        SELECT to_date(ts_time) AS ts_time, SUM(consumption_kwh) AS consumption_kwh
+        FROM consumption
+        WHERE ts_time >= date_sub(current_timestamp(), {days})
+        GROUP BY to_date(ts_time)
+        ORDER BY ts_time
+        """,
+    'hourly': """
+        SELECT date_format(ts_time, 'yyyy-MM-dd HH:00:00') AS ts_time, SUM(consumption_kwh) AS consumption_kwh
+        FROM consumption
+        WHERE ts_time >= date_sub(current_timestamp(), {days})
+        GROUP BY date_format(ts_time, 'yyyy-MM-dd HH:00:00')
+        ORDER BY ts_time
+        """,
+    'price': """
+        SELECT ts_time, price_cents_per_kwh, consumption_kwh
         FROM consumption
         WHERE ts_time >= date_sub(current_timestamp(), {days})
         ORDER BY ts_time
-        """
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
+        """,
+}
+
+# Query each chart is drawn from (the heatmap shares the hourly sums)
+CHART_INPUTS = {'daily': 'daily', 'hourly': 'hourly', 'price': 'price', 'heatmap': 'hourly'}
+
+def get_chart_data_from_hive(charts, days=30):
+    """Fetch the inputs of the given charts from Hive, running the queries concurrently"""
+    names = sorted({CHART_INPUTS[chart] for chart in charts})
+    try:
+        with HiveClient() as client:
+            return client.query_many({name: HIVE_QUERIES[name].format(days=days) for name in names})
     except Exception as e:
         logging.error(f"Error fetching data: {str(e)}")
         raise
 
+def get_chart_data_from_iceberg(charts, days=30):
+    """Build the chart inputs from a direct scan of the Iceberg table.
+
+    Only the needed columns of the files overlapping the date range are read,
+    and the hourly sums are accumulated one Arrow batch at a time.
+    """
+    from sahko.iceberg import scan_batches  # pyiceberg is only needed for this source
+    names = {CHART_INPUTS[chart] for chart in charts}
+    columns = ['ts_time', 'consumption_kwh']
+    if 'price' in names:
+        columns.append('price_cents_per_kwh')
+    # Same window as date_sub(current_timestamp(), days) in the Hive queries
+    start = datetime.combine(datetime.utcnow().date() - timedelta(days=days), datetime.min.time())
+
+    hourly_parts = []
+    price_parts = []
+    for batch in scan_batches(start, columns=columns):
+        df = batch.to_pandas()
+        hourly_parts.append(df.groupby(pd.to_datetime(df['ts_time']).dt.floor('h'))['consumption_kwh'].sum())
+        if 'price' in names:
+            price_parts.append(df[['ts_time', 'price_cents_per_kwh', 'consumption_kwh']])
+
+    hourly = pd.concat(hourly_parts).groupby(level=0).sum() if hourly_parts else pd.Series(dtype=float)
+    hourly = hourly.rename_axis('ts_time').rename('consumption_kwh').reset_index()
+    frames = {'daily': hourly, 'hourly': hourly}
+    if 'price' in names:
+        frames['price'] = (pd.concat(price_parts).sort_values('ts_time') if price_parts
+                           else pd.DataFrame(columns=['ts_time', 'price_cents_per_kwh', 'consumption_kwh']))
+    return {name: frames[name] for name in names}
+
 def plot_daily_consumption(df):
     """Create daily consumption chart"""
     plt.figure(figsize=(12, 6))
     daily_consumption = df.groupby(pd.to_datetime(df['ts_time']).dt.date)['consumption_kwh'].sum()
-    
-    plt.plot(daily_consumption.index, daily_consumption.values, marker='o')
+
+    # Markers only while the days can be told apart; long ranges are downsampled
+    marker = 'o' if len(daily_consumption) <= 90 else None
+    plot_line(plt.gca(), daily_consumption.index, daily_consumption.values, marker=marker)
     plt.title('Daily Electricity Consumption')
     plt.xlabel('Date')
     plt.ylabel('Consumption (kWh)')
@@ -43,12 +100,26 @@ def plot_daily_consumption(df):
     plt.savefig('charts/daily_consumption.png')
     plt.close()
 
+def hourly_consumption(df):
+    """Sum rows into consumption per clock hour (rows may be 15-minute intervals)"""
+    hours = pd.to_datetime(df['ts_time']).dt.floor('h')
+    hourly = df.groupby(hours)['consumption_kwh'].sum()
+    return hourly.rename_axis('ts_hour').reset_index()
+
 def plot_hourly_patterns(df):
     """Create hourly consumption patterns chart"""
+    hourly = hourly_consumption(df)
+    hourly_avg = hourly.groupby(hourly['ts_hour'].dt.hour)['consumption_kwh'].mean()
+    draw_hourly_patterns(hourly_avg)
+
+def hourly_patterns_from_rollups(store):
+    """Average consumption per hour of day from the rollup store"""
+    buckets = store.level('hour_of_day')
+    return pd.Series({int(hour): bucket['consumption'] / bucket['hours']
+                      for hour, bucket in sorted(buckets.items()) if bucket['hours']})
+
+def draw_hourly_patterns(hourly_avg):
     plt.figure(figsize=(12, 6))
-    df['hour'] = pd.to_datetime(df['ts_time']).dt.hour
-    hourly_avg = df.groupby('hour')['consumption_kwh'].mean()
-    
     plt.plot(hourly_avg.index, hourly_avg.values, marker='o')
     plt.title('Average Hourly Consumption Pattern')
     plt.xlabel('Hour of Day')
@@ -60,9 +131,9 @@ def plot_hourly_patterns(df):
     plt.close()
 
 def plot_price_vs_consumption(df):
-    """Create price vs consumption scatter plot"""
+    """Create price vs consumption scatter plot (a density plot for long ranges)"""
     plt.figure(figsize=(10, 6))
-    sns.scatterplot(data=df, x='price_cents_per_kwh', y='consumption_kwh', alpha=0.5)
+    density(plt.gca(), df['price_cents_per_kwh'], df['consumption_kwh'], alpha=0.5)
     plt.title('Price vs Consumption')
     plt.xlabel('Price (cents/kWh)')
     plt.ylabel('Consumption (kWh)')
@@ -73,16 +144,50 @@ def plot_price_vs_consumption(df):
 
 def create_heatmap(df):
     """Create weekly consumption heatmap"""
-    df['weekday'] = pd.to_datetime(df['ts_time']).dt.day_name()
-    df['hour'] = pd.to_datetime(df['ts_time']).dt.hour
+    hourly = hourly_consumption(df)
+    hourly['weekday'] = hourly['ts_hour'].dt.day_name()
+    hourly['hour'] = hourly['ts_hour'].dt.hour
     
-    pivot_table = df.pivot_table(
+    pivot_table = hourly.pivot_table(
         values='consumption_kwh',
         index='weekday',
         columns='hour',
         aggfunc='mean'
     )
-    
+    draw_heatmap(pivot_table)
+
+def heatmap_from_rollups(store):
+    """Average consumption per weekday and hour from the rollup store"""
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    pivot_table = pd.DataFrame(index=days, columns=range(24), dtype=float)
+    for key, bucket in store.level('weekday_hour').items():
+        weekday, hour = key.split('-')
+        if bucket['hours']:
+            pivot_table.loc[days[int(weekday)], int(hour)] = bucket['consumption'] / bucket['hours']
+    return pivot_table
+
+def heatmap_from_matrix(matrix, start=None):
+    """Average consumption per weekday and hour, reduced from the day matrices"""
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    return pd.DataFrame(matrix.weekday_hour_mean('kwh', start), index=days, columns=range(24))
+
+def chart_data_from_matrix(matrix, start=None):
+    """Chart inputs from the day matrices: daily and hour-of-day sums, price and kWh per slot"""
+    days, daily = matrix.aggregate('day', start)
+    hours, hourly = matrix.aggregate('hour', start)
+    # Slots holding two intervals (the repeated autumn hour) give one point per interval
+    single = matrix.select('rows', start) == 1
+    repeated = matrix.repeated(start)
+    return {
+        'daily': pd.DataFrame({'ts_time': days, 'consumption_kwh': daily['consumption']}),
+        'hourly': pd.Series(hourly['consumption'] / hourly['hours'], index=hours),
+        'price': pd.DataFrame({'price_cents_per_kwh': np.concatenate([matrix.select('price', start)[single],
+                                                                      repeated['price']]),
+                               'consumption_kwh': np.concatenate([matrix.select('kwh', start)[single],
+                                                                  repeated['kwh']])}),
+    }
+
+def draw_heatmap(pivot_table):
     # Reorder days
     days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     pivot_table = pivot_table.reindex(days_order)
@@ -104,6 +209,10 @@ if __name__ == "__main__":
     parser.add_argument('--hourly', action='store_true', help='Generate hourly pattern chart')
     parser.add_argument('--price', action='store_true', help='Generate price vs consumption chart')
     parser.add_argument('--heatmap', action='store_true', help='Generate weekly heatmap')
+    parser.add_argument('--source', choices=['hive', 'iceberg', 'rollups', 'matrix'], default='hive',
+                        help='Query Hive, scan the Iceberg table directly, read the local rollup store '
+                             '(hourly and heatmap charts only) or the local day matrices')
+    parser.add_argument('--meter', default='combined', help='Meter of the day matrices (default: combined)')
     args = parser.parse_args()
 
     try:
@@ -111,26 +220,59 @@ if __name__ == "__main__":
         import os
         os.makedirs('charts', exist_ok=True)
 
-        # Fetch data
-        logging.info(f"Fetching last {args.days} days of data")
-        df = get_data_from_hive(args.days)
+        if args.source == 'rollups':
+            # The rollups cover the whole history, so --days does not apply
+            store = RollupStore.load()
+            if args.all or args.hourly:
+                logging.info("Generating hourly pattern chart from rollups")
+                draw_hourly_patterns(hourly_patterns_from_rollups(store))
+            if args.all or args.heatmap:
+                logging.info("Generating weekly heatmap from rollups")
+                draw_heatmap(heatmap_from_rollups(store))
+            if args.daily or args.price:
+                logging.warning("Daily and price charts need raw rows; use --source hive")
+        elif args.source == 'matrix':
+            # Same window as the Hive queries, sliced from the memory-mapped matrices
+            matrix = DayMatrix.open(args.meter)
+            start = datetime.utcnow().date() - timedelta(days=args.days)
+            frames = chart_data_from_matrix(matrix, start)
+            if args.all or args.daily:
+                logging.info("Generating daily consumption chart from the day matrices")
+                plot_daily_consumption(frames['daily'])
+            if args.all or args.hourly:
+                logging.info("Generating hourly pattern chart from the day matrices")
+                draw_hourly_patterns(frames['hourly'])
+            if args.all or args.price:
+                logging.info("Generating price vs consumption chart from the day matrices")
+                plot_price_vs_consumption(frames['price'])
+            if args.all or args.heatmap:
+                logging.info("Generating weekly heatmap from the day matrices")
+                draw_heatmap(heatmap_from_matrix(matrix, start))
+        else:
+            charts = [chart for chart in CHART_INPUTS if args.all or getattr(args, chart)]
+            # Fetch data
+            logging.info(f"Fetching last {args.days} days of data")
+            if args.source == 'iceberg':
+                frames = get_chart_data_from_iceberg(charts, args.days)
+            else:
+                frames = get_chart_data_from_hive(charts, args.days)
 
-        # Generate requested charts
-        if args.all or args.daily:
-            logging.info("Generating daily consumption chart")
-            plot_daily_consumption(df)
+            # Generate requested charts
+            if 'daily' in charts:
+                logging.info("Generating daily consumption chart")
+                plot_daily_consumption(frames['daily'])
 
-        if args.all or args.hourly:
-            logging.info("Generating hourly pattern chart")
-            plot_hourly_patterns(df)
+            if 'hourly' in charts:
+                logging.info("Generating hourly pattern chart")
+                plot_hourly_patterns(frames['hourly'])
 
-        if args.all or args.price:
-            logging.info("Generating price vs consumption chart")
-            plot_price_vs_consumption(df)
+            if 'price' in charts:
+                logging.info("Generating price vs consumption chart")
+                plot_price_vs_consumption(frames['price'])
 
-        if args.all or args.heatmap:
-            logging.info("Generating weekly heatmap")
-            create_heatmap(df)
+            if 'heatmap' in charts:
+                logging.info("Generating weekly heatmap")
+                create_heatmap(frames['hourly'])
 
         if not any([args.all, args.daily, args.hourly, args.price, args.heatmap]):
             parser.print_help()
@@ -4,6 +4,7 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import pandas as pd
+from sahko.rendering import plot_bars, plot_line
 
 # Dremio login details
 login_endpoint = "http://192.168.11.187:9047/apiv2/login"
@@ -49,24 +50,25 @@ sns.set_theme(style="whitegrid")
 fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 14))
 
 # Plot 1: Daily Consumption and Price
-ax1.plot(df_pandas['date'], df_pandas['daily_consumption_kWh'], color='royalblue', label='Daily Consumption')
+# Lines are downsampled to the axes width (sahko/rendering.py); price spikes are kept with min-max
+plot_line(ax1, df_pandas['date'], df_pandas['daily_consumption_kWh'], color='royalblue', label='Daily Consumption')
 ax1.set_ylabel('kWh', color='royalblue')
 ax1.tick_params(axis='y', labelcolor='royalblue')
 ax1.set_title('Daily Energy Consumption & Price')
 
 ax1b = ax1.twinx()
-ax1b.plot(df_pandas['date'], df_pandas['avg_price_cents_per_kWh'], color='darkorange', label='Price')
+plot_line(ax1b, df_pandas['date'], df_pandas['avg_price_cents_per_kWh'], method='minmax', color='darkorange', label='Price')
 ax1b.set_ylabel('Cents/kWh', color='darkorange')
 ax1b.tick_params(axis='y', labelcolor='darkorange')
 
 # Plot 2: Cumulative Metrics with dual y-axes
-ax2.plot(df_pandas['date'], df_pandas['cumulative_cost_euros'], color='purple', label='Cost')
+plot_line(ax2, df_pandas['date'], df_pandas['cumulative_cost_euros'], color='purple', label='Cost')
 ax2.set_title('Cumulative Consumption & Cost')
 ax2.set_ylabel('Cost (€)', color='purple')
 ax2.tick_params(axis='y', labelcolor='purple')
 
 ax2b = ax2.twinx()
-ax2b.plot(df_pandas['date'], df_pandas['cumulative_consumption_kWh'], color='green', label='Consumption')
+plot_line(ax2b, df_pandas['date'], df_pandas['cumulative_consumption_kWh'], color='green', label='Consumption')
 ax2b.set_ylabel('Consumption (kWh)', color='green')
 ax2b.tick_params(axis='y', labelcolor='green')
 
@@ -76,7 +78,7 @@ lines2, labels2 = ax2b.get_legend_handles_labels()
 ax2.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
 
 # Plot 3: Daily Costs
-ax3.bar(df_pandas['date'], df_pandas['total_daily_cost_euros'], color='teal', width=1)
+plot_bars(ax3, df_pandas['date'], df_pandas['total_daily_cost_euros'], color='teal', width=1)
 ax3.set_title('Daily Energy Costs')
 ax3.set_ylabel('€')
 
@@ -0,0 +1,150 @@
+"""Resident analysis service answering report queries from memory.
+
+Keeps processed/combined_data.csv loaded (see sahko.dataset.HotDataset),
+picks up newly combined hours incrementally and serves JSON over HTTP on
+localhost or a Unix socket:
+
+    GET /health                 dataset size and load time
+    GET /summary                annual totals and monthly breakdown
+    GET /monthly                monthly breakdown only
+    GET /hourly                 average consumption and price per hour of day
+    GET /daily                  consumption per day
+    GET /rows?since=<ISO time>  combined rows, optionally from a timestamp on
+
+    python analysis_service.py --port 8765
+    python analysis_service.py --unix /tmp/sahko-analysis.sock
+"""
+import argparse
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from dotenv import load_dotenv
+
+from sahko.dataset import HotDataset
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Minimum seconds between stat() calls on the combined file
+REFRESH_INTERVAL = 1.0
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    dataset = None
+    fixed_price = 8.5
+    _last_refresh = 0.0
+    _refresh_lock = threading.Lock()
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _refresh(self):
+        cls = type(self)
+        with cls._refresh_lock:
+            if time.monotonic() - cls._last_refresh < REFRESH_INTERVAL:
+                return
+            cls._last_refresh = time.monotonic()
+        result = self.dataset.refresh()
+        if result != 'unchanged':
+            logger.info(f"Dataset {result}: {len(self.dataset)} rows")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            self._refresh()
+            if url.path == '/health':
+                payload = {
+                    'rows': len(self.dataset),
+                    'version': self.dataset.version,
+                    'loaded_at': self.dataset.loaded_at.isoformat() if self.dataset.loaded_at else None,
+                }
+            elif url.path == '/summary':
+                payload = self.dataset.summary(self.fixed_price)
+            elif url.path == '/monthly':
+                payload = self.dataset.summary(self.fixed_price)['monthly_data']
+            elif url.path == '/hourly':
+                payload = self.dataset.hourly_profile()
+            elif url.path == '/daily':
+                payload = self.dataset.daily()
+            elif url.path == '/rows':
+                since = query.get('since', [None])[0]
+                epoch = int(datetime.fromisoformat(since).timestamp()) if since else None
+                payload = self.dataset.rows_since(epoch)
+            else:
+                self._send_json(404, {'error': f"Unknown endpoint {url.path}"})
+                return
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            logger.exception(f"Error handling {self.path}")
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, payload)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve analysis results from an in-memory dataset')
+    parser.add_argument('--data', default='processed/combined_data.csv', help='Combined data CSV')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=int(os.getenv('ANALYSIS_SERVICE_PORT', 8765)), help='TCP port')
+    parser.add_argument('--unix', help='Listen on this Unix socket path instead of TCP')
+    args = parser.parse_args(argv)
+
+    dataset = HotDataset(args.data)
+    start = time.perf_counter()
+    dataset.refresh()
+    logger.info(f"Loaded {len(dataset)} rows from {args.data} in {time.perf_counter() - start:.3f}s")
+
+    AnalysisHandler.dataset = dataset
+    AnalysisHandler.fixed_price = float(os.getenv('FIXED_PRICE', 8.5))
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        server = ThreadingUnixHTTPServer(args.unix, AnalysisHandler)
+        logger.info(f"Analysis service listening on unix:{args.unix}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), AnalysisHandler)
+        logger.info(f"Analysis service listening on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+if __name__ == "__main__":
+    main()
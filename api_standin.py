@@ -0,0 +1,64 @@
+"""Run the local API stand-in (sahko/standin.py) for offline and load tests.
+
+Prints the environment that points the fetchers at it, then serves until
+interrupted:
+
+    python api_standin.py --latency 200 --jitter 100 --error-rate 0.05 --customers 20
+    python api_standin.py --record recordings     # proxy to the real APIs and store answers
+    python api_standin.py --replay recordings     # serve the stored answers offline
+"""
+import argparse
+import logging
+import sys
+import time
+
+from sahko.standin import StandinConfig, base_urls, start
+
+# Set up logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve stand-ins for the Elenia, Vattenfall and porssisahko APIs')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8700, help='Port to listen on (default: 8700)')
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0, help='Up to this many extra random milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0, help='Share of responses that are 504s (0-1)')
+    parser.add_argument('--customers', type=int, default=1, help='Customer ids per account (default: 1)')
+    parser.add_argument('--points', type=int, default=2,
+                        help='Metering points per customer id; the second is production (default: 2)')
+    parser.add_argument('--resolution', type=int, choices=(15, 60), default=60,
+                        help='Minutes between generated readings (default: 60)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data and faults')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--record', metavar='DIR', help='Proxy to the real APIs and store the responses in DIR')
+    mode.add_argument('--replay', metavar='DIR', help='Serve responses recorded in DIR')
+    args = parser.parse_args(argv)
+
+    config = StandinConfig(latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+                           customers=args.customers, points=args.points, resolution_minutes=args.resolution,
+                           seed=args.seed, mode='record' if args.record else 'replay' if args.replay else 'synthetic',
+                           recordings=args.record or args.replay or 'recordings')
+    server = start(config, args.host, args.port)
+    logger.info(f"Stand-in ({config.mode}) listening on {args.host}:{server.server_port}")
+    for name, value in base_urls(args.host, server.server_port).items():
+        print(f"export {name}={value}")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        for endpoint, count in sorted(server.stats.items()):
+            logger.info(f"{endpoint}: {count} requests")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
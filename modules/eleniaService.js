@@ -9,8 +9,8 @@ class EleniaService {
     constructor() {
         this.username = process.env.ELENIA_USERNAME;
         this.password = process.env.ELENIA_PASSWORD;
-        this.baseUrl = 'https://public.sgp-prod.aws.elenia.fi/api/gen';
-        this.cognitoUrl = 'https://cognito-idp.eu-west-1.amazonaws.com/';
+        this.baseUrl = process.env.ELENIA_API_URL || 'https://public.sgp-prod.aws.elenia.fi/api/gen';
+        this.cognitoUrl = process.env.ELENIA_COGNITO_URL || 'https://cognito-idp.eu-west-1.amazonaws.com/';
         this.headers = {
             'Accept': '*/*',
             'Accept-Language': 'en-US,en;q=0.5',
@@ -5,6 +5,24 @@ const dotenv = require('dotenv');
 
 dotenv.config();
 
+// Finnish VAT on electricity as [first local day, rate]; keep in step with
+// VAT_SCHEDULE in sahko/prices.py
+const VAT_SCHEDULE = [
+    ['2013-01-01', 0.24],
+    ['2022-12-01', 0.10],
+    ['2023-05-01', 0.24],
+    ['2024-09-01', 0.255]
+];
+
+function vatRate(timeStamp) {
+    // Local 'YYYY-MM-DD...' strings compare in date order
+    let rate = VAT_SCHEDULE[0][1];
+    for (const [firstDay, scheduleRate] of VAT_SCHEDULE) {
+        if (timeStamp >= firstDay) rate = scheduleRate;
+    }
+    return rate;
+}
+
 class VattenfallService {
     constructor() {
         this.headers = {
@@ -16,17 +34,17 @@ class VattenfallService {
         const year = process.env.YEAR;
         const startDate = `${year}-01-01`;
         const endDate = `${year}-12-31`;
-        const url = `https://www.vattenfall.fi/api/price/spot/${startDate}/${endDate}?lang=fi`;
+        const baseUrl = process.env.VATTENFALL_API_URL || 'https://www.vattenfall.fi/api/price/spot';
+        const url = `${baseUrl}/${startDate}/${endDate}?lang=fi`;
 
         try {
             const response = await axios.get(url, { headers: this.headers });
             const data = response.data;
 
-            // Add VAT (25.5%) to the values
-            const VAT_RATE = 0.255;
+            // Add the VAT in effect at each hour
             const processedData = data.map(row => ({
                 ...row,
-                value: Number((row.value * (1 + VAT_RATE)).toFixed(2))
+                value: Number((row.value * (1 + vatRate(row.timeStamp))).toFixed(2))
             }));
 
             // Ensure downloads directory exists
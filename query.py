@@ -0,0 +1,71 @@
+"""Ad-hoc SQL over the local combined data (see sahko/localsql.py).
+
+Runs in-process with DuckDB, reading processed/combined_data.csv and
+moved_to_db/*.csv (or the Parquet partitions in processed/parquet/), so no
+Dremio or Postgres is needed:
+
+    python query.py "SELECT * FROM cumulative WHERE date >= '2025-01-01' ORDER BY date"
+    python query.py --file report.sql --output report.parquet
+    python query.py --views
+    python query.py --write-partitions
+"""
+import argparse
+import logging
+import sys
+
+from sahko.instrumentation import stage
+from sahko.localsql import PARQUET_DIR, VIEWS, connect, export, write_partitions
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run SQL over the local combined data')
+    parser.add_argument('sql', nargs='?', help='Query to run')
+    parser.add_argument('--file', help='Read the query from a file')
+    parser.add_argument('--output', help='Write the result to a .csv, .parquet or .json file instead of printing it')
+    parser.add_argument('--views', action='store_true', help='List the available views and their columns')
+    parser.add_argument('--write-partitions', action='store_true',
+                        help=f'Rewrite the year-partitioned Parquet copy in {PARQUET_DIR}/ from the CSV files')
+    parser.add_argument('--threads', type=int, help='DuckDB worker threads (default: all cores)')
+    parser.add_argument('--max-rows', type=int, default=100, help='Rows to print (default: 100)')
+    args = parser.parse_args(argv)
+
+    if args.write_partitions:
+        with stage("write_partitions"):
+            write_partitions(connect(parquet_dir=None, threads=args.threads))
+        logger.info(f"Wrote Parquet partitions to {PARQUET_DIR}/")
+        return 0
+
+    conn = connect(threads=args.threads)
+    if args.views:
+        for name in ['readings', *VIEWS]:
+            columns = conn.execute(f"DESCRIBE {name}").fetchall()
+            print(f"{name}: " + ', '.join(f"{column[0]} {column[1]}" for column in columns))
+        return 0
+
+    sql = args.sql
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            sql = f.read()
+    if not sql:
+        parser.error('give a query or --file')
+    # COPY wraps the query in parentheses, so a trailing semicolon must go
+    sql = sql.strip().rstrip(';')
+
+    with stage("query"):
+        if args.output:
+            export(conn, sql, args.output)
+            logger.info(f"Wrote result to {args.output}")
+        else:
+            conn.sql(sql).show(max_rows=args.max_rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
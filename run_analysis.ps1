@@ -1,6 +1,9 @@
 # Activate virtual environment
 & "./venv/Scripts/Activate.ps1"
 
+# Group the stage metrics of this run under one id
+$env:METRICS_RUN_ID = Get-Date -Format "yyyyMMddTHHmmss"
+
 # Run scripts in sequence
 try {
     Write-Host "Running 1_elenia_consumption_data.py..."
@@ -16,6 +19,7 @@ try {
     python 4_data_analysis.py
     
     Write-Host "All scripts completed successfully!"
+    python -m sahko.instrumentation summary --run-id $env:METRICS_RUN_ID
 } catch {
     Write-Host "An error occurred: $_"
 } finally {
@@ -3,6 +3,9 @@
 # Activate virtual environment
 source ./venv/bin/activate
 
+# Group the stage metrics of this run under one id
+export METRICS_RUN_ID="$(date +%Y%m%dT%H%M%S)"
+
 # Run scripts in sequence
 run_script() {
     echo "Running $1..."
@@ -15,6 +18,7 @@ try_run_scripts() {
     run_script "3_combine.py"
     run_script "4_data_analysis.py"
     echo "All scripts completed successfully!"
+    python -m sahko.instrumentation summary --run-id "$METRICS_RUN_ID"
 }
 
 # Execute scripts and handle errors
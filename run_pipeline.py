@@ -0,0 +1,109 @@
+"""Run the numbered pipeline scripts as one dependency-aware process.
+
+    elenia_fetch (1) ───┐                                 ┌─> analysis (4) ───────┐
+                        ├─> validate (v) ─> combine (3) ───┤                       ├─> db_load (5)
+    vattenfall_fetch (2)┘                                 └─> iceberg_upload (6) ─┘
+
+The two downloads run concurrently, every stage is skipped when its inputs
+are unchanged since its last successful run, and all scripts share one
+interpreter. When validation finds errors nothing downstream runs.
+
+The database load runs last. It copies the combined CSV to moved_to_db/
+(``--keep``) rather than moving it, so the next run still finds the
+combine output in place and can skip the unchanged stages.
+"""
+import argparse
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+
+from sahko.pipeline import Stage, StateStore, run_pipeline, DEFAULT_STATE_FILE
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+COMBINED_DATA_FILE = 'processed/combined_data.csv'
+CONSUMPTION_DATA_FILE = 'downloads/consumption_data.json'
+
+
+def price_data_file():
+    return f"downloads/vattenfall_hinnat_{os.getenv('YEAR')}.csv"
+
+
+def build_stages(fetch_max_age):
+    return {
+        '1': Stage('elenia_fetch', '1_elenia_consumption_data',
+                   outputs=[CONSUMPTION_DATA_FILE],
+                   env=['ELENIA_USERNAME', 'YEAR'],
+                   max_age=fetch_max_age),
+        '2': Stage('vattenfall_fetch', '2_vattenfall_price_data',
+                   outputs=[price_data_file],
+                   env=['YEAR'],
+                   args=[],
+                   max_age=fetch_max_age),
+        'v': Stage('validate', 'validate_data',
+                   deps=['elenia_fetch', 'vattenfall_fetch'],
+                   inputs=[CONSUMPTION_DATA_FILE, price_data_file],
+                   env=['YEAR'],
+                   args=[]),
+        '3': Stage('combine', '3_combine',
+                   deps=['elenia_fetch', 'vattenfall_fetch', 'validate'],
+                   inputs=[CONSUMPTION_DATA_FILE, price_data_file],
+                   outputs=[COMBINED_DATA_FILE],
+                   env=['SPOT_MARGIN', 'YEAR']),
+        '4': Stage('analysis', '4_data_analysis',
+                   deps=['combine'],
+                   inputs=[COMBINED_DATA_FILE],
+                   env=['FIXED_PRICE'],
+                   args=[],
+                   main_thread=True),
+        '6': Stage('iceberg_upload', '6_upload_to_iceberg',
+                   deps=['combine'],
+                   inputs=[COMBINED_DATA_FILE],
+                   args=['--upload', '--changed']),
+        '5': Stage('db_load', '5-copy-to-db-2',
+                   deps=['combine', 'analysis', 'iceberg_upload'],
+                   inputs=[COMBINED_DATA_FILE],
+                   args=['--incremental', '--keep']),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the data pipeline stages with dependency-aware parallelism')
+    parser.add_argument('--stages', default='1,2,v,3,4',
+                        help='Comma separated stage numbers to run (default: 1,2,v,3,4; v = validation, '
+                             '5 = database load, 6 = Iceberg upload)')
+    parser.add_argument('--force', default='',
+                        help='Comma separated stage names to run even if fresh, or "all"')
+    parser.add_argument('--fetch-max-age', type=float, default=float(os.getenv('FETCH_MAX_AGE_HOURS', 6)),
+                        help='Hours a successful download stays fresh (default: FETCH_MAX_AGE_HOURS or 6)')
+    parser.add_argument('--workers', type=int, default=4, help='Maximum number of concurrent stages')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE, help='Where stage run state is kept')
+    args = parser.parse_args(argv)
+
+    all_stages = build_stages(args.fetch_max_age * 3600)
+    selected = [number.strip() for number in args.stages.split(',') if number.strip()]
+    unknown = [number for number in selected if number not in all_stages]
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(unknown)}")
+    # Keep the DAG order regardless of the order given on the command line
+    stages = [stage for number, stage in all_stages.items() if number in selected]
+    force = {name.strip() for name in args.force.split(',') if name.strip()}
+
+    for directory in ('downloads', 'processed'):
+        os.makedirs(directory, exist_ok=True)
+
+    results = run_pipeline(stages, StateStore(args.state_file), force=force, max_workers=args.workers)
+    for name, result in results.items():
+        logger.info(f"{name}: {result}")
+    return 0 if all(result in ('ran', 'skipped') for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
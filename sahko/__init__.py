@@ -0,0 +1 @@
+"""Shared helpers for the electricity consumption pipeline scripts."""
@@ -0,0 +1,194 @@
+"""Home battery dispatch and sizing.
+
+Given the netted consumption of each row (negative = surplus production),
+the all-in purchase price and the price paid for exported energy, a
+battery of ``capacity`` kWh and ``power`` kW with round-trip
+``efficiency`` is dispatched either
+
+* optimally (``optimal``): backward dynamic programming over the state of
+  charge in steps of ``resolution`` kWh (finer when needed so one row at
+  full power spans at least MIN_STEPS steps). Each row is one vectorized
+  step from every level to the levels within the power limit, so a year of
+  hourly data takes a few seconds per battery;
+* greedily (``greedy``): charge in each day's cheapest rows, discharge in
+  its dearest ones, for a quick estimate.
+
+``sweep`` runs a grid of capacities and powers in a process pool and
+returns the annual savings of each. Prices are snt/kWh, costs euros.
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+
+SOC_RESOLUTION = 0.05  # kWh per state-of-charge step
+MIN_STEPS = 8  # state-of-charge steps per row of full-power charging, at least
+EFFICIENCY = 0.9
+
+
+def _efficiencies(efficiency):
+    # Round-trip losses split evenly between charging and discharging
+    one_way = math.sqrt(efficiency)
+    return one_way, one_way
+
+
+def grid_cost(grid, buy, sell):
+    """Euros for grid energy per row: imports at ``buy``, exports at ``sell``."""
+    return (np.maximum(grid, 0) * buy + np.minimum(grid, 0) * sell) / 100
+
+
+def _result(load, grid, soc, buy, sell, capacity):
+    baseline = float(grid_cost(load, buy, sell).sum())
+    cost = float(grid_cost(grid, buy, sell).sum())
+    discharged = float(np.maximum(-np.diff(np.concatenate([[0.0], soc])), 0).sum())
+    return {
+        'baseline_cost': baseline,
+        'cost': cost,
+        'savings': baseline - cost,
+        'cycles': discharged / capacity if capacity else 0.0,
+        'grid': grid,
+        'soc': soc,
+    }
+
+
+def soc_levels(capacity, power, efficiency=EFFICIENCY, interval_hours=1.0, resolution=SOC_RESOLUTION):
+    """State-of-charge grid (kWh) from empty to ``capacity``.
+
+    Steps are ``resolution`` kWh, or smaller so that one row of full-power
+    charging spans at least MIN_STEPS of them.
+    """
+    charge_eff, _ = _efficiencies(efficiency)
+    step = min(resolution, power * interval_hours * charge_eff / MIN_STEPS)
+    if capacity <= 0 or step <= 0:
+        return np.zeros(1)
+    return np.minimum(np.arange(math.ceil(capacity / step - 1e-9) + 1) * step, capacity)
+
+
+def optimal(load, buy, sell, capacity, power, efficiency=EFFICIENCY, interval_hours=1.0, resolution=SOC_RESOLUTION):
+    """Cost-minimizing dispatch by dynamic programming over the state of charge.
+
+    Returns a dict with baseline_cost, cost, savings, cycles and the per-row
+    grid energy and state of charge (kWh at the end of each row). The
+    battery starts empty.
+    """
+    if resolution <= 0:
+        raise ValueError(f"resolution must be positive, got {resolution}")
+    load = np.asarray(load, dtype=np.float64)
+    buy = np.asarray(buy, dtype=np.float64)
+    sell = np.asarray(sell, dtype=np.float64)
+    charge_eff, discharge_eff = _efficiencies(efficiency)
+    levels = soc_levels(capacity, power, efficiency, interval_hours, resolution)
+    count = len(levels)
+    steps = math.ceil(power * interval_hours * charge_eff / levels[1] - 1e-9) if count > 1 else 0
+
+    # Moves from level i to i + offset for the offsets the power can reach
+    # (discharging covers more levels: the losses come out of the battery)
+    offsets = np.arange(-math.ceil(steps / efficiency), steps + 1) if count > 1 else np.zeros(1, dtype=np.int64)
+    target = np.arange(count)[:, None] + offsets[None, :]
+    valid = (target >= 0) & (target < count)
+    target = np.clip(target, 0, count - 1)
+    delta = levels[target] - levels[:, None]
+    effect = np.where(delta > 0, delta / charge_eff, delta * discharge_eff)
+    penalty = np.where(valid & (np.abs(effect) <= power * interval_hours + 1e-9), 0.0, np.inf)
+
+    rows = len(load)
+    policy = np.empty((rows, count), dtype=np.int32)
+    value = np.zeros(count)
+    spread = buy - sell
+    for t in range(rows - 1, -1, -1):
+        grid = load[t] + effect
+        cost = grid * (sell[t] / 100) + np.maximum(grid, 0) * (spread[t] / 100)
+        cost += value[target] + penalty
+        best = np.argmin(cost, axis=1)
+        policy[t] = target[np.arange(count), best]
+        value = cost[np.arange(count), best]
+
+    # Follow the policy forward from an empty battery
+    level = 0
+    path = np.empty(rows, dtype=np.int64)
+    for t in range(rows):
+        level = policy[t, level]
+        path[t] = level
+    previous = np.concatenate([[0], path[:-1]])
+    delta = levels[path] - levels[previous]
+    grid = load + np.where(delta > 0, delta / charge_eff, delta * discharge_eff)
+    return _result(load, grid, levels[path], buy, sell, capacity)
+
+
+def greedy(load, buy, sell, capacity, power, efficiency=EFFICIENCY, interval_hours=1.0, days=None):
+    """Charge in each day's cheapest rows and discharge in its dearest, one pass.
+
+    ``days`` labels the day of each row (consecutive rows of 24 when None).
+    Energy is only shifted when the dear price covers the losses, and the
+    battery discharges into the household load only.
+    """
+    load = np.asarray(load, dtype=np.float64)
+    buy = np.asarray(buy, dtype=np.float64)
+    sell = np.asarray(sell, dtype=np.float64)
+    rows = len(load)
+    charge_eff, discharge_eff = _efficiencies(efficiency)
+    step = power * interval_hours
+    days = np.arange(rows) // int(round(24 / interval_hours)) if days is None else np.unique(days, return_inverse=True)[1]
+
+    # Rank rows by price within their day. Discharging is limited by the
+    # load too, so more dear rows than cheap ones are needed to empty the battery.
+    needed = math.ceil(capacity / step) if step else 0
+    typical_load = float(load[load > 0].mean()) if np.any(load > 0) else 0.0
+    discharge_per_row = min(step, typical_load)
+    needed_dear = math.ceil(capacity / discharge_per_row) if discharge_per_row else 0
+    order = np.lexsort((buy, days))
+    first = np.searchsorted(days[order], days[order], side='left')
+    last = np.searchsorted(days[order], days[order], side='right')
+    rank = np.empty(rows, dtype=np.int64)
+    rank[order] = np.arange(rows) - first
+    per_day = np.empty(rows, dtype=np.int64)
+    per_day[order] = last - first
+    day_min = np.full(days.max() + 1 if rows else 0, np.inf)
+    day_max = np.full(len(day_min), -np.inf)
+    np.minimum.at(day_min, days, buy)
+    np.maximum.at(day_max, days, buy)
+    cheap = (rank < needed) & (buy < day_max[days] * efficiency)
+    dear = (per_day - 1 - rank < needed_dear) & (buy * efficiency > day_min[days]) & ~cheap
+
+    soc = np.empty(rows)
+    grid = load.copy()
+    level = 0.0
+    for t in range(rows):
+        if cheap[t] and level < capacity:
+            stored = min(step * charge_eff, capacity - level)
+            level += stored
+            grid[t] += stored / charge_eff
+        elif dear[t] and level > 0 and load[t] > 0:
+            delivered = min(step, level * discharge_eff, load[t])
+            level -= delivered / discharge_eff
+            grid[t] -= delivered
+        soc[t] = level
+    return _result(load, grid, soc, buy, sell, capacity)
+
+
+MODES = {'optimal': optimal, 'greedy': greedy}
+
+
+def _run(args):
+    mode, load, buy, sell, capacity, power, options = args
+    result = MODES[mode](load, buy, sell, capacity, power, **options)
+    return {key: value for key, value in result.items() if key not in ('grid', 'soc')}
+
+
+def sweep(load, buy, sell, capacities, powers, mode='optimal', workers=None, **options):
+    """Savings for every (capacity, power) pair, simulated in a process pool.
+
+    Returns a list of dicts with capacity, power, baseline_cost, cost,
+    savings and cycles, in grid order.
+    """
+    pairs = list(product(capacities, powers))
+    tasks = [(mode, load, buy, sell, capacity, power, options) for capacity, power in pairs]
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if workers <= 1:
+        results = [_run(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run, tasks))
+    return [{'capacity': capacity, 'power': power, **result} for (capacity, power), result in zip(pairs, results)]
@@ -0,0 +1,161 @@
+"""Change detection for revised meter readings and prices.
+
+Elenia revises past hours and netted values appear days later, so a fresh
+download can differ from the last one anywhere in the year. The combine
+stage hashes the raw consumption and price series per local day
+(sahko/dayhash.py) and compares them with the hashes in the changes
+manifest (CHANGES_FILE). Only the changed days are then recombined and
+pushed on:
+
+* combined rows are kept as monthly partitions (PARTITION_DIR); only the
+  months with a changed day are rewritten, and combined_data.csv is
+  assembled from the year's partitions;
+* rollups subtract the old rows of a revised day and add the new ones
+  (``RollupStore.revise``);
+* Iceberg: the changed days wait in the manifest's ``pending`` list until
+  6_upload_to_iceberg.py --changed has replaced them;
+* Postgres: 5-copy-to-db-2.py --incremental already compares per-day
+  hashes of the combined rows and sends only the days that differ.
+
+    manifest = ChangeManifest.load()
+    changed = manifest.detect({'consumption': hashes, 'prices': hashes}, settings)
+    ...
+    manifest.record(changed)
+    manifest.save()
+
+A change of settings (spot margin, resolution) marks every day as changed.
+"""
+import glob
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from sahko.series import HourlySeries
+
+CHANGES_FILE = 'processed/changes.json'
+PARTITION_DIR = 'processed/combined'
+FORMAT_VERSION = 1
+TARGETS = ('iceberg',)
+RUN_HISTORY = 20
+
+
+class ChangeManifest:
+    """Raw input hashes per day, the settings they were combined with and pending pushes."""
+
+    def __init__(self, path=CHANGES_FILE, data=None):
+        self.path = path
+        self.data = data or {
+            'version': FORMAT_VERSION,
+            'settings': None,
+            'inputs': {},
+            'pending': {target: [] for target in TARGETS},
+            'runs': [],
+        }
+
+    @classmethod
+    def load(cls, path=CHANGES_FILE):
+        """Load the manifest, or return an empty one if the file is missing or outdated."""
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == FORMAT_VERSION:
+                return cls(path, data)
+        return cls(path)
+
+    def detect(self, inputs, settings):
+        """Days whose raw data is new or differs from the last run, in order.
+
+        ``inputs`` maps an input name ('consumption', 'prices') to its
+        {'YYYY-MM-DD': hash}. Every day counts as changed when ``settings``
+        differ from those of the last run. The new hashes are merged in for
+        ``save``.
+        """
+        if self.data['settings'] != settings:
+            self.data['settings'] = settings
+            self.data['inputs'] = {}
+        changed = set()
+        for name, hashes in inputs.items():
+            stored = self.data['inputs'].setdefault(name, {})
+            changed.update(day for day, digest in hashes.items() if stored.get(day) != digest)
+            # Days of other years (or missing from this download) keep their hashes
+            stored.update(hashes)
+        return sorted(changed)
+
+    def record(self, changed, revised=()):
+        """Queue the changed days for every push target and log the run."""
+        for target in TARGETS:
+            pending = set(self.data['pending'].get(target, []))
+            self.data['pending'][target] = sorted(pending.union(changed))
+        self.data['runs'].append({
+            'at': datetime.now().astimezone().isoformat(timespec='seconds'),
+            'changed_days': len(changed),
+            'revised_days': sorted(revised),
+        })
+        self.data['runs'] = self.data['runs'][-RUN_HISTORY:]
+
+    def pending(self, target):
+        return list(self.data['pending'].get(target, []))
+
+    def mark_pushed(self, target, days):
+        """Remove days from a target's pending list after they were pushed."""
+        done = set(days)
+        self.data['pending'][target] = [day for day in self.data['pending'].get(target, []) if day not in done]
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def months_of(days):
+    """Sorted 'YYYY-MM' months of 'YYYY-MM-DD' days."""
+    return sorted({day[:7] for day in days})
+
+
+def partition_path(month, directory=PARTITION_DIR):
+    return os.path.join(directory, f"combined_{month}.csv")
+
+
+def read_partitions(months=None, directory=PARTITION_DIR):
+    """Combined rows of the given months (all stored months if None)."""
+    if months is None:
+        paths = sorted(glob.glob(os.path.join(directory, 'combined_*.csv')))
+    else:
+        paths = [partition_path(month, directory) for month in months]
+    return HourlySeries.concat([HourlySeries.read_csv(path) for path in paths if os.path.exists(path)])
+
+
+def write_partitions(series, months, directory=PARTITION_DIR):
+    """Rewrite the partitions of ``months`` from ``series``; a month without rows is removed.
+
+    Returns the paths written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    keys = series.field('month').astype(str)
+    written = []
+    for month in months:
+        path = partition_path(month, directory)
+        rows = series[keys == month]
+        if len(rows):
+            tmp_path = f"{path}.tmp"
+            rows.to_csv(tmp_path)
+            os.replace(tmp_path, path)
+            written.append(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    return written
+
+
+def day_ranges(days):
+    """Consecutive 'YYYY-MM-DD' days merged into [first, last] pairs."""
+    ordinals = np.array(sorted(days), dtype='datetime64[D]')
+    if len(ordinals) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ordinals).astype(np.int64) != 1) + 1
+    return [(str(run[0]), str(run[-1])) for run in np.split(ordinals, breaks)]
@@ -0,0 +1,190 @@
+"""In-memory copy of processed/combined_data.csv with running aggregates.
+
+``HotDataset`` keeps the combined hourly rows as NumPy columns and the
+monthly and hour-of-day sums next to them. ``refresh()`` is cheap to call
+often: it only stats the file, and when the file has grown with every
+byte read so far unchanged (new hours appended) it parses just the new
+lines. A rewrite that changes earlier rows, such as the combine stage
+swapping in revised meter readings, triggers a full reload.
+"""
+import hashlib
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from sahko.timeaxis import RESOLUTION_MINUTES
+
+COLUMNS = ['timestamp', 'consumption_kWh', 'price_cents_per_kWh', 'cost_euros']
+
+# Block size for hashing the part of the file already read
+HASH_BLOCK_BYTES = 1 << 20
+
+# Length of one combined row in hours
+INTERVAL_HOURS = RESOLUTION_MINUTES / 60
+
+
+def _empty_bucket():
+    return {'consumption': 0.0, 'cost': 0.0, 'hours': 0, 'price_sum': 0.0}
+
+
+class HotDataset:
+    """Combined hourly data and aggregates held in memory."""
+
+    def __init__(self, path='processed/combined_data.csv'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.epoch = np.empty(0, dtype=np.int64)
+        self.consumption = np.empty(0, dtype=np.float64)
+        self.price = np.empty(0, dtype=np.float64)
+        self.cost = np.empty(0, dtype=np.float64)
+        self.timestamps = []
+        self.monthly = {}
+        self.hourly = [_empty_bucket() for _ in range(24)]
+        self.daily_consumption = {}
+        self.totals = _empty_bucket()
+        self._offset = 0
+        self._signature = None
+        self._prefix_hash = hashlib.sha256()
+        self.loaded_at = None
+        self.version = 0
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def _prefix_digest(self, f, offset):
+        # Hash of the first ``offset`` bytes, to compare with the bytes already read
+        digest = hashlib.sha256()
+        f.seek(0)
+        remaining = offset
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK_BYTES, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+        return digest.digest()
+
+    def refresh(self):
+        """Bring the dataset up to date with the file.
+
+        Returns 'unchanged', 'appended' or 'reloaded'.
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                if self._signature is not None:
+                    self._reset()
+                    return 'reloaded'
+                return 'unchanged'
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature == self._signature:
+                return 'unchanged'
+
+            with open(self.path, 'rb') as f:
+                appended = (
+                    self._signature is not None
+                    and stat.st_size > self._offset
+                    and self._prefix_digest(f, self._offset) == self._prefix_hash.digest()
+                )
+                if not appended:
+                    self._reset()
+                    f.seek(0)
+                    header = f.readline()
+                    if header.decode('utf-8').strip().split(',') != COLUMNS:
+                        raise ValueError(f"Unexpected header in {self.path}: {header!r}")
+                    self._prefix_hash.update(header)
+                    offset = f.tell()
+                else:
+                    offset = self._offset
+                    f.seek(offset)
+                chunk = f.read()
+
+            # Only consume complete lines; a partial last line waits for the next refresh
+            end = chunk.rfind(b'\n') + 1
+            self._ingest(chunk[:end].decode('utf-8').splitlines())
+            self._prefix_hash.update(chunk[:end])
+            self._offset = offset + end
+            self._signature = signature
+            self.loaded_at = datetime.now().astimezone()
+            self.version += 1
+            return 'appended' if appended else 'reloaded'
+
+    def _ingest(self, lines):
+        rows = [line.split(',') for line in lines if line]
+        if not rows:
+            return
+        timestamps = [row[0] for row in rows]
+        epoch = np.array([int(datetime.fromisoformat(ts).timestamp()) for ts in timestamps], dtype=np.int64)
+        consumption = np.array([float(row[1]) for row in rows])
+        price = np.array([float(row[2]) for row in rows])
+        cost = np.array([float(row[3]) for row in rows])
+
+        self.timestamps.extend(timestamps)
+        self.epoch = np.concatenate([self.epoch, epoch])
+        self.consumption = np.concatenate([self.consumption, consumption])
+        self.price = np.concatenate([self.price, price])
+        self.cost = np.concatenate([self.cost, cost])
+
+        # The timestamps are local time, so month, day and hour are prefixes
+        for ts, kwh, cents, eur in zip(timestamps, consumption.tolist(), price.tolist(), cost.tolist()):
+            for bucket in (self.totals,
+                           self.monthly.setdefault(ts[:7], _empty_bucket()),
+                           self.hourly[int(ts[11:13])]):
+                bucket['consumption'] += kwh
+                bucket['cost'] += eur
+                bucket['hours'] += INTERVAL_HOURS
+                bucket['price_sum'] += cents * INTERVAL_HOURS
+            day = ts[:10]
+            self.daily_consumption[day] = self.daily_consumption.get(day, 0.0) + kwh
+
+    def summary(self, fixed_price):
+        """Annual figures in the shape of ``analyze_data`` in 4_data_analysis.py."""
+        with self._lock:
+            totals = dict(self.totals)
+            monthly = {month: dict(bucket) for month, bucket in sorted(self.monthly.items())}
+        hours = totals['hours']
+        fixed_price_total_cost = totals['consumption'] * fixed_price / 100
+        for bucket in monthly.values():
+            bucket['fixed_price_cost'] = bucket['consumption'] * fixed_price / 100
+            bucket['average_price'] = bucket['price_sum'] / bucket['hours'] if bucket['hours'] else 0.0
+        return {
+            'total_consumption': totals['consumption'],
+            'total_cost': totals['cost'],
+            'average_price': totals['price_sum'] / hours if hours else 0.0,
+            'monthly_data': monthly,
+            'fixed_price_total_cost': fixed_price_total_cost,
+            'savings': fixed_price_total_cost - totals['cost'],
+            'fixed_price': fixed_price,
+            'hours': hours,
+        }
+
+    def hourly_profile(self):
+        """Average consumption and price for each hour of the day."""
+        with self._lock:
+            return [{
+                'hour': hour,
+                'average_consumption': bucket['consumption'] / bucket['hours'] if bucket['hours'] else 0.0,
+                'average_price': bucket['price_sum'] / bucket['hours'] if bucket['hours'] else 0.0,
+                'hours': bucket['hours'],
+            } for hour, bucket in enumerate(self.hourly)]
+
+    def daily(self):
+        with self._lock:
+            return [{'date': day, 'consumption': kwh} for day, kwh in sorted(self.daily_consumption.items())]
+
+    def rows_since(self, epoch=None):
+        """Rows with a timestamp at or after ``epoch`` (all rows if None)."""
+        with self._lock:
+            start = 0 if epoch is None else int(np.searchsorted(self.epoch, epoch, side='left'))
+            return {
+                'timestamp': self.timestamps[start:],
+                'consumption_kWh': self.consumption[start:].tolist(),
+                'price_cents_per_kWh': self.price[start:].tolist(),
+                'cost_euros': self.cost[start:].tolist(),
+            }
@@ -0,0 +1,76 @@
+"""Per-day content hashes of combined data.
+
+3_combine.py rewrites the whole year every run, so loaders need another
+way to tell what actually changed. Each local calendar day of an
+``HourlySeries`` is hashed over its timestamps and values; comparing with
+the hashes recorded at the last load gives the days that are new or were
+corrected, and only their rows need to be sent:
+
+    hashes = day_hashes(series)
+    days = changed_days(hashes, stored)
+    upsert(select_days(series, days))
+
+The raw consumption and price series are hashed the same way
+(``column_day_hashes``), so revised meter readings are noticed before
+anything is combined (see sahko/changes.py).
+"""
+import hashlib
+
+import numpy as np
+
+from sahko.timeaxis import utc_offsets
+
+
+def day_hash(rows):
+    """sha256 of one day's rows (epoch and the three value columns)."""
+    return _hash_columns((rows.epoch, rows.consumption, rows.price, rows.cost))
+
+
+def _hash_columns(columns):
+    digest = hashlib.sha256()
+    for column in columns:
+        digest.update(np.ascontiguousarray(column).tobytes())
+    return digest.hexdigest()
+
+
+def day_hashes(series):
+    """{'YYYY-MM-DD': hash} for every day in the series."""
+    return {str(day): day_hash(rows) for day, rows in series.groupby('day')}
+
+
+def column_day_hashes(epoch, *columns):
+    """{'YYYY-MM-DD': hash} of time-sorted raw arrays (epoch first), by local day.
+
+    Used for the raw consumption and price series before they are combined;
+    ``column_day_hashes(s.epoch, s.consumption, s.price, s.cost)`` equals
+    ``day_hashes(s)``.
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    if len(epoch) == 0:
+        return {}
+    days = (epoch + utc_offsets(epoch)) // 86400
+    unique, starts = np.unique(days, return_index=True)
+    ends = np.append(starts[1:], len(epoch))
+    return {
+        str(np.datetime64(int(day), 'D')): _hash_columns([column[start:end] for column in (epoch, *columns)])
+        for day, start, end in zip(unique.tolist(), starts.tolist(), ends.tolist())
+    }
+
+
+def changed_days(hashes, stored):
+    """Days of ``hashes`` that are missing from ``stored`` or hash differently, in order."""
+    return sorted(day for day, digest in hashes.items() if stored.get(day) != digest)
+
+
+def select_days(series, days):
+    """Rows of ``series`` on the given days."""
+    if not len(series):
+        return series
+    return series[np.isin(series.field('day'), np.array(sorted(days), dtype='datetime64[D]'))]
+
+
+def drop_days(series, days):
+    """Rows of ``series`` not on the given days."""
+    if not len(series):
+        return series
+    return series[~np.isin(series.field('day'), np.array(sorted(days), dtype='datetime64[D]'))]
@@ -0,0 +1,318 @@
+"""Memory-mapped day x slot matrices of the combined data.
+
+Every meter gets one directory under processed/matrix/ holding a .npy
+matrix per metric, shaped (days, slots per day): slots are the local
+hours of the day (96 quarter hours with RESOLUTION_MINUTES=15). Row ``i``
+is local day ``first_day + i``, so a date range is a row slice, a weekday
+mask picks rows and an hour range picks columns; nothing is parsed:
+
+    matrix = DayMatrix.open()
+    kwh = matrix.select('kwh', '2025-06-01', '2025-09-01', weekdays=[5, 6], hours=slice(17, 21))
+    keys, sums = matrix.aggregate('month')      # same shape as HourlySeries.aggregate
+
+Metrics are ``kwh``, ``price``, ``cost`` and ``rows`` (intervals in the
+slot). Slots without data are NaN (0 rows). The wall-clock hour that is
+skipped in March stays empty; the one repeated in October holds the sum
+of both intervals' kWh and cost, their average price and ``rows`` 2. The
+intervals of such slots are also kept one by one in ``repeated.npy``
+(``matrix.repeated(...)``), so price distributions and consumption-weighted
+prices see both real prices.
+
+The combine stage fills the store with ``write_matrices``. Days already
+present are overwritten in place; new days grow the matrices.
+"""
+import json
+import os
+
+import numpy as np
+
+from sahko.series import GROUPINGS
+
+DEFAULT_MATRIX_DIR = 'processed/matrix'
+DEFAULT_METER = 'combined'
+METRICS = ('kwh', 'price', 'cost', 'rows')
+META_FILE = 'meta.json'
+REPEATED_FILE = 'repeated.npy'
+# One entry per interval of a slot holding more than one; day is days since 1970-01-01
+REPEATED_DTYPE = np.dtype([('day', np.int64), ('slot', np.int16),
+                           ('kwh', np.float64), ('price', np.float64), ('cost', np.float64)])
+FORMAT_VERSION = 2
+
+
+def _as_day(day):
+    return np.datetime64(day, 'D')
+
+
+def _day_matrices(series, first_day, days, slots):
+    """The series binned into (days, slots) matrices starting at first_day."""
+    step = 86400 // slots
+    local_day = series.local.astype('datetime64[D]')
+    slot = (series.local - local_day).astype(np.int64) // step
+    flat = (local_day - first_day).astype(np.int64) * slots + slot
+    size = days * slots
+    rows = np.bincount(flat, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        price = np.bincount(flat, series.price, size) / rows
+    empty = rows == 0
+    matrices = {
+        'kwh': np.where(empty, np.nan, np.bincount(flat, series.consumption, size)),
+        'price': np.where(empty, np.nan, price),
+        'cost': np.where(empty, np.nan, np.bincount(flat, series.cost, size)),
+        'rows': rows.astype(np.uint8),
+    }
+    matrices = {metric: values.reshape(days, slots) for metric, values in matrices.items()}
+    shared = rows[flat] > 1
+    repeated = np.empty(int(shared.sum()), dtype=REPEATED_DTYPE)
+    repeated['day'] = first_day.astype(np.int64) + flat[shared] // slots
+    repeated['slot'] = flat[shared] % slots
+    repeated['kwh'] = series.consumption[shared]
+    repeated['price'] = series.price[shared]
+    repeated['cost'] = series.cost[shared]
+    return matrices, repeated
+
+
+def _write_repeated(directory, stored, repeated, written):
+    # Replace the entries of the written days and move the file into place
+    if stored is not None:
+        repeated = np.concatenate([stored[~np.isin(stored['day'], written.astype(np.int64))], repeated])
+    repeated = repeated[np.lexsort((repeated['slot'], repeated['day']))]
+    path = os.path.join(directory, REPEATED_FILE)
+    with open(f"{path}.tmp", 'wb') as f:
+        np.save(f, repeated)
+    os.replace(f"{path}.tmp", path)
+
+
+class DayMatrix:
+    """Read-only view of one meter's memory-mapped matrices."""
+
+    def __init__(self, directory, meta, arrays, repeated):
+        self.directory = directory
+        self.first_day = _as_day(meta['first_day'])
+        self.slots = meta['slots']
+        self.arrays = arrays
+        self._repeated = repeated
+
+    @classmethod
+    def open(cls, meter=DEFAULT_METER, root=DEFAULT_MATRIX_DIR):
+        directory = os.path.join(root, meter)
+        with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format') != FORMAT_VERSION:
+            raise ValueError(f"{directory} has matrix format {meta.get('format')}, expected {FORMAT_VERSION}")
+        arrays = {metric: np.load(os.path.join(directory, f"{metric}.npy"), mmap_mode='r') for metric in METRICS}
+        repeated = np.load(os.path.join(directory, REPEATED_FILE))
+        return cls(directory, meta, arrays, repeated)
+
+    def __len__(self):
+        return len(self.arrays['rows'])
+
+    @property
+    def interval_hours(self):
+        return 24 / self.slots
+
+    @property
+    def days(self):
+        """Local day of each row as datetime64[D]."""
+        return self.first_day + np.arange(len(self))
+
+    @property
+    def weekdays(self):
+        """Weekday of each row, 0=Monday."""
+        # 1970-01-01 was a Thursday
+        return (self.days.astype(np.int64) + 3) % 7
+
+    def rows(self, start=None, end=None):
+        """Row slice of the local days ``start <= day < end`` (either bound optional)."""
+        lo = 0 if start is None else int(np.clip((_as_day(start) - self.first_day).astype(np.int64), 0, len(self)))
+        hi = len(self) if end is None else int(np.clip((_as_day(end) - self.first_day).astype(np.int64), lo, len(self)))
+        return slice(lo, hi)
+
+    def _columns(self, hours):
+        # Hours of the day to slot columns; a slice stays a slice (a view)
+        per_hour = self.slots // 24
+        if hours is None:
+            return slice(None)
+        if isinstance(hours, slice):
+            start = 0 if hours.start is None else hours.start
+            stop = 24 if hours.stop is None else hours.stop
+            return slice(start * per_hour, stop * per_hour)
+        hours = np.asarray(hours, dtype=np.int64)
+        return (hours[:, None] * per_hour + np.arange(per_hour)).ravel()
+
+    def _row_index(self, start, end, weekdays):
+        rows = self.rows(start, end)
+        if weekdays is None:
+            return rows, self.days[rows]
+        index = np.arange(rows.start, rows.stop)
+        index = index[np.isin(self.weekdays[rows], weekdays)]
+        return index, self.days[index]
+
+    def repeated(self, start=None, end=None, weekdays=None, hours=None):
+        """Intervals of the slots holding more than one (``rows`` > 1), filtered like ``select``.
+
+        Returns a structured array with day (row of the matrices), slot,
+        kwh, price and cost per interval.
+        """
+        rows = self.rows(start, end)
+        entries = self._repeated.copy()
+        entries['day'] -= self.first_day.astype(np.int64)
+        entries = entries[(entries['day'] >= rows.start) & (entries['day'] < rows.stop)]
+        keep = np.ones(len(entries), dtype=bool)
+        if weekdays is not None:
+            keep &= np.isin(self.weekdays[entries['day']], weekdays)
+        columns = self._columns(hours)
+        if isinstance(columns, slice):
+            keep &= (entries['slot'] >= (columns.start or 0)) & (entries['slot'] < (columns.stop or self.slots))
+        else:
+            keep &= np.isin(entries['slot'], columns)
+        return entries[keep]
+
+    def select(self, metric, start=None, end=None, weekdays=None, hours=None):
+        """Values of a metric for a day range, optional weekdays (0=Monday) and hours of the day.
+
+        A plain date range and hour slice return a view of the mapped file.
+        """
+        rows, _ = self._row_index(start, end, weekdays)
+        return self.arrays[metric][rows][:, self._columns(hours)]
+
+    def aggregate(self, by, start=None, end=None, weekdays=None, hours=None):
+        """Sums per 'day', 'month', 'hour' or 'weekday', like ``HourlySeries.aggregate``.
+
+        Returns (keys, sums) with consumption, cost, hours, price_sum,
+        price_kwh and rows per key; keys without rows are left out.
+        """
+        if by not in GROUPINGS:
+            raise ValueError(f"Unknown grouping {by!r}; expected one of {', '.join(GROUPINGS)}")
+        rows, days = self._row_index(start, end, weekdays)
+        columns = self._columns(hours)
+        per_hour = self.slots // 24
+        count = self.arrays['rows'][rows][:, columns].astype(np.int64)
+        kwh = np.nan_to_num(self.arrays['kwh'][rows][:, columns])
+        price = np.nan_to_num(self.arrays['price'][rows][:, columns])
+        cells = {
+            'consumption': kwh,
+            'cost': np.nan_to_num(self.arrays['cost'][rows][:, columns]),
+            'price_sum': price * count,
+            'price_kwh': price * kwh,
+            'rows': count,
+        }
+        repeated = self.repeated(start, end, weekdays, hours)
+        repeated_days = self.first_day + repeated['day']
+        if by == 'hour':
+            hour_of_slot = np.arange(self.slots)[columns] // per_hour
+            keys, inverse = np.unique(hour_of_slot, return_inverse=True)
+            sums = {name: np.bincount(inverse, values.sum(axis=0), len(keys)) for name, values in cells.items()}
+            repeated_keys = repeated['slot'] // per_hour
+        else:
+            if by == 'day':
+                group, repeated_keys = days, repeated_days
+            elif by == 'month':
+                group, repeated_keys = days.astype('datetime64[M]'), repeated_days.astype('datetime64[M]')
+            else:
+                group = (days.astype(np.int64) + 3) % 7
+                repeated_keys = (repeated_days.astype(np.int64) + 3) % 7
+            keys, inverse = np.unique(group, return_inverse=True)
+            sums = {name: np.bincount(inverse, values.sum(axis=1), len(keys)) for name, values in cells.items()}
+        if len(repeated):
+            # Weight the slots holding several intervals by each interval's own price
+            slot_price = self.arrays['price'][repeated['day'], repeated['slot']]
+            np.add.at(sums['price_kwh'], np.searchsorted(keys, repeated_keys),
+                      (repeated['price'] - slot_price) * repeated['kwh'])
+        present = sums['rows'] > 0
+        sums = {name: values[present] for name, values in sums.items()}
+        sums['rows'] = sums['rows'].astype(np.int64)
+        sums['hours'] = sums['rows'] * self.interval_hours
+        sums['price_sum'] = sums['price_sum'] * self.interval_hours
+        return keys[present], sums
+
+    def weekday_hour_mean(self, metric='kwh', start=None, end=None):
+        """7 x 24 mean per weekday (0=Monday) and hour of the day; NaN where there is no data.
+
+        kWh and cost are summed to whole hours first, prices averaged.
+        """
+        rows = self.rows(start, end)
+        per_hour = self.slots // 24
+        count = self.arrays['rows'][rows].astype(np.int64).reshape(-1, 24, per_hour)
+        values = np.nan_to_num(self.arrays[metric][rows]).reshape(-1, 24, per_hour)
+        hours = count.sum(axis=2)
+        if metric == 'price':
+            hourly = (values * count).sum(axis=2) / np.maximum(hours, 1)
+        else:
+            hourly = values.sum(axis=2)
+        valid = hours > 0
+        weekdays = self.weekdays[rows]
+        totals = np.zeros((7, 24))
+        counts = np.zeros((7, 24))
+        np.add.at(totals, weekdays, np.where(valid, hourly, 0.0))
+        np.add.at(counts, weekdays, valid)
+        with np.errstate(invalid='ignore'):
+            return np.where(counts > 0, totals / counts, np.nan)
+
+
+def write_matrices(series, meter=DEFAULT_METER, root=DEFAULT_MATRIX_DIR):
+    """Write the days of ``series`` into the meter's matrices. Returns the number of days written.
+
+    Days in the series replace their rows completely. When the series
+    reaches outside the stored range (or the slot count changed) the
+    matrices are rewritten with the union range under temporary names and
+    moved into place, so readers never see a half-written file.
+    """
+    if not len(series):
+        return 0
+    slots = int(round(24 / series.interval_hours))
+    directory = os.path.join(root, meter)
+    os.makedirs(directory, exist_ok=True)
+    local_days = series.local.astype('datetime64[D]')
+    first, last = local_days[0], local_days[-1]
+    written = np.unique(local_days)
+
+    try:
+        current = DayMatrix.open(meter, root)
+    except (OSError, ValueError):
+        current = None
+    if current is not None and current.slots != slots:
+        current = None
+
+    if current is not None and current.first_day <= first and last < current.first_day + len(current):
+        # Inside the stored range: overwrite the rows in place
+        matrices, repeated = _day_matrices(series, first, int((last - first).astype(np.int64)) + 1, slots)
+        offset = int((first - current.first_day).astype(np.int64))
+        keep = (written - first).astype(np.int64)
+        for metric in METRICS:
+            target = np.load(os.path.join(directory, f"{metric}.npy"), mmap_mode='r+')
+            target[offset + keep] = matrices[metric][keep]
+            target.flush()
+            del target
+        _write_repeated(directory, current._repeated, repeated, written)
+        return len(written)
+
+    if current is not None:
+        first_day = min(first, current.first_day)
+        last_day = max(last, current.first_day + len(current) - 1)
+    else:
+        first_day, last_day = first, last
+    days = int((last_day - first_day).astype(np.int64)) + 1
+    matrices, repeated = _day_matrices(series, first_day, days, slots)
+    stored_repeated = None
+    if current is not None:
+        # Carry over the stored days the series does not replace
+        offset = int((current.first_day - first_day).astype(np.int64))
+        stored = offset + np.arange(len(current))
+        keep = ~np.isin(first_day + stored, written)
+        for metric in METRICS:
+            matrices[metric][stored[keep]] = current.arrays[metric][keep]
+        stored_repeated = current._repeated
+        del current
+    for metric in METRICS:
+        path = os.path.join(directory, f"{metric}.npy")
+        out = np.lib.format.open_memmap(f"{path}.tmp", mode='w+', dtype=matrices[metric].dtype, shape=(days, slots))
+        out[:] = matrices[metric]
+        out.flush()
+        del out
+        os.replace(f"{path}.tmp", path)
+    _write_repeated(directory, stored_repeated, repeated, written)
+    meta_path = os.path.join(directory, META_FILE)
+    with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'format': FORMAT_VERSION, 'first_day': str(first_day), 'days': days, 'slots': slots}, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    return len(written)
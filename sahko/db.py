@@ -0,0 +1,104 @@
+"""Read side of the Postgres ``consumption_data`` table filled by 5-copy-to-db-2.py.
+
+Aggregates run as SQL in the database, so a report over many years only
+transfers one row per month. Raw rows are streamed through a named
+(server-side) cursor in batches instead of being fetched all at once.
+
+psycopg2 is imported when a connection is opened, so the analysis scripts
+keep working without it when they read the CSV or the rollups.
+"""
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+DB_CONFIG = {
+    "dbname": os.getenv('DATABASE'),
+    "user": os.getenv('DATABASE_USER'),
+    "password": os.getenv('DATABASE_PASSWORD'),
+    "host": os.getenv('DATABASE_HOST'),
+    "port": "5432"
+}
+
+HELSINKI = ZoneInfo('Europe/Helsinki')
+STREAM_BATCH_SIZE = 10000
+
+# Month buckets plus the whole range (the ROLLUP row, month IS NULL).
+# Grouping sets do not accept column numbers, hence the repeated expression.
+AGGREGATE_QUERY = """
+    SELECT to_char(timestamp AT TIME ZONE 'Europe/Helsinki', 'YYYY-MM') AS month,
+           SUM(consumption_kWh) AS consumption,
+           SUM(cost_euros) AS cost,
+           AVG(price_cents_per_kWh) AS average_price,
+           COUNT(*) AS row_count,
+           COUNT(DISTINCT (timestamp AT TIME ZONE 'Europe/Helsinki')::date) AS days
+    FROM consumption_data
+    WHERE timestamp >= %(start)s AND timestamp < %(end)s
+    GROUP BY ROLLUP (to_char(timestamp AT TIME ZONE 'Europe/Helsinki', 'YYYY-MM'))
+    ORDER BY 1 NULLS LAST
+"""
+
+ROWS_QUERY = """
+    SELECT timestamp, consumption_kWh, price_cents_per_kWh, cost_euros
+    FROM consumption_data
+    WHERE timestamp >= %(start)s AND timestamp < %(end)s
+    ORDER BY timestamp
+"""
+
+
+def connect():
+    import psycopg2
+    return psycopg2.connect(**DB_CONFIG)
+
+
+def year_range(year=None):
+    """[start, end) of a calendar year in Helsinki time; everything if year is None."""
+    if year is None:
+        return datetime(1970, 1, 1, tzinfo=HELSINKI), datetime(9999, 1, 1, tzinfo=HELSINKI)
+    year = int(year)
+    return datetime(year, 1, 1, tzinfo=HELSINKI), datetime(year + 1, 1, 1, tzinfo=HELSINKI)
+
+
+def aggregates(conn, year=None):
+    """Monthly buckets and totals computed in the database.
+
+    Returns (monthly, totals): monthly maps 'YYYY-MM' to a dict with
+    consumption, cost, average_price, row_count and days; totals has the same
+    fields for the whole range (None if there are no rows).
+    """
+    start, end = year_range(year)
+    columns = ('consumption', 'cost', 'average_price', 'row_count', 'days')
+    monthly = {}
+    totals = None
+    with conn.cursor() as cur:
+        cur.execute(AGGREGATE_QUERY, {'start': start, 'end': end})
+        for month, *values in cur:
+            bucket = {column: float(value) if column in ('consumption', 'cost', 'average_price') else int(value)
+                      for column, value in zip(columns, values)}
+            if month is None:
+                totals = bucket
+            else:
+                monthly[month] = bucket
+    return monthly, totals
+
+
+def iter_rows(conn, year=None, batch_size=STREAM_BATCH_SIZE):
+    """Stream rows in time order as (timestamp, consumption, price, cost).
+
+    Uses a named cursor, so the server keeps the result and only
+    ``batch_size`` rows are in Python at a time. Timestamps are returned in
+    Helsinki time.
+    """
+    start, end = year_range(year)
+    # A named cursor must live inside a transaction
+    with conn:
+        with conn.cursor(name='consumption_rows') as cur:
+            cur.itersize = batch_size
+            cur.execute(ROWS_QUERY, {'start': start, 'end': end})
+            for timestamp, consumption, price, cost in cur:
+                yield timestamp.astimezone(HELSINKI), consumption, price, cost
+
@@ -0,0 +1,304 @@
+"""Elenia API client shared by the single-account and batch downloads.
+
+An account logs in through Cognito (``login``), which returns the request
+headers carrying the API token and the ``customer_data_and_token``
+metadata. One customer may have several customer ids and each of those
+several metering points (GSRNs); ``metering_points`` lists them and
+``fetch_year`` streams one GSRN's yearly readings to a file:
+
+    headers, metadata = login(username, password)
+    for customer_id, customer_data in metadata['customer_datas'].items():
+        for gsrn, kind in metering_points(customer_data):
+            fetch_year(headers, customer_id, gsrn, year, kind, filename)
+
+Every call takes an optional shared ``TokenBucket`` and ``CircuitBreaker``
+(sahko/ratelimit.py), so parallel downloads stay under the API's limits.
+"""
+import base64
+import json
+import logging
+import os
+import time
+
+import requests
+from dotenv import load_dotenv
+
+from sahko.instrumentation import timed_request
+from sahko.jsonstream import CHUNK_SIZE, decode_chunks, iter_array_items
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Both URLs can point at the local stand-in (api_standin.py) for offline runs
+COGNITO_URL = os.getenv('ELENIA_COGNITO_URL', "https://cognito-idp.eu-west-1.amazonaws.com/")
+COGNITO_CLIENT_ID = "k4s2pnm04536t1bm72bdatqct"
+API_URL = os.getenv('ELENIA_API_URL', "https://public.sgp-prod.aws.elenia.fi/api/gen").rstrip('/')
+
+# Statuses worth retrying after a pause; 429 honours Retry-After
+RETRY_STATUSES = (429, 502, 503, 504)
+
+BROWSER_HEADERS = {
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br, zstd",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Referer": "https://ainalab.aws.elenia.fi/",
+    "Origin": "https://ainalab.aws.elenia.fi",
+    "DNT": "1",
+    "Sec-GPC": "1",
+    "Connection": "keep-alive",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-site"
+}
+
+# Device name of the virtual metering point that carries production
+PRODUCTION_DEVICE = 'Tuotannon virtuaalilaite'
+
+
+class EleniaError(RuntimeError):
+    """Login or metadata failure for one account."""
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def make_request_with_retry(method, url, max_retries=5, limiter=None, breaker=None, **kwargs):
+    """Send a request, retrying 429/5xx gateway errors and connection errors with backoff.
+
+    With a ``limiter`` every attempt first takes a token; a ``breaker``
+    is told about each outcome and holds requests back while it is open.
+    Returns the last response, or None when every attempt was retried.
+    """
+    for attempt in range(max_retries):
+        if limiter is not None:
+            limiter.acquire()
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            logger.debug(f"Making {method} request to: {url}")
+            if 'params' in kwargs:
+                logger.debug(f"Request params: {kwargs['params']}")
+            if 'headers' in kwargs:
+                sanitized_headers = {k: v for k, v in kwargs['headers'].items() if k.lower() != 'authorization'}
+                logger.debug(f"Request headers: {sanitized_headers}")
+
+            response = timed_request(requests.request, method, url, **kwargs)
+            logger.debug(f"Response status code: {response.status_code}")
+
+        except requests.exceptions.RequestException as e:
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt == max_retries - 1:
+                logger.error(f"Final request attempt failed: {str(e)}")
+                raise
+            wait_time = 2 ** attempt
+            logger.warning(f"Request failed, retry attempt {attempt + 1}/{max_retries} after {wait_time} seconds: {e}")
+            time.sleep(wait_time)
+            continue
+
+        if response.status_code in RETRY_STATUSES:
+            if breaker is not None:
+                breaker.record_failure()
+            wait_time = _retry_after(response)
+            if wait_time is None:
+                wait_time = 2 ** attempt  # exponential backoff
+            if response.status_code == 429 and limiter is not None:
+                # Slow every worker down, not just this one
+                limiter.penalize(wait_time)
+            logger.warning(f"Got {response.status_code} error, retry attempt {attempt + 1}/{max_retries} "
+                           f"after {wait_time} seconds")
+            logger.debug(f"Response content: {response.text}")
+            response.close()
+            time.sleep(wait_time)
+            continue
+
+        if breaker is not None:
+            breaker.record_success()
+        if response.status_code >= 400:
+            logger.error(f"Request failed with status {response.status_code}")
+            logger.error(f"Response content: {response.text}")
+
+        return response
+    return None
+
+
+def get_cognito_token(username, password, limiter=None, breaker=None):
+    headers = {
+        'Content-Type': 'application/x-amz-json-1.1',
+        'X-Amz-Target': 'AWSCognitoIdentityProviderService.InitiateAuth'
+    }
+    payload = {
+        "AuthFlow": "USER_PASSWORD_AUTH",
+        "ClientId": COGNITO_CLIENT_ID,
+        "AuthParameters": {
+            "USERNAME": username,
+            "PASSWORD": password
+        },
+        "ClientMetadata": {}
+    }
+
+    logger.debug(f"Making Cognito auth request to: {COGNITO_URL}")
+    logger.debug(f"Auth request headers: {headers}")
+    logger.debug(f"Auth request payload: {json.dumps({**payload, 'AuthParameters': {'USERNAME': username, 'PASSWORD': '[REDACTED]'}})}")
+
+    response = make_request_with_retry('POST', COGNITO_URL, limiter=limiter, breaker=breaker,
+                                       headers=headers, json=payload)
+    if response is None:
+        logger.error("Authentication failed: no response")
+        return None
+    logger.debug(f"Cognito response status code: {response.status_code}")
+
+    if response.status_code == 200:
+        logger.debug("Successfully retrieved auth token")
+        return response.json()['AuthenticationResult']['AccessToken']
+    else:
+        logger.error(f"Authentication failed: {response.text}")
+        return None
+
+
+def token_subject(bearer_token):
+    """The ``sub`` claim of a JWT, or None if the token cannot be read."""
+    token_parts = bearer_token.split('.')
+    if len(token_parts) < 2:
+        return None
+    payload = json.loads(base64.b64decode(token_parts[1] + '=' * (-len(token_parts[1]) % 4)).decode('utf-8'))
+    return payload.get('sub')
+
+
+def login(username, password, limiter=None, breaker=None):
+    """Log one account in. Returns (API request headers, customer metadata).
+
+    Raises EleniaError when authentication or the metadata request fails.
+    """
+    bearer_token = get_cognito_token(username, password, limiter, breaker)
+    if not bearer_token:
+        raise EleniaError("Failed to retrieve bearer token")
+    logger.info("Bearer token retrieved successfully")
+
+    sub_value = token_subject(bearer_token)
+    if sub_value is None:
+        raise EleniaError("Could not extract sub value from token")
+    logger.info(f"Extracted sub value from token: {sub_value}")
+
+    headers = {"Authorization": f"Bearer {bearer_token}", **BROWSER_HEADERS}
+
+    # Fetch customer metadata using Cognito token
+    metadata_url = f"{API_URL}/customer_data_and_token"
+    logger.debug(f"Fetching customer metadata from: {metadata_url}")
+    try:
+        response = make_request_with_retry('GET', metadata_url, limiter=limiter, breaker=breaker, headers=headers)
+        if response is None:
+            raise EleniaError("No response to the customer metadata request")
+        logger.debug(f"Metadata response status code: {response.status_code}")
+        response.raise_for_status()
+        metadata = response.json()
+    except requests.exceptions.RequestException as e:
+        logger.debug(f"Failed response content: {getattr(e.response, 'text', 'No response content')}")
+        raise EleniaError(f"Error fetching customer metadata: {e}") from e
+    logger.debug("Successfully parsed metadata response")
+
+    api_token = metadata.get('token')
+    if not api_token:
+        raise EleniaError("No token found in metadata response")
+    headers['Authorization'] = f"Bearer {api_token}"
+
+    logger.debug("Full metadata response:")
+    logger.debug(json.dumps(metadata, indent=2))
+    return headers, metadata
+
+
+def metering_points(customer_data):
+    """(gsrn, kind) of every metering point of one customer id.
+
+    kind is 'consumption' for type 'kulutus' and 'production' for the
+    virtual production device; the two checks are independent, so a point
+    matching both is listed under both kinds. Other points keep their own
+    type.
+    """
+    points = []
+    for meteringpoint in customer_data.get('meteringpoints', []):
+        logger.debug("Metering point data:")
+        logger.debug(json.dumps(meteringpoint, indent=2))
+        gsrn = meteringpoint.get('gsrn')
+        if not gsrn:
+            continue
+        kinds = []
+        # Check for consumption GSRN
+        if meteringpoint.get('type') == 'kulutus':
+            kinds.append('consumption')
+        # Check for production GSRN
+        if meteringpoint.get('device', {}).get('name') == PRODUCTION_DEVICE:
+            kinds.append('production')
+        if not kinds:
+            kinds.append(meteringpoint.get('type') or 'unknown')
+        points.extend((gsrn, kind) for kind in kinds)
+    return points
+
+
+def save_streamed_data(response, data_type, filename):
+    """Write the response body to filename while parsing its months one at a time.
+
+    Only the month being parsed is held in memory. The file is written under
+    a temporary name and moved into place once the whole body has arrived.
+    Returns the total number of hourly records.
+    """
+    tmp_filename = f"{filename}.tmp"
+    total_hours = 0
+
+    def body_chunks(outfile):
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            outfile.write(chunk)
+            yield chunk
+
+    try:
+        with open(tmp_filename, "wb") as outfile:
+            chunks = body_chunks(outfile)
+            for month in iter_array_items(decode_chunks(chunks), 'months'):
+                # Add data validation
+                hourly_values = month.get('hourly_values')
+                if hourly_values:
+                    first_timestamp = hourly_values[0]['t']
+                    last_timestamp = hourly_values[-1]['t']
+                    count = len(hourly_values)
+                    logger.info(f"{data_type} data for month {month['month']}: {count} records from {first_timestamp} to {last_timestamp}")
+                    total_hours += count
+            # Write whatever follows the months array
+            for _ in chunks:
+                pass
+    except Exception:
+        os.remove(tmp_filename)
+        raise
+    os.replace(tmp_filename, filename)
+    return total_hours
+
+
+def fetch_year(headers, customer_id, gsrn, year, data_type, filename, limiter=None, breaker=None):
+    """Stream one metering point's readings of ``year`` to ``filename``.
+
+    Returns the number of hourly records, or None if the request failed.
+    """
+    url = f"{API_URL}/meter_reading_yh"
+    params = {
+        "gsrn": gsrn,
+        "customer_ids": customer_id,
+        "year": year
+    }
+    # Stream the yearly payload: it is written to disk as it arrives
+    # instead of being parsed and dumped again as a whole
+    response = make_request_with_retry('GET', url, limiter=limiter, breaker=breaker,
+                                       params=params, headers=headers, stream=True)
+    if response is not None and response.status_code == 200:
+        return save_streamed_data(response, data_type, filename)
+    logger.error(f"Failed to fetch {data_type} data. "
+                 f"Status code: {response.status_code if response is not None else 'No response'}")
+    if response is not None:
+        logger.error(f"Response content: {response.text}")
+    return None
@@ -0,0 +1,103 @@
+"""Small HiveServer2 client shared by the Hive/Iceberg scripts.
+
+Connections are opened once and reused: ``HiveClient`` keeps up to
+``pool_size`` idle connections and hands one to each caller. Independent
+queries run concurrently with ``query_many``, one thread and connection per
+query (a pyhive connection must not be shared between threads), so a batch
+takes as long as its slowest query:
+
+    client = HiveClient()
+    frames = client.query_many({'daily': DAILY_SQL, 'hourly': HOURLY_SQL})
+    client.close()
+
+Connection settings come from HIVE_HOST, HIVE_PORT and HIVE_DATABASE.
+"""
+import logging
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HIVE_HOST = os.getenv('HIVE_HOST', 'ristoserver')
+HIVE_PORT = int(os.getenv('HIVE_PORT', 10000))
+HIVE_DATABASE = os.getenv('HIVE_DATABASE', 'electricity')
+
+
+class HiveClient:
+    """Pool of reusable HiveServer2 connections."""
+
+    def __init__(self, host=HIVE_HOST, port=HIVE_PORT, database=HIVE_DATABASE, pool_size=4):
+        self.host = host
+        self.port = port
+        self.database = database
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        from pyhive import hive  # only needed when Hive is used
+        logger.info(f"Opening Hive connection to {self.host}:{self.port}/{self.database}")
+        return hive.Connection(host=self.host, port=self.port, database=self.database)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it goes back to the pool unless the block failed."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except Exception:
+            # The connection may be left mid-query; do not hand it out again
+            self._discard(conn)
+            raise
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f"Error closing Hive connection: {e}")
+
+    def query(self, sql):
+        """Run one query and return the result as a DataFrame."""
+        import pandas as pd
+        logger.info(f"Executing query: {sql}")
+        with self.connection() as conn:
+            return pd.read_sql(sql, conn)
+
+    def query_many(self, queries):
+        """Run independent queries concurrently.
+
+        ``queries`` maps a name to SQL; returns a dict of name to DataFrame.
+        The first failing query's exception is raised.
+        """
+        if not queries:
+            return {}
+        workers = min(len(queries), self.pool_size)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {name: pool.submit(self.query, sql) for name, sql in queries.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,83 @@
+"""Direct scans of the ``electricity.consumption`` Iceberg table.
+
+Instead of going through HiveServer2 row by row, the table's Parquet files
+are read with pyiceberg and pyarrow. The ``ts_time`` range is pushed down
+as a row filter, so partitions (``month(ts_time)``, see
+6_upload_to_iceberg.py) and data files whose column statistics fall
+outside it are skipped, and only the requested columns are read. Results
+come back as Arrow record batches:
+
+    reader = scan_batches(start, end, columns=['ts_time', 'consumption_kwh'])
+    for batch in reader:
+        ...
+
+The catalog is ICEBERG_CATALOG from ~/.pyiceberg.yaml, or configured with
+ICEBERG_CATALOG_URI (e.g. thrift://ristoserver:9083 for the Hive metastore,
+sqlite:///path/catalog.db for a local catalog) and ICEBERG_WAREHOUSE.
+pyiceberg and pyarrow are only imported when a scan is made.
+"""
+import os
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+ICEBERG_CATALOG = os.getenv('ICEBERG_CATALOG', 'default')
+ICEBERG_TABLE = os.getenv('ICEBERG_TABLE', 'electricity.consumption')
+COLUMNS = ('ts_time', 'consumption_kwh', 'price_cents_per_kwh', 'cost_euros')
+
+HELSINKI = ZoneInfo('Europe/Helsinki')
+
+
+def load_table(name=ICEBERG_TABLE):
+    from pyiceberg.catalog import load_catalog
+    properties = {}
+    if os.getenv('ICEBERG_CATALOG_URI'):
+        properties['uri'] = os.getenv('ICEBERG_CATALOG_URI')
+    if os.getenv('ICEBERG_WAREHOUSE'):
+        properties['warehouse'] = os.getenv('ICEBERG_WAREHOUSE')
+    return load_catalog(ICEBERG_CATALOG, **properties).load_table(name)
+
+
+def _utc_literal(moment):
+    # ts_time holds UTC wall-clock time (see convert_timestamp in 6_upload_to_iceberg.py)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat()
+
+
+def row_filter(start=None, end=None):
+    """``start <= ts_time < end`` as a pyiceberg expression (either bound optional)."""
+    from pyiceberg.expressions import AlwaysTrue, And, GreaterThanOrEqual, LessThan
+    expression = AlwaysTrue()
+    if start is not None:
+        expression = And(expression, GreaterThanOrEqual('ts_time', _utc_literal(start)))
+    if end is not None:
+        expression = And(expression, LessThan('ts_time', _utc_literal(end)))
+    return expression
+
+
+def scan_batches(start=None, end=None, columns=COLUMNS, table=None):
+    """Arrow RecordBatchReader over the rows with ``start <= ts_time < end``."""
+    table = table or load_table()
+    scan = table.scan(row_filter=row_filter(start, end), selected_fields=tuple(columns))
+    return scan.to_arrow_batch_reader()
+
+
+def iter_rows(year=None, table=None):
+    """Rows of a calendar year (Helsinki time) as (timestamp, consumption, price, cost).
+
+    Timestamps are converted to Helsinki time. Rows are read batch by batch
+    and come in file order, not sorted.
+    """
+    start = end = None
+    if year is not None:
+        start = datetime(int(year), 1, 1, tzinfo=HELSINKI)
+        end = datetime(int(year) + 1, 1, 1, tzinfo=HELSINKI)
+    for batch in scan_batches(start, end, table=table):
+        columns = batch.to_pydict()
+        for ts_time, consumption, price, cost in zip(*(columns[column] for column in COLUMNS)):
+            yield ts_time.replace(tzinfo=timezone.utc).astimezone(HELSINKI), consumption, price, cost
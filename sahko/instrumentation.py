@@ -0,0 +1,356 @@
+"""Per-stage timing and resource instrumentation for the pipeline scripts.
+
+Wrap a unit of work in ``stage()`` and feed it counters as you go:
+
+    with stage("combine") as s:
+        s.add_bytes_read(os.path.getsize(path))
+        ...
+        s.add_rows(len(combined_data))
+
+Every finished stage is appended as one JSON line to METRICS_FILE
+(default processed/metrics.jsonl, set it empty to disable). When
+METRICS_OPENMETRICS is set, the stages recorded by the current process are
+also written there in OpenMetrics text format. Stages listed in
+PROFILE_STAGES (comma separated, or "all") run under cProfile and their
+stats are dumped to processed/profiles/<stage>.prof.
+
+HTTP calls made inside a stage are attached to it with ``record_http()``.
+
+    python -m sahko.instrumentation summary      # table of the latest run
+    python -m sahko.instrumentation openmetrics  # same run as OpenMetrics
+"""
+import argparse
+import contextvars
+import cProfile
+import importlib
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_FILE = 'processed/metrics.jsonl'
+PROFILE_DIR = 'processed/profiles'
+
+# One id per pipeline run, shared by child processes through the environment
+RUN_ID = os.getenv('METRICS_RUN_ID') or uuid.uuid4().hex[:12]
+
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+_finished = []
+_lock = threading.Lock()
+
+
+class StageMetrics:
+    """Counters collected while a stage is running."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now(timezone.utc)
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.http = []
+        self.imports = {}
+        self.extra = {}
+        self.status = 'ok'
+        self._lock = threading.Lock()
+
+    def add_rows(self, count):
+        with self._lock:
+            self.rows += int(count)
+
+    def add_bytes_read(self, count):
+        with self._lock:
+            self.bytes_read += int(count)
+
+    def add_bytes_written(self, count):
+        with self._lock:
+            self.bytes_written += int(count)
+
+    def set(self, key, value):
+        """Attach an extra stage-specific value (kept in the JSON output)."""
+        with self._lock:
+            self.extra[key] = value
+
+    def add_import(self, module, seconds):
+        with self._lock:
+            self.imports[module] = self.imports.get(module, 0.0) + seconds
+
+    def add_http(self, method, url, status, seconds, size=0):
+        parts = urlsplit(url)
+        with self._lock:
+            self.http.append({
+                'method': method.upper(),
+                'host': parts.netloc,
+                'path': parts.path,
+                'status': status,
+                'seconds': round(seconds, 6),
+                'bytes': int(size or 0),
+            })
+
+    def as_dict(self):
+        latencies = sorted(call['seconds'] for call in self.http)
+        return {
+            'run_id': RUN_ID,
+            'stage': self.name,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(),
+            'wall_seconds': round(self.wall_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            'rows': self.rows,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'http_requests': len(self.http),
+            'http_seconds_total': round(sum(latencies), 6),
+            'http_seconds_max': latencies[-1] if latencies else 0.0,
+            'http': self.http,
+            'import_seconds': round(sum(self.imports.values()), 6),
+            'imports': {name: round(seconds, 6) for name, seconds in self.imports.items()},
+            'extra': self.extra,
+        }
+
+
+def current_stage():
+    """Return the StageMetrics of the innermost running stage, or None."""
+    return _current_stage.get()
+
+
+def add_rows(count):
+    """Add to the row counter of the running stage (no-op outside a stage)."""
+    metrics = _current_stage.get()
+    if metrics is not None:
+        metrics.add_rows(count)
+
+
+def add_bytes_read(count):
+    metrics = _current_stage.get()
+    if metrics is not None:
+        metrics.add_bytes_read(count)
+
+
+def add_bytes_written(count):
+    metrics = _current_stage.get()
+    if metrics is not None:
+        metrics.add_bytes_written(count)
+
+
+def record_http(method, url, status, seconds, size=0):
+    """Attach one HTTP call to the running stage (no-op outside a stage)."""
+    metrics = _current_stage.get()
+    if metrics is not None:
+        metrics.add_http(method, url, status, seconds, size)
+
+
+def timed_request(requester, method, url, **kwargs):
+    """Call ``requester(method, url, **kwargs)`` and record its latency.
+
+    ``requester`` is ``requests.request`` or a Session's ``request`` method.
+    """
+    start = time.perf_counter()
+    status = None
+    size = 0
+    try:
+        response = requester(method, url, **kwargs)
+        status = response.status_code
+        size = len(response.content) if not kwargs.get('stream') else 0
+        return response
+    finally:
+        record_http(method, url, status, time.perf_counter() - start, size)
+
+
+def timed_import(name):
+    """Import a module and add the time it took to the running stage.
+
+    Used for the heavy modules the report scripts load lazily, so the
+    metrics show what each code path pays at startup.
+    """
+    already_loaded = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    metrics = _current_stage.get()
+    if metrics is not None and not already_loaded:
+        metrics.add_import(name, time.perf_counter() - start)
+    return module
+
+
+def _profiled_stages():
+    value = os.getenv('PROFILE_STAGES', '')
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def _dump_profile(name, profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{name}.prof")
+    profiler.dump_stats(path)
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(20)
+    with open(os.path.join(PROFILE_DIR, f"{name}.txt"), 'w', encoding='utf-8') as f:
+        f.write(buffer.getvalue())
+    logger.info(f"Profile for stage {name} written to {path}")
+
+
+@contextmanager
+def stage(name, profile=None):
+    """Measure wall time, CPU time and counters for the enclosed block."""
+    metrics = StageMetrics(name)
+    if profile is None:
+        profiled = _profiled_stages()
+        profile = name in profiled or 'all' in profiled
+    profiler = cProfile.Profile() if profile else None
+
+    token = _current_stage.set(metrics)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield metrics
+    except BaseException:
+        metrics.status = 'error'
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        metrics.wall_seconds = time.perf_counter() - wall_start
+        # process_time covers all threads; nested/parallel stages overlap
+        metrics.cpu_seconds = time.process_time() - cpu_start
+        _current_stage.reset(token)
+        if profiler:
+            _dump_profile(name, profiler)
+        _finish(metrics)
+
+
+def _finish(metrics):
+    record = metrics.as_dict()
+    with _lock:
+        _finished.append(record)
+    logger.info(
+        f"Stage {metrics.name} {metrics.status}: wall {metrics.wall_seconds:.3f}s, "
+        f"cpu {metrics.cpu_seconds:.3f}s, rows {metrics.rows}, "
+        f"read {metrics.bytes_read} B, written {metrics.bytes_written} B, "
+        f"http {len(metrics.http)} calls"
+    )
+
+    metrics_file = os.getenv('METRICS_FILE', DEFAULT_METRICS_FILE)
+    if metrics_file:
+        directory = os.path.dirname(metrics_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _lock, open(metrics_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+    openmetrics_file = os.getenv('METRICS_OPENMETRICS')
+    if openmetrics_file:
+        with _lock:
+            text = render_openmetrics(_finished)
+        with open(openmetrics_file, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def finished_stages():
+    """Return the stage records produced by this process so far."""
+    with _lock:
+        return list(_finished)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_openmetrics(records):
+    """Render stage records in the OpenMetrics text exposition format."""
+    gauges = [
+        ('wall_seconds', 'sahko_stage_wall_seconds', 'Wall clock time of the stage.'),
+        ('cpu_seconds', 'sahko_stage_cpu_seconds', 'CPU time used during the stage.'),
+        ('rows', 'sahko_stage_rows', 'Rows processed by the stage.'),
+        ('bytes_read', 'sahko_stage_bytes_read', 'Bytes read by the stage.'),
+        ('bytes_written', 'sahko_stage_bytes_written', 'Bytes written by the stage.'),
+        ('import_seconds', 'sahko_stage_import_seconds', 'Time spent importing modules during the stage.'),
+    ]
+    lines = []
+    for key, metric, help_text in gauges:
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"# HELP {metric} {help_text}")
+        for record in records:
+            labels = f'run_id="{_label(record["run_id"])}",stage="{_label(record["stage"])}"'
+            lines.append(f"{metric}{{{labels}}} {record.get(key, 0)}")
+
+    # HTTP latencies as a summary per stage, host and status
+    http = {}
+    for record in records:
+        for call in record['http']:
+            key = (record['run_id'], record['stage'], call['host'], call['status'])
+            count, total = http.get(key, (0, 0.0))
+            http[key] = (count + 1, total + call['seconds'])
+    lines.append("# TYPE sahko_http_request_seconds summary")
+    lines.append("# HELP sahko_http_request_seconds Latency of HTTP requests made by a stage.")
+    for (run_id, stage_name, host, status), (count, total) in sorted(http.items(), key=str):
+        labels = (f'run_id="{_label(run_id)}",stage="{_label(stage_name)}",'
+                  f'host="{_label(host)}",status="{_label(status)}"')
+        lines.append(f"sahko_http_request_seconds_count{{{labels}}} {count}")
+        lines.append(f"sahko_http_request_seconds_sum{{{labels}}} {round(total, 6)}")
+    lines.append("# EOF")
+    return '\n'.join(lines) + '\n'
+
+
+def read_records(path=None, run_id=None):
+    """Load stage records from a metrics file, limited to one run.
+
+    Without ``run_id`` the run of the last record in the file is used.
+    """
+    path = path or os.getenv('METRICS_FILE') or DEFAULT_METRICS_FILE
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        return []
+    run_id = run_id or records[-1]['run_id']
+    return [record for record in records if record['run_id'] == run_id]
+
+
+def format_summary(records):
+    header = (f"{'Stage':<22} {'Status':<7} {'Wall s':>9} {'CPU s':>9} {'Import s':>9} {'Rows':>9} "
+              f"{'Read KB':>9} {'Written KB':>11} {'HTTP':>5} {'HTTP s':>8}")
+    lines = [header, '-' * len(header)]
+    for record in records:
+        lines.append(
+            f"{record['stage']:<22} {record['status']:<7} {record['wall_seconds']:>9.3f} "
+            f"{record['cpu_seconds']:>9.3f} {record.get('import_seconds', 0):>9.3f} {record['rows']:>9} "
+            f"{record['bytes_read'] / 1024:>9.1f} {record['bytes_written'] / 1024:>11.1f} "
+            f"{record['http_requests']:>5} {record['http_seconds_total']:>8.3f}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show recorded pipeline stage metrics')
+    parser.add_argument('command', choices=['summary', 'openmetrics'], help='Output format')
+    parser.add_argument('--file', help='Metrics file (default: METRICS_FILE or processed/metrics.jsonl)')
+    parser.add_argument('--run-id', help='Run to show (default: the latest run)')
+    args = parser.parse_args(argv)
+
+    records = read_records(args.file, args.run_id)
+    if not records:
+        print("No metrics recorded")
+        return 1
+    if args.command == 'summary':
+        print(format_summary(records))
+    else:
+        sys.stdout.write(render_openmetrics(records))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Incremental parsing of one array inside a large JSON object.
+
+The Elenia yearly response is ``{..., "months": [{...}, {...}, ...], ...}``
+and the hourly values live inside the month objects. ``iter_array_items``
+reads the document in text chunks and yields the array items one at a time,
+so only the month being parsed (plus one chunk) is held in memory:
+
+    for month in iter_array_items(chunks, 'months'):
+        ...
+"""
+import codecs
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+_TOKEN = re.compile(r'[{}\[\]"]')
+_STRING_REST = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+_ARRAY_START = re.compile(r'\s*:\s*\[')
+_MAYBE_ARRAY_START = re.compile(r'\s*(?::\s*)?$')
+_SEPARATOR = re.compile(r'[\s,]*')
+
+
+def decode_chunks(byte_chunks, encoding='utf-8'):
+    """Decode byte chunks to text, keeping multi-byte characters split across chunks intact."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def read_file_chunks(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class _Scanner:
+    """Tracks nesting depth over a growing buffer, skipping string contents."""
+
+    def __init__(self):
+        self.depth = 0
+        self.key_start = None
+
+    def scan(self, buf, pos, until_depth=None):
+        """Advance from ``pos``; returns (pos, key) where key is a string that
+        just ended at depth 1, or (end, None) once ``until_depth`` is reached.
+        Returns (pos, False) when more input is needed."""
+        while True:
+            match = _TOKEN.search(buf, pos)
+            if not match:
+                return len(buf), False
+            char = match.group()
+            if char == '"':
+                rest = _STRING_REST.match(buf, match.end())
+                if not rest:
+                    return match.start(), False
+                pos = rest.end()
+                if until_depth is None and self.depth == 1:
+                    self.key_start = match.start()
+                    return pos, json.loads(buf[match.start():pos])
+                continue
+            self.depth += 1 if char in '{[' else -1
+            pos = match.end()
+            if until_depth is not None and self.depth == until_depth:
+                return pos, None
+
+
+def iter_array_items(chunks, key):
+    """Yield the items of the top-level ``key`` array from text ``chunks``.
+
+    Items must be objects or arrays (the Elenia month entries are). Raises
+    ValueError if the document ends inside the array.
+    """
+    buf = ''
+    pos = 0
+    scanner = _Scanner()
+    phase = 'seek'
+    item_start = None
+    for chunk in chunks:
+        buf += chunk
+        if phase == 'seek':
+            while True:
+                new_pos, found = scanner.scan(buf, pos)
+                if found is False:
+                    pos = new_pos
+                    break
+                if found != key:
+                    pos = new_pos
+                    continue
+                opening = _ARRAY_START.match(buf, new_pos)
+                if opening:
+                    phase = 'items'
+                    buf = buf[opening.end():]
+                    pos = 0
+                    break
+                if _MAYBE_ARRAY_START.match(buf, new_pos):
+                    # Not enough input yet to tell whether the value is an array;
+                    # rescan the key with the next chunk
+                    pos = scanner.key_start
+                    break
+                pos = new_pos
+            if phase == 'seek':
+                # Everything before pos has been scanned and can be dropped
+                buf = buf[pos:]
+                pos = 0
+                continue
+
+        if phase == 'items':
+            while True:
+                if item_start is None:
+                    pos = _SEPARATOR.match(buf, pos).end()
+                    if pos == len(buf):
+                        break
+                    if buf[pos] == ']':
+                        phase = 'done'
+                        break
+                    if buf[pos] not in '{[':
+                        raise ValueError(f"Unsupported item in '{key}' array: {buf[pos:pos + 20]!r}")
+                    item_start = pos
+                    scanner.depth = 0
+                pos, found = scanner.scan(buf, pos, until_depth=0)
+                if found is False:
+                    break
+                yield json.loads(buf[item_start:pos])
+                buf = buf[pos:]
+                pos = 0
+                item_start = None
+            if item_start is not None:
+                # Keep only the unfinished item
+                pos -= item_start
+                buf = buf[item_start:]
+                item_start = 0
+            elif phase == 'items':
+                buf = buf[pos:]
+                pos = 0
+
+        if phase == 'done':
+            return
+
+    if phase == 'items':
+        raise ValueError(f"JSON document ended inside the '{key}' array")
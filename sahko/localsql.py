@@ -0,0 +1,140 @@
+"""Embedded SQL over the local combined data with DuckDB.
+
+``connect()`` opens an in-memory DuckDB database with views over the
+combined CSV files (processed/ and the ones 5-copy-to-db-2.py moved to
+moved_to_db/) or, once ``write_partitions`` has been run, over the
+year-partitioned Parquet copy in processed/parquet/. DuckDB scans the files
+in parallel, so multi-year questions need no database server:
+
+    readings    one row per interval: ts, local_ts, consumption_kwh, price_cents_per_kwh, cost_euros
+    hourly      per local clock hour
+    daily       per local day (the columns of the Dremio cumulative_2025 view)
+    monthly     per local month, with the consumption-weighted price
+    cumulative  daily rows with running consumption and cost per year
+
+duckdb is imported when a connection is opened.
+"""
+import glob
+import os
+
+CSV_PATTERNS = ['processed/combined_data.csv', 'moved_to_db/*.csv']
+PARQUET_DIR = 'processed/parquet'
+TIMEZONE = 'Europe/Helsinki'
+
+VIEWS = {
+    'hourly': """
+        SELECT date_trunc('hour', local_ts) AS hour,
+               SUM(consumption_kwh) AS consumption_kWh,
+               AVG(price_cents_per_kwh) AS avg_price_cents_per_kWh,
+               SUM(cost_euros) AS cost_euros
+        FROM readings
+        GROUP BY 1
+    """,
+    'daily': """
+        SELECT CAST(local_ts AS DATE) AS date,
+               SUM(consumption_kwh) AS daily_consumption_kWh,
+               AVG(price_cents_per_kwh) AS avg_price_cents_per_kWh,
+               SUM(cost_euros) AS total_daily_cost_euros
+        FROM readings
+        GROUP BY 1
+    """,
+    'monthly': """
+        SELECT strftime(local_ts, '%Y-%m') AS month,
+               SUM(consumption_kwh) AS consumption_kWh,
+               SUM(cost_euros) AS cost_euros,
+               AVG(price_cents_per_kwh) AS avg_price_cents_per_kWh,
+               SUM(price_cents_per_kwh * consumption_kwh) / NULLIF(SUM(consumption_kwh), 0) AS weighted_price_cents_per_kWh,
+               COUNT(DISTINCT CAST(local_ts AS DATE)) AS days
+        FROM readings
+        GROUP BY 1
+    """,
+    'cumulative': """
+        SELECT *,
+               SUM(daily_consumption_kWh) OVER (PARTITION BY year(date) ORDER BY date) AS cumulative_consumption_kWh,
+               SUM(total_daily_cost_euros) OVER (PARTITION BY year(date) ORDER BY date) AS cumulative_cost_euros
+        FROM daily
+    """,
+}
+
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def csv_files(patterns=CSV_PATTERNS):
+    return sorted({path for pattern in patterns for path in glob.glob(pattern)})
+
+
+def parquet_files(directory=PARQUET_DIR):
+    return sorted(glob.glob(os.path.join(directory, '**', '*.parquet'), recursive=True))
+
+
+def readings_source(patterns=CSV_PATTERNS, parquet_dir=PARQUET_DIR):
+    """SELECT for the raw rows: Parquet partitions when present, else the CSV files.
+
+    Pass ``parquet_dir=None`` to always read the CSV files.
+
+    The same interval can appear in several CSV files (a re-combined year
+    next to the copy moved to moved_to_db/); the newest file wins.
+    """
+    if parquet_dir and parquet_files(parquet_dir):
+        return f"""
+            SELECT ts, consumption_kwh, price_cents_per_kwh, cost_euros
+            FROM read_parquet({_sql_string(os.path.join(parquet_dir, '**', '*.parquet'))}, hive_partitioning = true)
+        """
+    files = csv_files(patterns)
+    if not files:
+        raise FileNotFoundError(f"No combined data files match {', '.join(patterns)}")
+    file_list = ', '.join(_sql_string(path) for path in files)
+    return f"""
+        SELECT ts, consumption_kwh, price_cents_per_kwh, cost_euros
+        FROM (
+            SELECT strptime(timestamp, '%Y-%m-%dT%H:%M:%S%z') AS ts,
+                   consumption_kWh AS consumption_kwh,
+                   price_cents_per_kWh AS price_cents_per_kwh,
+                   cost_euros,
+                   row_number() OVER (PARTITION BY timestamp ORDER BY filename DESC) AS copy
+            FROM read_csv([{file_list}], header = true, filename = true,
+                          columns = {{'timestamp': 'VARCHAR', 'consumption_kWh': 'DOUBLE',
+                                      'price_cents_per_kWh': 'DOUBLE', 'cost_euros': 'DOUBLE'}})
+        )
+        WHERE copy = 1
+    """
+
+
+def connect(patterns=CSV_PATTERNS, parquet_dir=PARQUET_DIR, threads=None):
+    """In-memory DuckDB connection with the readings, hourly, daily, monthly and cumulative views."""
+    import duckdb
+    conn = duckdb.connect()
+    conn.execute(f"SET TimeZone = {_sql_string(TIMEZONE)}")
+    if threads:
+        conn.execute(f"SET threads = {int(threads)}")
+    conn.execute(f"""
+        CREATE VIEW readings AS
+        SELECT ts, timezone({_sql_string(TIMEZONE)}, ts) AS local_ts, consumption_kwh, price_cents_per_kwh, cost_euros
+        FROM ({readings_source(patterns, parquet_dir)})
+    """)
+    for name, query in VIEWS.items():
+        conn.execute(f"CREATE VIEW {name} AS {query}")
+    return conn
+
+
+def export(conn, sql, path):
+    """Write a query result to CSV, Parquet or JSON, chosen by the file extension."""
+    formats = {'.csv': "FORMAT csv, HEADER true", '.parquet': "FORMAT parquet", '.json': "FORMAT json"}
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in formats:
+        raise ValueError(f"Unsupported export format {extension!r}; use .csv, .parquet or .json")
+    conn.execute(f"COPY ({sql}) TO {_sql_string(path)} ({formats[extension]})")
+
+
+def write_partitions(conn, directory=PARQUET_DIR):
+    """Copy the readings to Parquet partitioned by local year (directory/year=YYYY/).
+
+    ``conn`` should read the CSV files (``connect(parquet_dir=None)``), not
+    the partitions being rewritten.
+    """
+    conn.execute(f"""
+        COPY (SELECT ts, consumption_kwh, price_cents_per_kwh, cost_euros, year(local_ts) AS year FROM readings)
+        TO {_sql_string(directory)} (FORMAT parquet, PARTITION_BY (year), OVERWRITE_OR_IGNORE true)
+    """)
@@ -0,0 +1,125 @@
+"""Precompressed aggregate payloads for the web API.
+
+The combine stage turns the rollups into one small JSON document with the
+daily, monthly, hour-of-day and weekday x hour aggregates, written next to
+gzip (and brotli, when the ``brotli`` package is installed) copies of the
+same bytes. ``manifest.json`` records the sha256 of the JSON as the ETag, so
+server.js can answer ``/api/aggregates`` from the files with
+``If-None-Match`` revalidation and never touches the hourly history.
+
+The document is columnar per level:
+
+    {"format": 1, "watermark": "...", "levels": {"monthly": {"key": [...],
+     "consumption": [...], "cost": [...], "average_price": [...], ...}}}
+"""
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from sahko.rollups import LEVELS, average_price, weighted_price
+
+PAYLOAD_DIR = 'processed/api'
+MANIFEST_FILE = 'manifest.json'
+PAYLOAD_FORMAT = 1
+
+# Decimals kept per column; more would only make the payload bigger
+PRECISION = {
+    'hours': 2,
+    'consumption': 3,
+    'cost': 3,
+    'average_price': 3,
+    'weighted_price': 3,
+    'price_min': 2,
+    'price_max': 2,
+}
+
+
+def _round(value, digits):
+    return None if value is None else round(value, digits)
+
+
+def level_columns(buckets):
+    """Columnar form of one rollup level, keys in sorted order."""
+    keys = sorted(buckets)
+    columns = {'key': keys}
+    for column, digits in PRECISION.items():
+        if column == 'average_price':
+            values = [average_price(buckets[key]) for key in keys]
+        elif column == 'weighted_price':
+            values = [weighted_price(buckets[key]) for key in keys]
+        else:
+            values = [buckets[key][column] for key in keys]
+        columns[column] = [_round(value, digits) for value in values]
+    return columns
+
+
+def build_aggregates(store):
+    """The aggregates document for a ``RollupStore``."""
+    return {
+        'format': PAYLOAD_FORMAT,
+        'watermark': store.watermark,
+        'spot_margin': store.data.get('spot_margin'),
+        'resolution_minutes': store.data.get('resolution_minutes'),
+        'levels': {level: level_columns(store.level(level)) for level in LEVELS},
+    }
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def encoded_variants(body):
+    """The body in each available content encoding."""
+    variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    return variants
+
+
+def write_payload(name, document, directory=PAYLOAD_DIR):
+    """Write ``<name>.json`` plus compressed copies and update the manifest.
+
+    Files are only rewritten when the content hash changes. Returns the
+    manifest entry.
+    """
+    os.makedirs(directory, exist_ok=True)
+    body = json.dumps(document, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()
+
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    entry = manifest.get(name)
+    if entry and entry['etag'] == etag and all(
+            os.path.exists(os.path.join(directory, file)) for file in entry['files'].values()):
+        return entry
+
+    files = {}
+    sizes = {}
+    suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+    for encoding, data in encoded_variants(body).items():
+        file = f"{name}.json{suffixes[encoding]}"
+        _write_atomic(os.path.join(directory, file), data)
+        files[encoding] = file
+        sizes[encoding] = len(data)
+    entry = {
+        'etag': etag,
+        'format': document.get('format'),
+        'files': files,
+        'sizes': sizes,
+        'generated': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
+    manifest[name] = entry
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+    return entry
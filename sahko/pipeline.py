@@ -0,0 +1,212 @@
+"""Dependency-aware stage runner with skip-if-fresh for the pipeline scripts.
+
+A stage is one numbered script's ``main()`` loaded into the current process.
+Stages whose dependencies have finished run concurrently in a thread pool
+(stages marked ``main_thread`` run in the calling thread, e.g. the ones that
+draw with matplotlib). A stage is skipped when the content hashes of its
+input files and the environment values it reads match the last successful
+run recorded in the state file, and its outputs are still in place.
+"""
+import hashlib
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+
+from sahko.instrumentation import stage as instrumented_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = 'processed/pipeline_state.json'
+
+
+class Stage:
+    """One step of the pipeline.
+
+    ``inputs`` and ``outputs`` are file paths (or callables returning one,
+    resolved when the stage is planned). ``env`` names the environment
+    variables whose values change the stage result. Stages with ``max_age``
+    (seconds) have no local inputs, e.g. downloads; they are skipped while
+    their last successful run is younger than that.
+    """
+
+    def __init__(self, name, module, deps=(), inputs=(), outputs=(), env=(),
+                 args=None, max_age=None, main_thread=False):
+        self.name = name
+        self.module = module
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.env = list(env)
+        self.args = args
+        self.max_age = max_age
+        self.main_thread = main_thread
+
+    def input_paths(self):
+        return [path() if callable(path) else path for path in self.inputs]
+
+    def output_paths(self):
+        return [path() if callable(path) else path for path in self.outputs]
+
+    def run(self):
+        module = importlib.import_module(self.module)
+        if self.args is None:
+            return module.main()
+        return module.main(self.args)
+
+
+class StateStore:
+    """Last successful run per stage, plus a (size, mtime) -> hash cache."""
+
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        else:
+            self.data = {}
+        self.data.setdefault('stages', {})
+        self.data.setdefault('file_hashes', {})
+
+    def file_hash(self, path):
+        """Return the sha256 of a file, or None if it does not exist."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            cached = self.data['file_hashes'].get(path)
+        if cached and cached['signature'] == signature:
+            return cached['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        with self._lock:
+            self.data['file_hashes'][path] = {'signature': signature, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def stage_key(self, stage):
+        """Hash of everything the stage result depends on."""
+        digest = hashlib.sha256(stage.name.encode())
+        for path in stage.input_paths():
+            digest.update(f"{path}={self.file_hash(path)}".encode())
+        for name in stage.env:
+            digest.update(f"{name}={os.getenv(name, '')}".encode())
+        digest.update(json.dumps(stage.args).encode())
+        return digest.hexdigest()
+
+    def is_fresh(self, stage, key):
+        with self._lock:
+            last = self.data['stages'].get(stage.name)
+        if not last or last['key'] != key:
+            return False
+        for path in stage.output_paths():
+            if self.file_hash(path) != last['outputs'].get(path):
+                return False
+        if stage.max_age is not None:
+            return time.time() - last['finished_at'] < stage.max_age
+        return True
+
+    def record_success(self, stage, key):
+        outputs = {path: self.file_hash(path) for path in stage.output_paths()}
+        with self._lock:
+            self.data['stages'][stage.name] = {
+                'key': key,
+                'finished_at': time.time(),
+                'finished': datetime.now(timezone.utc).isoformat(),
+                'outputs': outputs,
+            }
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            text = json.dumps(self.data, indent=2)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+
+
+def run_pipeline(stages, state, force=(), max_workers=4):
+    """Run ``stages`` respecting their dependencies.
+
+    ``force`` is a collection of stage names to run even when fresh (use
+    ``{'all'}`` for every stage). Returns a dict of stage name to one of
+    'ran', 'skipped', 'failed' or 'blocked'.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    # Dependencies outside the selected stages are treated as satisfied
+    deps = {stage.name: [dep for dep in stage.deps if dep in by_name] for stage in stages}
+    results = {}
+    keys = {}
+
+    def execute(stage):
+        key = state.stage_key(stage)
+        keys[stage.name] = key
+        if stage.name not in force and 'all' not in force and state.is_fresh(stage, key):
+            logger.info(f"Skipping {stage.name}: inputs unchanged since last successful run")
+            return 'skipped'
+        logger.info(f"Running {stage.name} ({stage.module})")
+        try:
+            code = stage.run()
+            if code not in (None, 0):
+                logger.error(f"Stage {stage.name} returned status {code}")
+                return 'failed'
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                logger.error(f"Stage {stage.name} exited with status {e.code}")
+                return 'failed'
+        except Exception:
+            logger.exception(f"Stage {stage.name} failed")
+            return 'failed'
+        # Inputs may have been moved away by the stage; key stays as planned
+        state.record_success(stage, key)
+        state.save()
+        return 'ran'
+
+    with instrumented_stage("pipeline") as metrics, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while len(results) < len(stages):
+            progressed = False
+            main_thread = []
+            for stage in stages:
+                if stage.name in results or stage.name in running.values():
+                    continue
+                dep_results = [results.get(dep) for dep in deps[stage.name]]
+                if any(result in ('failed', 'blocked') for result in dep_results):
+                    logger.warning(f"Not running {stage.name}: a dependency failed")
+                    results[stage.name] = 'blocked'
+                    progressed = True
+                    continue
+                if any(result is None for result in dep_results):
+                    continue
+                if stage.main_thread:
+                    main_thread.append(stage)
+                else:
+                    running[pool.submit(execute, stage)] = stage.name
+                progressed = True
+            # Every ready pool stage is submitted before the main-thread ones
+            # start, so they run alongside instead of waiting for them
+            for stage in main_thread:
+                results[stage.name] = execute(stage)
+            if progressed:
+                continue
+            if not running:
+                raise RuntimeError("Pipeline stages have a dependency cycle")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+        for name, result in results.items():
+            metrics.set(name, result)
+    state.save()
+    return results
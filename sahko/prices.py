@@ -0,0 +1,360 @@
+"""Spot price providers with a local cache, failover and a versioned VAT schedule.
+
+Two providers deliver Finnish day-ahead prices as (epoch, snt/kWh without
+VAT):
+
+* ``VattenfallProvider``: any range of days, one request per range;
+* ``PorssisahkoProvider``: only the ~48 hours of latest-prices.json, whose
+  VAT is taken back out with the schedule below.
+
+``PriceClient`` splits a range into calendar months and fetches the months
+missing from the cache concurrently. Each month goes to the providers in
+order. Gateway errors (429/5xx) and dropped connections are retried with
+backoff first; a provider that still errors or does not answer within its
+timeout counts as a failure on its circuit breaker (sahko/ratelimit.py),
+and after repeated failures it is skipped for a while, so one slow or dead
+source does not hold up every month. Months that fail are reported
+together after the others have been cached:
+
+    client = PriceClient()
+    epoch, prices = client.prices('2022-01-01', '2024-12-31', workers=6)
+    with_vat(epoch, prices)
+
+The cache (``PriceStore``, one JSON file per month in downloads/prices/)
+holds prices without VAT. Past months that were complete are never fetched
+again; others are refreshed once older than PRICE_CACHE_MAX_AGE seconds.
+When every provider fails, a stale cached month is used with a warning.
+VAT is added only at the end, so a schedule correction needs no refetch.
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+from sahko.instrumentation import timed_request
+from sahko.ratelimit import CircuitBreaker, CircuitOpenError
+from sahko.timeaxis import HELSINKI, parse_local
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Both URLs can point at the local stand-in (api_standin.py) for offline runs
+VATTENFALL_API_URL = os.getenv('VATTENFALL_API_URL', 'https://www.vattenfall.fi/api/price/spot').rstrip('/')
+PORSSISAHKO_API_URL = os.getenv('PORSSISAHKO_API_URL', 'https://api.porssisahko.net/v1').rstrip('/')
+PRICE_CACHE_DIR = os.getenv('PRICE_CACHE_DIR', 'downloads/prices')
+PRICE_CACHE_MAX_AGE = float(os.getenv('PRICE_CACHE_MAX_AGE', 3600))
+PRICE_TIMEOUT = float(os.getenv('PRICE_TIMEOUT', 20))  # seconds before a provider counts as down
+PRICE_RETRIES = int(os.getenv('PRICE_RETRIES', 4))  # retries of one request on gateway or connection errors
+RETRY_STATUSES = (429, 502, 503, 504)
+
+HEADERS = {
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.182 Safari/537.36"
+}
+
+# Finnish VAT on electricity as (first local day, rate). Bump the version
+# whenever an entry is added or corrected.
+VAT_SCHEDULE_VERSION = 2
+VAT_SCHEDULE = (
+    ('2013-01-01', 0.24),
+    ('2022-12-01', 0.10),  # temporary cut for the winter 2022-2023
+    ('2023-05-01', 0.24),
+    ('2024-09-01', 0.255),
+)
+
+
+class PriceSourceError(RuntimeError):
+    """No provider could deliver prices for a range."""
+
+
+def vat_rates(epoch):
+    """VAT rate in effect at each instant (epoch seconds)."""
+    starts = parse_local([f"{day}T00:00:00" for day, _ in VAT_SCHEDULE])
+    rates = np.array([rate for _, rate in VAT_SCHEDULE])
+    index = np.searchsorted(starts, np.asarray(epoch, dtype=np.int64), side='right') - 1
+    return rates[np.clip(index, 0, len(rates) - 1)]
+
+
+def with_vat(epoch, prices, decimals=2):
+    """Prices without VAT to prices with the VAT of their time, rounded like the Vattenfall CSV."""
+    return np.round(np.asarray(prices, dtype=np.float64) * (1 + vat_rates(epoch)), decimals)
+
+
+def _day(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def _local_start(day):
+    return int(parse_local([f"{day}T00:00:00"])[0])
+
+
+def month_ranges(first_day, last_day):
+    """(first, last) local days of every calendar month touching the range."""
+    first_day, last_day = _day(first_day), _day(last_day)
+    months = []
+    month = first_day.replace(day=1)
+    while month <= last_day:
+        following = (month + timedelta(days=32)).replace(day=1)
+        months.append((month, following - timedelta(days=1)))
+        month = following
+    return months
+
+
+def missing_hours(epoch, first_day, last_day, now=None):
+    """Hours of the range (up to the end of today) that have no price."""
+    now = time.time() if now is None else now
+    today = datetime.fromtimestamp(now, HELSINKI).date()
+    end_day = min(_day(last_day), today) + timedelta(days=1)
+    start = _local_start(_day(first_day))
+    end = _local_start(end_day)
+    if end <= start:
+        return 0
+    expected = np.arange(start // 3600, end // 3600)
+    return int(np.count_nonzero(~np.isin(expected, np.asarray(epoch, dtype=np.int64) // 3600)))
+
+
+def _get(url, timeout, retries):
+    """GET a provider URL, retrying gateway errors and dropped connections with backoff.
+
+    Timeouts are not retried: a provider that is too slow counts as down.
+    Returns the last response.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = timed_request(requests.request, 'GET', url, headers=HEADERS, timeout=timeout)
+        except requests.exceptions.ConnectionError as e:
+            if attempt == retries:
+                raise
+            wait_time = 2 ** attempt
+            logger.warning(f"Request to {url} failed, retry {attempt + 1}/{retries} after {wait_time} seconds: {e}")
+            time.sleep(wait_time)
+            continue
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            retry_after = response.headers.get('Retry-After')
+            wait_time = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+            logger.warning(f"Got {response.status_code} from {url}, retry {attempt + 1}/{retries} "
+                           f"after {wait_time:g} seconds")
+            response.close()
+            time.sleep(wait_time)
+            continue
+        return response
+
+
+def _clip(epoch, prices, first_day, last_day):
+    start = _local_start(_day(first_day))
+    end = _local_start(_day(last_day) + timedelta(days=1))
+    keep = (epoch >= start) & (epoch < end)
+    return epoch[keep], prices[keep]
+
+
+def _merge(parts):
+    # Later parts win where instants repeat
+    epoch = np.concatenate([part[0] for part in parts]) if parts else np.empty(0, dtype=np.int64)
+    prices = np.concatenate([part[1] for part in parts]) if parts else np.empty(0)
+    order = np.argsort(epoch, kind='stable')
+    epoch, prices = epoch[order], prices[order]
+    keep = np.append(epoch[1:] != epoch[:-1], True)
+    return epoch[keep].astype(np.int64), prices[keep]
+
+
+class VattenfallProvider:
+    """Vattenfall's spot price API: any day range, prices without VAT."""
+
+    name = 'vattenfall'
+
+    def __init__(self, base_url=VATTENFALL_API_URL, timeout=PRICE_TIMEOUT, retries=PRICE_RETRIES):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+
+    def fetch(self, first_day, last_day):
+        url = f"{self.base_url}/{first_day}/{last_day}?lang=fi"
+        logger.info(f"Loading prices {first_day} - {last_day} from {url}")
+        response = _get(url, self.timeout, self.retries)
+        if response.status_code != 200:
+            raise PriceSourceError(f"status {response.status_code}")
+        rows = response.json()
+        epoch = parse_local([row['timeStamp'][:19] for row in rows])
+        return epoch, np.array([row['value'] for row in rows], dtype=np.float64)
+
+
+class PorssisahkoProvider:
+    """porssisahko.net latest-prices.json: the last ~48 hours, VAT included."""
+
+    name = 'porssisahko'
+
+    def __init__(self, base_url=PORSSISAHKO_API_URL, timeout=PRICE_TIMEOUT, retries=PRICE_RETRIES):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+
+    def fetch(self, first_day, last_day):
+        url = f"{self.base_url}/latest-prices.json"
+        response = _get(url, self.timeout, self.retries)
+        if response.status_code != 200:
+            raise PriceSourceError(f"status {response.status_code}")
+        entries = response.json()['prices']
+        # startDate is UTC ('2025-01-01T22:00:00.000Z')
+        epoch = np.array([entry['startDate'][:19] for entry in entries], dtype='datetime64[s]').astype(np.int64)
+        prices = np.array([entry['price'] for entry in entries], dtype=np.float64) / (1 + vat_rates(epoch))
+        epoch, prices = _merge([(epoch, prices)])
+        return _clip(epoch, prices, first_day, last_day)
+
+
+def default_providers():
+    return [VattenfallProvider(), PorssisahkoProvider()]
+
+
+class PriceStore:
+    """Prices without VAT cached as one JSON file per month."""
+
+    def __init__(self, directory=PRICE_CACHE_DIR, max_age=PRICE_CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+
+    def path(self, month):
+        return os.path.join(self.directory, f"{month:%Y-%m}.json")
+
+    def load(self, month):
+        try:
+            with open(self.path(month), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, month, epoch, prices, source, complete):
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {'month': f"{month:%Y-%m}", 'source': source, 'complete': complete, 'fetched_at': time.time(),
+                 'epoch': epoch.tolist(), 'price': prices.tolist()}
+        path = self.path(month)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(f"{path}.tmp", path)
+        return entry
+
+    def fresh(self, entry):
+        return entry['complete'] or time.time() - entry['fetched_at'] < self.max_age
+
+
+def _entry_arrays(entry):
+    return np.array(entry['epoch'], dtype=np.int64), np.array(entry['price'], dtype=np.float64)
+
+
+class PriceClient:
+    """Cached, concurrent, failing-over access to the price providers."""
+
+    def __init__(self, providers=None, store=None, failure_threshold=2, reset_timeout=60):
+        self.providers = providers if providers is not None else default_providers()
+        self.store = store if store is not None else PriceStore()
+        self.breakers = {provider.name: CircuitBreaker(failure_threshold, reset_timeout)
+                         for provider in self.providers}
+
+    def fetch_range(self, first_day, last_day):
+        """Prices of a day range from the first provider that covers it, bypassing the cache.
+
+        Returns (epoch, prices without VAT, source, complete). Falls back to
+        the most complete answer when no provider covers every hour.
+        """
+        best = None
+        errors = []
+        for provider in self.providers:
+            breaker = self.breakers[provider.name]
+            try:
+                breaker.before_request(block=False)
+            except CircuitOpenError as e:
+                errors.append(f"{provider.name}: {e}")
+                continue
+            try:
+                epoch, prices = provider.fetch(first_day, last_day)
+            except (requests.exceptions.RequestException, PriceSourceError, ValueError, KeyError) as e:
+                breaker.record_failure()
+                logger.warning(f"{provider.name} failed for {first_day} - {last_day}: {e}")
+                errors.append(f"{provider.name}: {e}")
+                continue
+            breaker.record_success()
+            if len(epoch) and not missing_hours(epoch, first_day, last_day):
+                return epoch, prices, provider.name, True
+            if best is None or len(epoch) > len(best[0]):
+                best = (epoch, prices, provider.name)
+        if best is None or not len(best[0]):
+            raise PriceSourceError(f"No prices for {first_day} - {last_day}: {'; '.join(errors) or 'no data'}")
+        return (*best, False)
+
+    def _month(self, month, last, cached):
+        try:
+            epoch, prices, source, complete = self.fetch_range(month, last)
+        except PriceSourceError:
+            if cached is None:
+                raise
+            logger.warning(f"Using cached prices of {month:%Y-%m} from {cached['source']}; every provider failed")
+            return cached
+        if cached is not None and not complete:
+            # Keep cached hours the partial answer does not have
+            epoch, prices = _merge([_entry_arrays(cached), (epoch, prices)])
+            complete = not missing_hours(epoch, month, last)
+        # Only a month that is over can be complete for good
+        complete = complete and _local_start(last + timedelta(days=1)) <= time.time()
+        return self.store.save(month, epoch, prices, source, complete)
+
+    def prices(self, first_day, last_day, workers=4):
+        """(epoch, snt/kWh without VAT) of local days first_day..last_day inclusive.
+
+        Every month is attempted; months no provider could deliver raise one
+        PriceSourceError at the end, after the others have been cached, so a
+        rerun only fetches the failed ones.
+        """
+        entries = {}
+        failed = []
+        todo = []
+        for month, last in month_ranges(first_day, last_day):
+            cached = self.store.load(month)
+            if cached is not None and self.store.fresh(cached):
+                entries[month] = cached
+            else:
+                todo.append((month, last, cached))
+        if todo:
+            logger.info(f"Fetching {len(todo)} months of prices with {min(workers, len(todo))} workers")
+            with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='prices') as pool:
+                # Workers report into the running stage's metrics
+                futures = {month: pool.submit(contextvars.copy_context().run, self._month, month, last, cached)
+                           for month, last, cached in todo}
+                for month, future in futures.items():
+                    try:
+                        entries[month] = future.result()
+                    except PriceSourceError as e:
+                        failed.append(str(e))
+        if failed:
+            raise PriceSourceError(f"{len(failed)} of {len(todo)} months failed (the others are cached): "
+                                   + '; '.join(failed))
+        epoch, prices = _merge([_entry_arrays(entries[month]) for month in sorted(entries)])
+        return _clip(epoch, prices, first_day, last_day)
+
+
+def current_price(client=None, now=None):
+    """Spot price with VAT (snt/kWh) of the interval running now, or None.
+
+    porssisahko answers first here: its small latest-prices.json covers today.
+    """
+    client = client or PriceClient(providers=[PorssisahkoProvider(), VattenfallProvider()])
+    now = time.time() if now is None else now
+    today = datetime.fromtimestamp(now, HELSINKI).date()
+    try:
+        epoch, prices, _, _ = client.fetch_range(today, today)
+    except PriceSourceError as e:
+        logger.error(str(e))
+        return None
+    index = int(np.searchsorted(epoch, now, side='right')) - 1
+    if index < 0:
+        return None
+    step = min(int(epoch[index + 1] - epoch[index]), 3600) if index + 1 < len(epoch) else 3600
+    if now >= epoch[index] + step:
+        return None
+    return float(with_vat(epoch[index:index + 1], prices[index:index + 1])[0])
@@ -0,0 +1,144 @@
+"""Client-side rate limiting and a circuit breaker for the Elenia API.
+
+Several worker threads share one ``TokenBucket``: every request takes a
+token, tokens refill at ``rate`` per second up to ``burst``, so the
+combined request rate stays under the API's limit however many workers
+there are. A ``CircuitBreaker`` counts consecutive failures (504s, 429s,
+connection errors); after ``failure_threshold`` of them it opens and all
+workers pause for ``reset_timeout`` seconds, then a single probe request
+decides whether traffic resumes or the pause starts again:
+
+    limiter = TokenBucket(rate=2, burst=4)
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    limiter.acquire()
+    breaker.before_request()
+    response = ...
+    breaker.record_success() if response.ok else breaker.record_failure()
+
+Both are thread-safe. ``clock`` and ``sleep`` can be replaced in tests.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised by a non-blocking ``before_request`` while the circuit is open."""
+
+
+class TokenBucket:
+    """Blocking token bucket: ``rate`` tokens per second, at most ``burst`` stored."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1.0):
+        """Take tokens if available right now. Returns True on success."""
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1.0):
+        """Wait until tokens are available and take them. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(self._clock())
+                # A refill computed from float clocks can fall a hair short
+                if self._tokens >= tokens - 1e-9:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def penalize(self, seconds):
+        """Drain the bucket so nobody sends for ``seconds`` (e.g. a Retry-After header)."""
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, lets one probe through after a cool-down."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic, sleep=time.sleep):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._sleep = sleep
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def before_request(self, block=True):
+        """Wait (or raise CircuitOpenError) until a request may be sent."""
+        while True:
+            with self._lock:
+                if self._state == CLOSED:
+                    return
+                if self._state == OPEN:
+                    remaining = self._opened_at + self.reset_timeout - self._clock()
+                    if remaining <= 0:
+                        self._state = HALF_OPEN
+                        self._probing = False
+                        continue
+                elif not self._probing or self._clock() - self._probe_started > self.reset_timeout:
+                    # Half open: this request is the probe (or replaces one that never reported back)
+                    self._probing = True
+                    self._probe_started = self._clock()
+                    return
+                else:
+                    # Another thread is probing; check back shortly
+                    remaining = min(1.0, self.reset_timeout)
+            if not block:
+                raise CircuitOpenError(f"Circuit open, retry in {remaining:.1f} s")
+            self._sleep(remaining)
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Circuit closed: requests succeed again")
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"Circuit open after {self._failures} consecutive failures; "
+                                   f"pausing requests for {self.reset_timeout:g} s")
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probing = False
@@ -0,0 +1,95 @@
+"""Loaders for the downloaded Elenia consumption and Vattenfall price files.
+
+Both return ``(epoch, values, step)``: sorted interval start times in epoch
+seconds, the values as float64 and the step of the series in seconds. A
+file that switches resolution part way (hourly to 15-minute) comes back at
+its finest step, with the longer intervals split evenly (energy) or
+repeated (prices).
+"""
+import csv
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from sahko.jsonstream import decode_chunks, iter_array_items, read_file_chunks
+from sahko.timeaxis import parse_local, to_uniform_step
+
+# Per-month value lists in order of preference, with their step in minutes.
+# Netted values win over plain ones; 15-minute lists over hourly ones.
+CONSUMPTION_KEYS = [
+    ('quarter_hourly_values_netted', 15),
+    ('quarter_hourly_values', 15),
+    ('hourly_values_netted', 60),
+    ('hourly_values', 60),
+]
+
+
+def consumption_values(month):
+    """Pick the value list and its step (minutes) for one month entry."""
+    for key, minutes in CONSUMPTION_KEYS:
+        if month.get(key):
+            return month[key], minutes
+    return None, None
+
+
+def consumption_records(months, year):
+    """Local timestamp strings and kWh values of Elenia ``months``, as found in the file."""
+    timestamps = []
+    values = []
+    for month in months:
+        month_values, minutes = consumption_values(month)
+        if not month_values:
+            continue
+        for index, entry in enumerate(month_values):
+            if 't' in entry:
+                timestamps.append(entry['t'])
+            else:
+                # If no timestamp, construct it from the month data
+                # Assuming the values are in order starting from the beginning of the month
+                timestamp = datetime(int(year), month['month'], 1) + timedelta(minutes=index * minutes)
+                timestamps.append(timestamp.strftime('%Y-%m-%dT%H:%M:%S'))
+            values.append(entry['v'])
+    return timestamps, np.array(values, dtype=np.float64) / 1000  # Convert to kWh
+
+
+def consumption_from_months(months, year):
+    """Turn Elenia ``months`` entries into epoch seconds and kWh arrays."""
+    timestamps, kwh = consumption_records(months, year)
+    return sorted_series(parse_local(timestamps), kwh, 'sum')
+
+
+def iter_months(filename):
+    # Months are parsed one at a time rather than loading the whole document
+    return iter_array_items(decode_chunks(read_file_chunks(filename)), 'months')
+
+
+def load_consumption(filename, year):
+    return consumption_from_months(iter_months(filename), year)
+
+
+def price_records(filename):
+    """Local timestamp strings and prices (snt/kWh) of a Vattenfall CSV, in file order."""
+    timestamps = []
+    values = []
+    with open(filename, 'r') as f:
+        reader = csv.DictReader(f, delimiter=';')
+        for row in reader:
+            timestamps.append(row['timeStamp'])
+            values.append(float(row['value']))
+    return timestamps, np.array(values, dtype=np.float64)
+
+
+def load_prices(filename):
+    """Load a Vattenfall price CSV (semicolon separated, VAT included)."""
+    timestamps, values = price_records(filename)
+    return sorted_series(parse_local(timestamps), values, 'mean')
+
+
+def sorted_series(epoch, values, how):
+    """Sort by time, drop repeated instants and bring to a uniform step."""
+    order = np.argsort(epoch, kind='stable')
+    epoch = epoch[order]
+    values = values[order]
+    # A repeated instant keeps its last value
+    keep = np.append(epoch[1:] != epoch[:-1], True)
+    return to_uniform_step(epoch[keep], values[keep], how)
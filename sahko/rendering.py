@@ -0,0 +1,137 @@
+"""Chart helpers that keep drawing time flat as the history grows.
+
+A line cannot show more points than its axes have pixel columns, and a
+scatter of tens of thousands of hours is a solid blob. So:
+
+* ``plot_line`` downsamples to a point budget taken from the axes' size in
+  pixels, with LTTB (largest triangle three buckets; keeps the visual
+  shape) or min-max per bucket (keeps every spike, for costs and peaks);
+* ``plot_bars`` draws long bar series as a filled min-max envelope;
+* ``density`` draws a plain scatter for small inputs and a hexbin of
+  counts once there are more points than can be told apart.
+
+Matplotlib is only touched through the axes passed in. x may be numbers,
+datetimes or a pandas Series/Index; points with a missing y are dropped.
+"""
+import numpy as np
+
+POINTS_PER_PIXEL = 1.0
+SCATTER_LIMIT = 5000
+HEX_PIXELS = 12
+
+
+def point_budget(ax, points_per_pixel=POINTS_PER_PIXEL):
+    """Number of points worth drawing along the x axis of ``ax``."""
+    fig = ax.get_figure()
+    pixels = ax.get_position().width * fig.get_figwidth() * fig.dpi
+    return max(int(pixels * points_per_pixel), 3)
+
+
+def _numeric(values):
+    """Float view of x for the bucket arithmetic (datetimes as nanoseconds)."""
+    array = np.asarray(getattr(values, 'values', values))
+    if array.dtype.kind == 'O':
+        # Aware datetimes carry their own offset; datetime.date (from .dt.date) does not
+        if len(array) and hasattr(array[0], 'timestamp'):
+            return np.array([value.timestamp() for value in array], dtype=float)
+        array = array.astype('datetime64[ns]')
+    if array.dtype.kind == 'M':
+        return array.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return array.astype(float)
+
+
+def _take(values, indices):
+    # Series.take is positional too, and pandas keeps the index and dtype
+    if hasattr(values, 'take'):
+        return values.take(indices)
+    return np.asarray(values)[indices]
+
+
+def lttb(x, y, budget):
+    """Indices of the ``budget`` points LTTB keeps from (x, y), in order."""
+    n = len(y)
+    if budget >= n or budget < 3:
+        return np.arange(n)
+    # First and last points are kept; the rest is split into budget - 2 buckets
+    edges = np.linspace(1, n - 1, budget - 1).astype(np.int64)
+    keep = np.empty(budget, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    previous = 0
+    for bucket in range(budget - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Third vertex: the average of the next bucket (the last point for the last bucket)
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+            next_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        px, py = x[previous], y[previous]
+        areas = np.abs((px - next_x) * (y[start:end] - py) - (px - x[start:end]) * (next_y - py))
+        previous = start + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+    return keep
+
+
+def minmax(x, y, budget):
+    """Indices of the lowest and highest point of each of ``budget // 2`` buckets, in order."""
+    n = len(y)
+    buckets = max(budget // 2, 1)
+    if budget >= n:
+        return np.arange(n)
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.append(starts[1:], n)
+    return np.unique(np.concatenate([order[starts], order[ends - 1]]))
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample(x, y, budget, method='lttb'):
+    """(x, y) reduced to at most ``budget`` points with ``method`` ('lttb' or 'minmax')."""
+    values = np.asarray(getattr(y, 'values', y), dtype=float)
+    present = np.flatnonzero(~np.isnan(values))
+    xs = _numeric(x)[present]
+    indices = present[METHODS[method](xs, values[present], budget)]
+    return _take(x, indices), _take(y, indices)
+
+
+def plot_line(ax, x, y, method='lttb', budget=None, **kwargs):
+    """``ax.plot`` of a downsampled series."""
+    budget = budget or point_budget(ax)
+    if len(y) > budget:
+        x, y = downsample(x, y, budget, method)
+    return ax.plot(x, y, **kwargs)
+
+
+def plot_bars(ax, x, y, budget=None, **kwargs):
+    """``ax.bar`` for short series; a min-max envelope when bars would be under a pixel wide."""
+    budget = budget or point_budget(ax)
+    if len(y) <= budget:
+        return ax.bar(x, y, **kwargs)
+    kwargs.pop('width', None)
+    x, y = downsample(x, y, budget, 'minmax')
+    return ax.fill_between(x, y, step='mid', linewidth=0, **kwargs)
+
+
+def density(ax, x, y, gridsize=None, limit=SCATTER_LIMIT, colorbar=True, **kwargs):
+    """Scatter of (x, y), or a hexbin of point counts above ``limit`` points.
+
+    The hexagon size follows the axes' size in pixels (about HEX_PIXELS
+    across), so the image does not get busier as rows are added.
+    """
+    x = np.asarray(getattr(x, 'values', x), dtype=float)
+    y = np.asarray(getattr(y, 'values', y), dtype=float)
+    present = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[present], y[present]
+    if len(x) <= limit:
+        return ax.scatter(x, y, **kwargs)
+    kwargs.pop('alpha', None)
+    gridsize = gridsize or max(point_budget(ax) // HEX_PIXELS, 10)
+    mesh = ax.hexbin(x, y, gridsize=gridsize, bins='log', mincnt=1, cmap=kwargs.pop('cmap', 'viridis'), **kwargs)
+    if colorbar:
+        ax.get_figure().colorbar(mesh, ax=ax, label='count (log scale)')
+    return mesh
@@ -0,0 +1,190 @@
+"""Bootstrap risk of a spot contract against a fixed price offer.
+
+One realized year says little about how a spot contract could have gone.
+Here the household's load profile is kept and the prices are resampled:
+history (every cached Vattenfall price file) is cut into blocks, whole
+weeks starting on Monday or calendar months, and each scenario draws for
+every block of the load year a historical block from the same season
+(weeks within ``window`` weeks of the year, or the same calendar month).
+Weeks keep their weekday and hour pattern, so price peaks still meet the
+load peaks they would meet in reality. Load and prices are compared at the
+load's interval (hours or quarter hours).
+
+The cost of every (load block, history block) pair is computed once as a
+matrix product, so a scenario is a sum of ``blocks`` table lookups and
+100,000 scenarios take well under a second; batches run in a process pool
+with independent random streams.
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sahko.raw import load_prices
+from sahko.timeaxis import resample, utc_offsets
+
+PRICE_FILES = 'downloads/vattenfall_hinnat_*.csv'
+BLOCK_DAYS = {'week': 7, 'month': 31}
+# Every day of a block has room for 25 hours: the 25th takes the second pass
+# over the wall-clock hour repeated in October (03:00 in Finland)
+DAY_HOURS = 25
+REPEATED_HOUR = 3
+SEASON_WINDOW = 2  # weeks
+BATCH_SIZE = 10000
+
+
+def load_price_history(pattern=PRICE_FILES, interval_hours=1.0):
+    """Spot prices (epoch, snt/kWh) from every cached price file, one per ``interval_hours``."""
+    target_step = int(round(interval_hours * 3600))
+    epochs = []
+    values = []
+    for filename in sorted(glob.glob(pattern)):
+        epoch, prices, step = load_prices(filename)
+        epoch, prices = resample(epoch, prices, step, target_step, 'mean')
+        epochs.append(epoch)
+        values.append(prices)
+    if not epochs:
+        raise FileNotFoundError(f"No price files match {pattern}")
+    epoch, index = np.unique(np.concatenate(epochs), return_index=True)
+    return epoch, np.concatenate(values)[index]
+
+
+def block_length(block, interval_hours=1.0):
+    """Positions in one block of ``interval_hours`` rows."""
+    return BLOCK_DAYS[block] * DAY_HOURS * int(round(1 / interval_hours))
+
+
+def block_positions(epoch, block, interval_hours=1.0):
+    """Block id, position within the block and season key of each row (local time).
+
+    ``epoch`` is sorted with one row per ``interval_hours``. A row's position
+    is its day in the block and its wall-clock slot of the day; rows of the
+    repeated October hour that come second go to the day's 25th hour.
+    Week blocks start on Monday 00:00; their season key is the week of the
+    year. Month blocks are calendar months keyed by month number.
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    local = epoch + utc_offsets(epoch)
+    per_hour = int(round(1 / interval_hours))
+    days = local // 86400
+    slots = local % 86400 // int(round(interval_hours * 3600))
+    # A local time at or before one already passed is the second pass over the repeated hour
+    repeated = np.zeros(len(local), dtype=bool)
+    repeated[1:] = local[1:] <= np.maximum.accumulate(local)[:-1]
+    slots = np.where(repeated, 24 * per_hour + slots % per_hour, slots)
+    day_slots = DAY_HOURS * per_hour
+    if block == 'week':
+        # 1970-01-05 was a Monday
+        week_start = days - (days - 4) % 7
+        position = (days - week_start) * day_slots + slots
+        year_start = week_start.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+        season = (week_start - year_start) // 7
+        return week_start, position, season
+    month = days.astype('datetime64[D]').astype('datetime64[M]')
+    position = (days - month.astype('datetime64[D]').astype(np.int64)) * day_slots + slots
+    return month.astype(np.int64), position, month.astype(np.int64) % 12
+
+
+def _block_matrix(block_ids, positions, values, length):
+    """(unique block ids, blocks x length matrix of values, NaN where missing)."""
+    ids, rows = np.unique(block_ids, return_inverse=True)
+    matrix = np.full((len(ids), length), np.nan)
+    matrix[rows, positions] = values
+    return ids, matrix
+
+
+def _fill_repeated_hour(price_matrix, per_hour):
+    # Days without a repeated hour price the load's second pass like the first
+    days = price_matrix.reshape(len(price_matrix), -1, DAY_HOURS * per_hour)
+    second = days[:, :, 24 * per_hour:]
+    first = days[:, :, REPEATED_HOUR * per_hour:(REPEATED_HOUR + 1) * per_hour]
+    np.copyto(second, first, where=np.isnan(second))
+
+
+def block_costs(load_epoch, consumption, price_epoch, prices, block='week', window=SEASON_WINDOW,
+                interval_hours=1.0):
+    """Spot energy cost (EUR, without margin) of each load block under each history block.
+
+    Load and prices both have one row per ``interval_hours``. Returns
+    (costs, candidates): costs is load blocks x history blocks, candidates
+    a boolean matrix of the history blocks a load block may draw (same
+    season and no missing price where the load has data).
+    """
+    length = block_length(block, interval_hours)
+    load_ids, load_position, load_season = block_positions(load_epoch, block, interval_hours)
+    price_ids, price_position, price_season = block_positions(price_epoch, block, interval_hours)
+
+    _, load_matrix = _block_matrix(load_ids, load_position, consumption, length)
+    history_ids, price_matrix = _block_matrix(price_ids, price_position, prices, length)
+    _fill_repeated_hour(price_matrix, int(round(1 / interval_hours)))
+    load_present = ~np.isnan(load_matrix)
+    price_missing = np.isnan(price_matrix)
+
+    costs = np.nan_to_num(load_matrix) @ np.nan_to_num(price_matrix).T / 100
+    complete = (load_present.astype(np.int64) @ price_missing.T.astype(np.int64)) == 0
+
+    # Season key of each block (taken from its first hour)
+    _, first = np.unique(load_ids, return_index=True)
+    load_keys = load_season[first]
+    _, first = np.unique(price_ids, return_index=True)
+    history_keys = price_season[first]
+    if block == 'week':
+        distance = np.abs(load_keys[:, None] - history_keys[None, :])
+        distance = np.minimum(distance, 53 - distance)
+        same_season = distance <= window
+    else:
+        same_season = load_keys[:, None] == history_keys[None, :]
+    return costs, complete & same_season
+
+
+def _simulate_batch(args):
+    costs, candidates, scenarios, seed = args
+    rng = np.random.default_rng(seed)
+    total = np.zeros(scenarios)
+    for block in range(costs.shape[0]):
+        choices = np.flatnonzero(candidates[block])
+        drawn = choices[rng.integers(0, len(choices), scenarios)]
+        total += costs[block, drawn]
+    return total
+
+
+def simulate(costs, candidates, scenarios=100000, seed=None, workers=None, batch_size=BATCH_SIZE):
+    """Scenario spot energy costs (EUR), one per scenario."""
+    missing = np.flatnonzero(~candidates.any(axis=1))
+    if len(missing):
+        raise ValueError(f"{len(missing)} load blocks have no complete history block in their season; "
+                         "cache more price years or widen the window")
+    sizes = [batch_size] * (scenarios // batch_size) + ([scenarios % batch_size] if scenarios % batch_size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(costs, candidates, size, child) for size, child in zip(sizes, seeds)]
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if workers <= 1:
+        results = [_simulate_batch(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_batch, tasks))
+    return np.concatenate(results) if results else np.empty(0)
+
+
+def risk_summary(spot_costs, fixed_cost, confidence=0.95):
+    """Distribution figures of scenario spot costs against a fixed cost.
+
+    VaR is the spot cost exceeded in only ``1 - confidence`` of the
+    scenarios, CVaR the average cost in those scenarios.
+    """
+    var = float(np.quantile(spot_costs, confidence))
+    tail = spot_costs[spot_costs >= var]
+    return {
+        'scenarios': len(spot_costs),
+        'mean': float(spot_costs.mean()),
+        'p5': float(np.quantile(spot_costs, 0.05)),
+        'median': float(np.median(spot_costs)),
+        'p95': float(np.quantile(spot_costs, 0.95)),
+        'confidence': confidence,
+        'var': var,
+        'cvar': float(tail.mean()) if len(tail) else var,
+        'fixed_cost': fixed_cost,
+        'probability_spot_cheaper': float((spot_costs < fixed_cost).mean()),
+        'expected_savings': float(fixed_cost - spot_costs.mean()),
+    }
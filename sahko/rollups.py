@@ -0,0 +1,270 @@
+"""Persisted daily, monthly, hour-of-day and weekday x hour rollups.
+
+The combine stage feeds every combined hour through ``RollupStore.update``.
+Hours at or before the store's watermark are ignored, so re-running the
+combine over the full year only adds the hours that are new. Each bucket
+keeps the hours covered, sums, min/max and the consumption-weighted price,
+so reports read a handful of buckets instead of the hourly history:
+
+    store = RollupStore.load()
+    for month, bucket in store.level('monthly').items():
+        print(month, bucket['consumption'], weighted_price(bucket))
+
+Revised meter readings for days already in the store are swapped in with
+``revise`` (see sahko/changes.py).
+
+Monthly and hour-of-day buckets also get a price distribution sketch
+(``store.sketch('monthly', '2025-01')``, see sahko/sketches.py).
+
+Daily and monthly keys carry the year (``store.months('2025')``,
+``store.totals('2025')``); the hour-of-day and weekday x hour buckets span
+every year in the store.
+"""
+import json
+import os
+from datetime import date, datetime
+
+from sahko.sketches import PriceSketch
+
+DEFAULT_ROLLUP_FILE = 'processed/rollups.json'
+LEVELS = ('daily', 'monthly', 'hour_of_day', 'weekday_hour')
+SKETCH_LEVELS = ('monthly', 'hour_of_day')
+FORMAT_VERSION = 2
+
+
+def _empty_bucket():
+    return {
+        'hours': 0,
+        'consumption': 0.0,
+        'cost': 0.0,
+        'price_sum': 0.0,
+        'price_kwh': 0.0,
+        'price_min': None,
+        'price_max': None,
+        'consumption_min': None,
+        'consumption_max': None,
+    }
+
+
+def _add(bucket, consumption, price, cost, interval_hours):
+    bucket['hours'] += interval_hours
+    bucket['consumption'] += consumption
+    bucket['cost'] += cost
+    bucket['price_sum'] += price * interval_hours
+    bucket['price_kwh'] += price * consumption
+    if bucket['price_min'] is None or price < bucket['price_min']:
+        bucket['price_min'] = price
+    if bucket['price_max'] is None or price > bucket['price_max']:
+        bucket['price_max'] = price
+    if bucket['consumption_min'] is None or consumption < bucket['consumption_min']:
+        bucket['consumption_min'] = consumption
+    if bucket['consumption_max'] is None or consumption > bucket['consumption_max']:
+        bucket['consumption_max'] = consumption
+
+
+def _remove(bucket, consumption, price, cost, interval_hours):
+    # Sums can be taken back out; min/max are refreshed by the caller where possible
+    bucket['hours'] -= interval_hours
+    bucket['consumption'] -= consumption
+    bucket['cost'] -= cost
+    bucket['price_sum'] -= price * interval_hours
+    bucket['price_kwh'] -= price * consumption
+
+
+def average_price(bucket):
+    """Time-weighted average of the spot prices in the bucket."""
+    return bucket['price_sum'] / bucket['hours'] if bucket['hours'] else 0.0
+
+
+def weighted_price(bucket):
+    """Consumption-weighted spot price of the bucket (snt/kWh)."""
+    return bucket['price_kwh'] / bucket['consumption'] if bucket['consumption'] else 0.0
+
+
+def bucket_keys(timestamp):
+    """Rollup keys of one combined timestamp ('%Y-%m-%dT%H:%M:%S%z', local time)."""
+    day = timestamp[:10]
+    hour = timestamp[11:13]
+    weekday = date.fromisoformat(day).weekday()
+    return {
+        'daily': day,
+        'monthly': timestamp[:7],
+        'hour_of_day': hour,
+        'weekday_hour': f"{weekday}-{hour}",
+    }
+
+
+class RollupStore:
+    """Rollup buckets per level plus the watermark of the last hour added."""
+
+    def __init__(self, path=DEFAULT_ROLLUP_FILE, data=None):
+        self.path = path
+        self.data = data or {
+            'version': FORMAT_VERSION,
+            'watermark': None,
+            'watermark_epoch': None,
+            'levels': {level: {} for level in LEVELS},
+            'sketches': {level: {} for level in SKETCH_LEVELS},
+        }
+        self._sketches = {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_ROLLUP_FILE):
+        """Load the store, or return an empty one if the file is missing or outdated."""
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == FORMAT_VERSION:
+                return cls(path, data)
+        return cls(path)
+
+    @property
+    def watermark(self):
+        return self.data['watermark']
+
+    def level(self, name):
+        return self.data['levels'][name]
+
+    def sketch(self, level, key):
+        """Price sketch of one bucket (empty if the bucket has none)."""
+        cache_key = (level, key)
+        if cache_key not in self._sketches:
+            stored = self.data['sketches'][level].get(key)
+            self._sketches[cache_key] = PriceSketch.from_dict(stored) if stored else PriceSketch()
+        return self._sketches[cache_key]
+
+    def merged_sketch(self, level='monthly', keys=None):
+        """One sketch over several buckets (all of the level by default)."""
+        keys = self.data['sketches'][level].keys() if keys is None else keys
+        return PriceSketch.merged(self.sketch(level, key) for key in list(keys))
+
+    def update(self, rows, interval_hours=1.0):
+        """Add combined rows newer than the watermark. Returns how many were added.
+
+        ``interval_hours`` is the length of one row (0.25 for 15-minute
+        data); bucket 'hours' and 'price_sum' are weighted by it.
+        """
+        watermark_epoch = self.data['watermark_epoch']
+        added = 0
+        for row in rows:
+            timestamp = row['timestamp']
+            epoch = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S%z').timestamp()
+            if watermark_epoch is not None and epoch <= watermark_epoch:
+                continue
+            self._add_row(row, interval_hours)
+            if self.data['watermark_epoch'] is None or epoch > self.data['watermark_epoch']:
+                self.data['watermark_epoch'] = epoch
+                self.data['watermark'] = timestamp
+            added += 1
+        return added
+
+    def _add_row(self, row, interval_hours):
+        levels = self.data['levels']
+        consumption = float(row['consumption_kWh'])
+        price = float(row['price_cents_per_kWh'])
+        cost = float(row['cost_euros'])
+        keys = bucket_keys(row['timestamp'])
+        if keys['daily'] not in levels['daily']:
+            # Monthly buckets also count their days for daily averages
+            month = levels['monthly'].setdefault(keys['monthly'], _empty_bucket())
+            month['days'] = month.get('days', 0) + 1
+        for level, key in keys.items():
+            if key not in levels[level]:
+                levels[level][key] = _empty_bucket()
+            _add(levels[level][key], consumption, price, cost, interval_hours)
+        for level in SKETCH_LEVELS:
+            self.sketch(level, keys[level]).add(price, consumption, interval_hours)
+
+    def revise(self, days, old_rows, new_rows, interval_hours=1.0):
+        """Replace the rows of revised days at or before the watermark. Returns the days revised.
+
+        ``old_rows`` are the rows the store was built from and ``new_rows``
+        their corrected versions (combined row dicts, any extra days are
+        ignored); rows after the watermark are left to ``update``. Daily
+        buckets are rebuilt and monthly extremes recomputed from them;
+        hour-of-day and weekday x hour extremes keep any value a revised
+        row once had. A day the store holds but ``old_rows`` lacks cannot
+        be taken out and is skipped.
+        """
+        watermark_epoch = self.data['watermark_epoch']
+        if watermark_epoch is None:
+            return []
+        levels = self.data['levels']
+
+        def at_or_before_watermark(rows):
+            for row in rows:
+                if row['timestamp'][:10] in days and \
+                        datetime.strptime(row['timestamp'], '%Y-%m-%dT%H:%M:%S%z').timestamp() <= watermark_epoch:
+                    yield row
+
+        days = set(days)
+        old_rows = list(at_or_before_watermark(old_rows))
+        old_days = {row['timestamp'][:10] for row in old_rows}
+        days = {day for day in days if day in old_days or day not in levels['daily']}
+
+        for row in old_rows:
+            if row['timestamp'][:10] not in days:
+                continue
+            consumption = float(row['consumption_kWh'])
+            price = float(row['price_cents_per_kWh'])
+            cost = float(row['cost_euros'])
+            keys = bucket_keys(row['timestamp'])
+            for level, key in keys.items():
+                if level != 'daily':
+                    _remove(levels[level][key], consumption, price, cost, interval_hours)
+            for level in SKETCH_LEVELS:
+                self.sketch(level, keys[level]).add(price, -consumption, -interval_hours)
+        for day in days:
+            if levels['daily'].pop(day, None) is not None:
+                levels['monthly'][day[:7]]['days'] -= 1
+
+        for row in at_or_before_watermark(new_rows):
+            if row['timestamp'][:10] in days:
+                self._add_row(row, interval_hours)
+
+        for month in {day[:7] for day in days}:
+            bucket = levels['monthly'].get(month)
+            if bucket is None:
+                continue
+            daily = [levels['daily'][day] for day in levels['daily'] if day.startswith(month)]
+            for key, pick in (('price_min', min), ('price_max', max),
+                              ('consumption_min', min), ('consumption_max', max)):
+                values = [day_bucket[key] for day_bucket in daily if day_bucket[key] is not None]
+                bucket[key] = pick(values) if values else None
+        return sorted(days)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for (level, key), sketch in self._sketches.items():
+            if len(sketch):
+                self.data['sketches'][level][key] = sketch.to_dict()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+    def years(self):
+        """Years with monthly buckets, as sorted 'YYYY' strings."""
+        return sorted({month[:4] for month in self.level('monthly')})
+
+    def months(self, year=None):
+        """Sorted (month, bucket) pairs of the monthly level, of one year if given."""
+        return [(month, bucket) for month, bucket in sorted(self.level('monthly').items())
+                if year is None or month.startswith(f"{year}-")]
+
+    def totals(self, year=None):
+        """Totals summed from the monthly level: the whole history, or one year."""
+        total = _empty_bucket()
+        for _, bucket in self.months(year):
+            total['hours'] += bucket['hours']
+            total['consumption'] += bucket['consumption']
+            total['cost'] += bucket['cost']
+            total['price_sum'] += bucket['price_sum']
+            total['price_kwh'] += bucket['price_kwh']
+            for key, pick in (('price_min', min), ('price_max', max),
+                              ('consumption_min', min), ('consumption_max', max)):
+                if bucket[key] is not None:
+                    total[key] = bucket[key] if total[key] is None else pick(total[key], bucket[key])
+        return total
@@ -0,0 +1,216 @@
+"""Combined consumption, price and cost rows as contiguous columns.
+
+``HourlySeries`` replaces lists of per-row dicts: four NumPy columns
+(interval start in epoch seconds, kWh, snt/kWh, euros), 32 bytes per row.
+Rows are kept in time order; slicing returns views. Rows are hours by
+default and 15-minute intervals with RESOLUTION_MINUTES=15.
+
+    series = HourlySeries.read_csv('processed/combined_data.csv')
+    january = series.between(start, end)
+    for month, rows in series.groupby('month'):
+        print(month, rows.consumption.sum())
+    keys, sums = series.aggregate('day')
+
+Local calendar fields (Helsinki time) are computed from the epoch column
+when first needed. pyarrow is only imported for Parquet I/O.
+"""
+import csv
+from array import array
+
+import numpy as np
+
+from sahko.timeaxis import RESOLUTION_MINUTES, format_local, utc_offsets
+
+CSV_COLUMNS = ['timestamp', 'consumption_kWh', 'price_cents_per_kWh', 'cost_euros']
+PARQUET_COLUMNS = ['ts', 'consumption_kwh', 'price_cents_per_kwh', 'cost_euros']
+
+# Calendar fields groupby/aggregate accept; 'day' and 'month' rows are contiguous
+GROUPINGS = ('day', 'month', 'hour', 'weekday')
+
+
+def parse_timestamps(timestamps):
+    """'%Y-%m-%dT%H:%M:%S%z' strings (as in the combined CSV) to epoch seconds."""
+    timestamps = np.asarray(timestamps, dtype=str)
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64)
+    local = timestamps.astype('U19').astype('datetime64[s]').astype(np.int64)
+    suffix = np.array([timestamp[19:].replace(':', '') for timestamp in timestamps.tolist()])
+    signs = np.where(np.char.startswith(suffix, '-'), -1, 1)
+    digits = np.char.lstrip(suffix, '+-').astype(np.int64)
+    return local - signs * (digits // 100 * 3600 + digits % 100 * 60)
+
+
+class HourlySeries:
+    """Time-ordered combined rows held as NumPy columns."""
+
+    def __init__(self, epoch, consumption, price, cost, interval_hours=RESOLUTION_MINUTES / 60):
+        self.epoch = np.asarray(epoch, dtype=np.int64)
+        self.consumption = np.asarray(consumption, dtype=np.float64)
+        self.price = np.asarray(price, dtype=np.float64)
+        self.cost = np.asarray(cost, dtype=np.float64)
+        self.interval_hours = interval_hours
+        self._local = None
+
+    @classmethod
+    def empty(cls, interval_hours=RESOLUTION_MINUTES / 60):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0), interval_hours)
+
+    @classmethod
+    def from_records(cls, records, interval_hours=RESOLUTION_MINUTES / 60):
+        """Build from (aware datetime, kWh, price, cost) tuples, e.g. a database cursor.
+
+        Values are appended to typed arrays, so a long stream never exists
+        as Python objects all at once. The result is sorted by time.
+        """
+        epoch, consumption, price, cost = array('q'), array('d'), array('d'), array('d')
+        for timestamp, kwh, cents, eur in records:
+            epoch.append(int(timestamp.timestamp()))
+            consumption.append(kwh)
+            price.append(cents)
+            cost.append(eur)
+        series = cls(np.frombuffer(epoch, dtype=np.int64), np.frombuffer(consumption),
+                     np.frombuffer(price), np.frombuffer(cost), interval_hours)
+        return series.sorted()
+
+    @classmethod
+    def concat(cls, parts, interval_hours=RESOLUTION_MINUTES / 60):
+        """One series from several, sorted by time."""
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty(interval_hours)
+        columns = [np.concatenate([getattr(part, name) for part in parts])
+                   for name in ('epoch', 'consumption', 'price', 'cost')]
+        return cls(*columns, interval_hours=parts[0].interval_hours).sorted()
+
+    @classmethod
+    def read_csv(cls, path, interval_hours=RESOLUTION_MINUTES / 60):
+        """Load a combined data CSV (timestamp, consumption_kWh, price_cents_per_kWh, cost_euros)."""
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return cls.empty(interval_hours)
+            if header != CSV_COLUMNS:
+                raise ValueError(f"Unexpected header in {path}: {header}")
+            columns = list(zip(*reader))
+        if not columns:
+            return cls.empty(interval_hours)
+        timestamps, consumption, price, cost = columns
+        return cls(parse_timestamps(timestamps), np.array(consumption, dtype=np.float64),
+                   np.array(price, dtype=np.float64), np.array(cost, dtype=np.float64),
+                   interval_hours).sorted()
+
+    @classmethod
+    def read_parquet(cls, path, interval_hours=RESOLUTION_MINUTES / 60):
+        """Load a Parquet file or partitioned directory written by ``to_parquet`` or query.py."""
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=PARQUET_COLUMNS)
+        epoch = table.column('ts').to_numpy().astype('datetime64[s]').astype(np.int64)
+        return cls(epoch, *(table.column(name).to_numpy() for name in PARQUET_COLUMNS[1:]),
+                   interval_hours=interval_hours).sorted()
+
+    def to_csv(self, path):
+        """Write in the combined data CSV format, timestamps in local time."""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            writer.writerows(zip(format_local(self.epoch), self.consumption.tolist(),
+                                 self.price.tolist(), self.cost.tolist()))
+
+    def to_parquet(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({
+            'ts': pa.array(self.epoch.astype('datetime64[s]'), type=pa.timestamp('s', tz='UTC')),
+            'consumption_kwh': self.consumption,
+            'price_cents_per_kwh': self.price,
+            'cost_euros': self.cost,
+        })
+        pq.write_table(table, path)
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def __getitem__(self, index):
+        """Rows selected by a slice (a view), a boolean mask or an index array."""
+        if isinstance(index, (int, np.integer)):
+            index = slice(index, index + 1 or None)
+        series = HourlySeries(self.epoch[index], self.consumption[index], self.price[index],
+                              self.cost[index], self.interval_hours)
+        if self._local is not None:
+            series._local = self._local[index]
+        return series
+
+    def sorted(self):
+        if np.all(self.epoch[1:] >= self.epoch[:-1]):
+            return self
+        return self[np.argsort(self.epoch, kind='stable')]
+
+    def between(self, start=None, end=None):
+        """Rows with ``start <= epoch < end`` (either bound optional), as a view."""
+        lo = 0 if start is None else int(np.searchsorted(self.epoch, start, side='left'))
+        hi = len(self) if end is None else int(np.searchsorted(self.epoch, end, side='left'))
+        return self[lo:hi]
+
+    def after(self, epoch=None):
+        """Rows strictly newer than ``epoch`` (all rows if None), as a view."""
+        if epoch is None:
+            return self
+        return self[int(np.searchsorted(self.epoch, epoch, side='right')):]
+
+    @property
+    def local(self):
+        """Local wall-clock time of each row as datetime64[s]."""
+        if self._local is None:
+            self._local = (self.epoch + utc_offsets(self.epoch)).astype('datetime64[s]')
+        return self._local
+
+    def field(self, by):
+        """Calendar field of each row: 'day' and 'month' as datetime64, 'hour' 0-23, 'weekday' 0=Monday."""
+        if by == 'day':
+            return self.local.astype('datetime64[D]')
+        if by == 'month':
+            return self.local.astype('datetime64[M]')
+        if by == 'hour':
+            return (self.local.astype(np.int64) % 86400 // 3600).astype(np.int64)
+        if by == 'weekday':
+            # 1970-01-01 was a Thursday
+            return (self.local.astype('datetime64[D]').astype(np.int64) + 3) % 7
+        raise ValueError(f"Unknown grouping {by!r}; expected one of {', '.join(GROUPINGS)}")
+
+    def groupby(self, by):
+        """(key, rows) pairs in key order; days and months come back as views."""
+        keys = self.field(by)
+        if by in ('day', 'month'):
+            unique, starts = np.unique(keys, return_index=True)
+            ends = np.append(starts[1:], len(self))
+            for key, start, end in zip(unique, starts.tolist(), ends.tolist()):
+                yield key, self[start:end]
+        else:
+            for key in np.unique(keys):
+                yield key, self[keys == key]
+
+    def aggregate(self, by):
+        """Vectorized sums per group.
+
+        Returns (keys, sums) where sums holds arrays of consumption, cost,
+        hours, price_sum (time-weighted), price_kwh (consumption-weighted)
+        and rows, one entry per key.
+        """
+        keys, inverse = np.unique(self.field(by), return_inverse=True)
+        rows = np.bincount(inverse, minlength=len(keys))
+        sums = {
+            'consumption': np.bincount(inverse, self.consumption, len(keys)),
+            'cost': np.bincount(inverse, self.cost, len(keys)),
+            'hours': rows * self.interval_hours,
+            'price_sum': np.bincount(inverse, self.price, len(keys)) * self.interval_hours,
+            'price_kwh': np.bincount(inverse, self.price * self.consumption, len(keys)),
+            'rows': rows,
+        }
+        return keys, sums
+
+    def records(self):
+        """Rows as dicts in the combined CSV shape (for the rollup store), generated lazily."""
+        for timestamp, kwh, cents, eur in zip(format_local(self.epoch), self.consumption.tolist(),
+                                              self.price.tolist(), self.cost.tolist()):
+            yield {'timestamp': timestamp, 'consumption_kWh': kwh, 'price_cents_per_kWh': cents, 'cost_euros': eur}
@@ -0,0 +1,155 @@
+"""Mergeable price distribution sketches.
+
+A ``PriceSketch`` is a fixed-bin histogram of spot prices (bins of
+``BIN_WIDTH`` snt/kWh) holding two weights per bin: hours and kWh bought at
+that price. Sketches for different months, hours of the day, meters or
+years merge by adding bins, so memory depends on the price range seen, not
+on how many hours went in, and merging partial sketches gives the same
+answer as building one sketch from all the data.
+
+Quantiles are accurate to within one bin:
+
+    sketch = PriceSketch.merged(monthly_sketches)
+    p10, p50, p90 = (sketch.quantile(q) for q in (0.1, 0.5, 0.9))
+    weighted_median = sketch.quantile(0.5, weight='kwh')
+    expensive_share = sketch.share_above(15.0)
+"""
+import math
+
+import numpy as np
+
+BIN_WIDTH = 0.1  # snt/kWh
+WEIGHTS = ('hours', 'kwh')
+
+
+class PriceSketch:
+    """Price histogram weighted by hours and by kWh."""
+
+    def __init__(self):
+        self.bins = {}  # bin index -> [hours, kwh]
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return len(self.bins)
+
+    def add(self, price, kwh, hours=1.0):
+        index = math.floor(price / BIN_WIDTH)
+        weights = self.bins.get(index)
+        if weights is None:
+            weights = self.bins[index] = [0.0, 0.0]
+        weights[0] += hours
+        weights[1] += kwh
+        if self.min is None or price < self.min:
+            self.min = price
+        if self.max is None or price > self.max:
+            self.max = price
+
+    def add_many(self, prices, kwh, hours=1.0):
+        """Add arrays of prices and kWh (``hours`` per row) in one pass."""
+        prices = np.asarray(prices, dtype=np.float64)
+        if len(prices) == 0:
+            return
+        kwh = np.asarray(kwh, dtype=np.float64)
+        indices, inverse = np.unique(np.floor(prices / BIN_WIDTH).astype(np.int64), return_inverse=True)
+        bin_hours = np.bincount(inverse, minlength=len(indices)) * hours
+        bin_kwh = np.bincount(inverse, kwh, len(indices))
+        for index, add_hours, add_kwh in zip(indices.tolist(), bin_hours.tolist(), bin_kwh.tolist()):
+            weights = self.bins.setdefault(index, [0.0, 0.0])
+            weights[0] += add_hours
+            weights[1] += add_kwh
+        for value in (float(prices.min()), float(prices.max())):
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add another sketch into this one. Returns self."""
+        for index, (hours, kwh) in other.bins.items():
+            weights = self.bins.setdefault(index, [0.0, 0.0])
+            weights[0] += hours
+            weights[1] += kwh
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    @classmethod
+    def merged(cls, sketches):
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def total(self, weight='hours'):
+        column = WEIGHTS.index(weight)
+        return sum(weights[column] for weights in self.bins.values())
+
+    def quantile(self, q, weight='hours'):
+        """Price below which a share ``q`` of the hours (or of the kWh) falls.
+
+        Interpolates linearly inside the bin; None for an empty sketch.
+        """
+        column = WEIGHTS.index(weight)
+        total = self.total(weight)
+        if total <= 0:
+            return None
+        target = q * total
+        cumulative = 0.0
+        for index in sorted(self.bins):
+            weight_in_bin = self.bins[index][column]
+            if weight_in_bin > 0 and cumulative + weight_in_bin >= target:
+                fraction = (target - cumulative) / weight_in_bin
+                value = (index + fraction) * BIN_WIDTH
+                return min(max(value, self.min), self.max)
+            cumulative += weight_in_bin
+        return self.max
+
+    def share_above(self, price, weight='kwh'):
+        """Share of the kWh (or hours) bought at a price above ``price``."""
+        column = WEIGHTS.index(weight)
+        total = self.total(weight)
+        if total <= 0:
+            return 0.0
+        threshold = price / BIN_WIDTH
+        above = 0.0
+        for index, weights in self.bins.items():
+            if index >= threshold:
+                above += weights[column]
+            elif index + 1 > threshold:
+                # Part of the bin containing the threshold
+                above += weights[column] * (index + 1 - threshold)
+        return above / total
+
+    def to_dict(self):
+        indexes = sorted(self.bins)
+        return {
+            'bin_width': BIN_WIDTH,
+            'index': indexes,
+            'hours': [self.bins[index][0] for index in indexes],
+            'kwh': [self.bins[index][1] for index in indexes],
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('bin_width') != BIN_WIDTH:
+            raise ValueError(f"Sketch bin width {data.get('bin_width')} does not match {BIN_WIDTH}")
+        sketch = cls()
+        sketch.bins = {index: [hours, kwh] for index, hours, kwh in zip(data['index'], data['hours'], data['kwh'])}
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
+
+    def summary(self, above=None):
+        """p10/p50/p90 prices, the kWh-weighted median and optionally the share above a price."""
+        result = {
+            'p10': self.quantile(0.1),
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'kwh_p50': self.quantile(0.5, weight='kwh'),
+        }
+        if above is not None:
+            result['share_above'] = self.share_above(above)
+        return result
@@ -0,0 +1,385 @@
+"""Local stand-in for the Elenia, Vattenfall and porssisahko APIs.
+
+Serves realistic responses for the endpoints the fetchers use, so the
+ingestion layer can be load-tested and benchmarked without any network:
+
+    /cognito/                                   Cognito InitiateAuth
+    /elenia/api/gen/customer_data_and_token     customers and metering points
+    /elenia/api/gen/meter_reading_yh            a year of readings per GSRN
+    /elenia/api/gen/meter_reading               one day of readings
+    /vattenfall/api/price/spot/<start>/<end>    hourly spot prices (VAT 0)
+    /porssisahko/v1/latest-prices.json          48 hours of prices (VAT incl.)
+    /_stats                                     requests served per endpoint
+
+Point the fetchers at it with ELENIA_COGNITO_URL, ELENIA_API_URL,
+VATTENFALL_API_URL and PORSSISAHKO_API_URL (``base_urls`` gives the
+values). Three modes:
+
+* synthetic (default): deterministic data generated from ``seed``;
+  payload size follows ``customers``, ``points`` per customer and
+  ``resolution_minutes`` (15 gives four times the values);
+* record: forwards every request to the real API and stores the response
+  under ``recordings`` (Cognito answers are never stored, and the API token
+  in customer_data_and_token is redacted);
+* replay: serves the stored responses; an unrecorded request gets 404.
+
+``latency`` (+ uniform ``jitter``) seconds are added to every response and a
+share ``error_rate`` of them become 504s, except in record mode.
+Generated bodies are cached, so the server itself is rarely the bottleneck.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import numpy as np
+
+from sahko.prices import vat_rates
+from sahko.timeaxis import format_local, parse_local
+
+logger = logging.getLogger(__name__)
+
+UPSTREAMS = {
+    'cognito': 'https://cognito-idp.eu-west-1.amazonaws.com',
+    'elenia': 'https://public.sgp-prod.aws.elenia.fi',
+    'vattenfall': 'https://www.vattenfall.fi',
+    'porssisahko': 'https://api.porssisahko.net',
+}
+PRODUCTION_DEVICE = 'Tuotannon virtuaalilaite'
+
+
+class StandinConfig:
+    """Settings of the stand-in server (see the module docstring)."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, customers=1, points=2,
+                 resolution_minutes=60, seed=0, mode='synthetic', recordings='recordings'):
+        if mode not in ('synthetic', 'record', 'replay'):
+            raise ValueError(f"Unknown mode {mode!r}")
+        if resolution_minutes not in (15, 60):
+            raise ValueError("resolution_minutes must be 15 or 60")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.customers = customers
+        self.points = points
+        self.resolution_minutes = resolution_minutes
+        self.seed = seed
+        self.mode = mode
+        self.recordings = recordings
+
+
+def base_urls(host, port):
+    """Environment values that point the fetchers at a stand-in on host:port."""
+    root = f"http://{host}:{port}"
+    return {
+        'ELENIA_COGNITO_URL': f"{root}/cognito/",
+        'ELENIA_API_URL': f"{root}/elenia/api/gen",
+        'VATTENFALL_API_URL': f"{root}/vattenfall/api/price/spot",
+        'PORSSISAHKO_API_URL': f"{root}/porssisahko/v1",
+    }
+
+
+# Synthetic data
+
+def _jwt(claims):
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+    return f"{part({'alg': 'none', 'typ': 'JWT'})}.{part(claims)}.standin"
+
+
+def gsrn_of(customer, point):
+    return f"643006966{customer:05d}{point:04d}"
+
+
+def point_kind(gsrn):
+    # The second metering point of every customer is the production one
+    return 'production' if int(gsrn[-4:]) == 1 else 'consumption'
+
+
+def _rng(*parts):
+    return np.random.default_rng(int.from_bytes(hashlib.sha256(repr(parts).encode()).digest()[:8], 'big'))
+
+
+def _local_range(first_day, last_day, step):
+    """Interval starts (epoch) covering local days first_day..last_day inclusive."""
+    start = parse_local([f"{first_day}T00:00:00"])[0]
+    end = parse_local([f"{last_day + timedelta(days=1)}T00:00:00"])[0]
+    return np.arange(start, end, step, dtype=np.int64)
+
+
+@lru_cache(maxsize=32)
+def _local_axis(first_day, last_day, step):
+    """Epoch, local 't' stamps, hour of day and season (1 midwinter, -1 midsummer) of a day range."""
+    epoch = _local_range(first_day, last_day, step)
+    stamps = [t[:19] for t in format_local(epoch)]
+    local = np.array(stamps, dtype='datetime64[s]')
+    hours = local.astype(np.int64) % 86400 / 3600
+    day_of_year = (local.astype('datetime64[D]') - local.astype('datetime64[Y]')).astype(np.int64)
+    season = np.cos((day_of_year - 15) / 365 * 2 * np.pi)
+    return epoch, stamps, hours, season
+
+
+def _consumption_wh(hours, season, kind, rng, step):
+    scale = step / 3600
+    if kind == 'production':
+        daylight = np.clip(np.sin((hours - 5) / 16 * np.pi), 0, None) * np.clip(1 - season, 0, None)
+        values = 2500 * daylight * rng.uniform(0.3, 1.0, len(hours))
+    else:
+        daily = 1 + 0.5 * np.sin((hours - 7) / 24 * 2 * np.pi) + 0.8 * ((hours >= 17) & (hours < 21))
+        values = (600 + 500 * season) * daily * rng.lognormal(0, 0.35, len(hours))
+    return np.round(values * scale, 1)
+
+
+def _value_key(resolution_minutes):
+    return 'quarter_hourly_values' if resolution_minutes == 15 else 'hourly_values'
+
+
+def _readings(config, gsrn, first_day, last_day):
+    """(local stamps, Wh) of one metering point up to now."""
+    step = config.resolution_minutes * 60
+    epoch, stamps, hours, season = _local_axis(first_day, last_day, step)
+    # Readings exist only for the past
+    count = int(np.searchsorted(epoch, time.time()))
+    values = _consumption_wh(hours, season, point_kind(gsrn), _rng(config.seed, gsrn, str(first_day)), step)
+    return stamps[:count], values[:count].tolist()
+
+
+@lru_cache(maxsize=256)
+def _meter_year_body(config, gsrn, year):
+    stamps, values = _readings(config, gsrn, date(year, 1, 1), date(year, 12, 31))
+    key = _value_key(config.resolution_minutes)
+    months = {}
+    for stamp, value in zip(stamps, values):
+        months.setdefault(int(stamp[5:7]), []).append({'t': stamp, 'v': value})
+    body = {'months': [{'month': month, key: entries} for month, entries in sorted(months.items())], 'year': year}
+    return json.dumps(body).encode()
+
+
+def _meter_day_body(config, gsrn, day):
+    stamps, values = _readings(config, gsrn, day, day)
+    key = _value_key(config.resolution_minutes)
+    return json.dumps({'gsrn': gsrn, 'day': str(day), key: [{'t': t, 'v': v} for t, v in zip(stamps, values)]}).encode()
+
+
+def _customer_body(config, sub):
+    customer_datas = {}
+    for customer in range(config.customers):
+        customer_id = str(7190000 + customer)
+        points = []
+        for point in range(config.points):
+            gsrn = gsrn_of(customer, point)
+            if point_kind(gsrn) == 'production':
+                points.append({'gsrn': gsrn, 'type': 'tuotanto', 'additional_information': 'Aurinkopaneelit',
+                               'device': {'name': PRODUCTION_DEVICE}})
+            else:
+                points.append({'gsrn': gsrn, 'type': 'kulutus', 'additional_information': f'Kulutus {point + 1}',
+                               'device': {'name': 'Sähkömittari'}})
+        customer_datas[customer_id] = {'customer_id': customer_id, 'meteringpoints': points}
+    return json.dumps({'token': _jwt({'sub': sub, 'scope': 'standin'}), 'customer_datas': customer_datas}).encode()
+
+
+def _spot_prices(config, first_day, last_day):
+    """(epoch, snt/kWh without VAT) per hour of the local days."""
+    epoch = _local_range(first_day, last_day, 3600)
+    local_hours = np.array([int(t[11:13]) for t in format_local(epoch)])
+    peak = 1 + 0.6 * ((local_hours >= 7) & (local_hours < 10)) + 0.8 * ((local_hours >= 17) & (local_hours < 21))
+    # Seeded by UTC day so overlapping ranges agree
+    days = epoch // 86400
+    noise = np.empty(len(epoch))
+    for day in np.unique(days).tolist():
+        hourly = _rng(config.seed, 'spot', day).gamma(2.0, 2.5, 24)
+        in_day = days == day
+        noise[in_day] = hourly[epoch[in_day] % 86400 // 3600]
+    return epoch, np.round(noise * peak - 0.5, 2)
+
+
+@lru_cache(maxsize=64)
+def _vattenfall_body(config, first_day, last_day):
+    epoch, prices = _spot_prices(config, first_day, last_day)
+    rows = []
+    for stamp, price in zip(format_local(epoch), prices.tolist()):
+        rows.append({'timeStamp': stamp[:19], 'timeStampDay': stamp[:10], 'timeStampHour': stamp[11:16],
+                     'value': price, 'priceArea': 'FI', 'unit': 'snt/kWh'})
+    return json.dumps(rows).encode()
+
+
+def _porssisahko_body(config):
+    today = datetime.now(timezone.utc).date()
+    epoch, prices = _spot_prices(config, today - timedelta(days=1), today)
+    entries = []
+    for start, price, rate in zip(epoch.tolist(), prices.tolist(), vat_rates(epoch).tolist()):
+        entries.append({
+            'price': round(price * (1 + rate), 3),
+            'startDate': datetime.fromtimestamp(start, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'endDate': datetime.fromtimestamp(start + 3600, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        })
+    # Newest first, like the real API
+    return json.dumps({'prices': entries[::-1]}).encode()
+
+
+def synthetic_response(config, service, method, path, query, body):
+    """(status, JSON body bytes) for one request in synthetic mode."""
+    if service == 'cognito':
+        request = json.loads(body or b'{}')
+        parameters = request.get('AuthParameters', {})
+        if parameters.get('PASSWORD') == 'invalid':
+            return 400, json.dumps({'__type': 'NotAuthorizedException',
+                                    'message': 'Incorrect username or password.'}).encode()
+        sub = str(uuid.uuid5(uuid.NAMESPACE_URL, parameters.get('USERNAME', '')))
+        return 200, json.dumps({'AuthenticationResult': {
+            'AccessToken': _jwt({'sub': sub, 'username': parameters.get('USERNAME')}),
+            'ExpiresIn': 3600, 'TokenType': 'Bearer'}}).encode()
+    if service == 'elenia':
+        endpoint = path.rsplit('/', 1)[-1]
+        if endpoint == 'customer_data_and_token':
+            return 200, _customer_body(config, 'standin')
+        if endpoint == 'meter_reading_yh':
+            return 200, _meter_year_body(config, query['gsrn'], int(query['year']))
+        if endpoint == 'meter_reading':
+            return 200, _meter_day_body(config, query['gsrn'], date.fromisoformat(query['day']))
+    if service == 'vattenfall':
+        first, last = path.rstrip('/').split('/')[-2:]
+        return 200, _vattenfall_body(config, date.fromisoformat(first), date.fromisoformat(last))
+    if service == 'porssisahko' and path.endswith('latest-prices.json'):
+        return 200, _porssisahko_body(config)
+    return 404, json.dumps({'message': f'No stand-in for {method} {path}'}).encode()
+
+
+# Record / replay
+
+def recording_path(config, service, method, path, query):
+    key = f"{method} {path}?{urlencode(sorted(query.items()))}"
+    return os.path.join(config.recordings, service, f"{hashlib.sha256(key.encode()).hexdigest()[:24]}.json")
+
+
+def _redact(body):
+    # customer_data_and_token carries a live API token
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    if isinstance(data, dict) and 'token' in data:
+        data['token'] = _jwt({'sub': 'recorded'})
+        return json.dumps(data).encode()
+    return body
+
+
+def record_response(config, service, method, path, query, body, headers):
+    """Forward to the real API; store the answer (never Cognito's). Returns (status, body)."""
+    import requests
+    upstream_path = path[len(service) + 1:] if service != 'cognito' else '/'
+    url = f"{UPSTREAMS[service]}{upstream_path}"
+    forward = {key: value for key, value in headers.items()
+               if key.lower() not in ('host', 'content-length', 'accept-encoding', 'connection')}
+    response = requests.request(method, url, params=query, data=body, headers=forward, timeout=120)
+    content = response.content
+    if service != 'cognito' and response.status_code == 200:
+        path_on_disk = recording_path(config, service, method, path, query)
+        os.makedirs(os.path.dirname(path_on_disk), exist_ok=True)
+        with open(path_on_disk, 'w', encoding='utf-8') as f:
+            json.dump({'method': method, 'path': path, 'query': query, 'status': response.status_code,
+                       'body': _redact(content).decode('utf-8')}, f)
+    return response.status_code, content
+
+
+def replay_response(config, service, method, path, query, body):
+    if service == 'cognito':
+        return synthetic_response(config, service, method, path, query, body)
+    path_on_disk = recording_path(config, service, method, path, query)
+    if not os.path.exists(path_on_disk):
+        return 404, json.dumps({'message': f'Not recorded: {method} {path}'}).encode()
+    with open(path_on_disk, 'r', encoding='utf-8') as f:
+        stored = json.load(f)
+    return stored['status'], stored['body'].encode('utf-8')
+
+
+# Server
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        server = self.server
+        config = server.config
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = dict(parse_qsl(parts.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if path == '/_stats':
+            with server.lock:
+                return self._send(200, json.dumps(dict(server.stats)).encode())
+        service = path.strip('/').split('/', 1)[0]
+        if service not in UPSTREAMS:
+            return self._send(404, json.dumps({'message': f'Unknown service in {path}'}).encode())
+        endpoint = f"{service}:{path.rstrip('/').rsplit('/', 1)[-1] if service == 'elenia' else method}"
+
+        if config.mode != 'record':
+            delay = config.latency + (server.random.uniform(0, config.jitter) if config.jitter else 0.0)
+            if delay > 0:
+                time.sleep(delay)
+            with server.lock:
+                fail = server.random.random() < config.error_rate
+            if fail:
+                with server.lock:
+                    server.stats[f"{endpoint} 504"] += 1
+                return self._send(504, json.dumps({'message': 'Endpoint request timed out'}).encode())
+
+        try:
+            if config.mode == 'record':
+                status, content = record_response(config, service, method, path, query, body, dict(self.headers))
+            elif config.mode == 'replay':
+                status, content = replay_response(config, service, method, path, query, body)
+            else:
+                status, content = synthetic_response(config, service, method, path, query, body)
+        except (KeyError, ValueError) as e:
+            status, content = 400, json.dumps({'message': f'Bad request: {e}'}).encode()
+        with server.lock:
+            server.stats[f"{endpoint} {status}"] += 1
+        self._send(status, content)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, config):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+
+def start(config, host='127.0.0.1', port=0):
+    """Start a stand-in in a background thread. Returns the server (``server.server_port``)."""
+    server = StandinServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name='standin', daemon=True).start()
+    return server
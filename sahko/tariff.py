@@ -0,0 +1,177 @@
+"""Full electricity bill under declarative tariffs.
+
+The combined data only carries spot energy cost. A tariff adds the other
+parts of a real bill: each per-kWh component (energy, distribution
+transfer, electricity tax) is a list of rules, and monthly base fees are
+fixed euros per month. Rules are tried in order and the first one whose
+conditions match a row sets its price:
+
+    'transfer': [
+        {'price': 5.60, 'hours': [7, 22]},   # day rate 07-22
+        {'price': 3.25},                     # everything else
+    ]
+
+Conditions (all optional): ``months`` (1-12), ``weekdays`` (0 = Monday),
+``hours`` ([start, end), may wrap past midnight), ``from``/``until``
+('YYYY-MM-DD', until exclusive) for price changes. A rule sets either a
+``price`` in snt/kWh or a ``spot_margin`` added to the row's spot price.
+All prices include VAT, like the spot prices from 2_vattenfall_price_data.py.
+
+Rules are evaluated as boolean masks over the whole ``HourlySeries``, so a
+multi-year bill under another tariff is recomputed from the combined data
+in milliseconds. Tariffs in TARIFF_FILE (JSON, same shape as
+DEFAULT_TARIFFS) are added to or replace the defaults.
+"""
+import json
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+TARIFF_FILE = os.getenv('TARIFF_FILE', 'tariffs.json')
+SPOT_MARGIN = float(os.getenv('SPOT_MARGIN', 0))
+FIXED_PRICE = float(os.getenv('FIXED_PRICE', 8.5))
+# Electricity tax class I plus the security of supply fee, with 25.5% VAT
+ELECTRICITY_TAX = float(os.getenv('ELECTRICITY_TAX', 2.827515))
+
+# Example Elenia transfer prices and base fees; put the ones of your own
+# contracts in TARIFF_FILE
+GENERAL_TRANSFER = [{'price': 4.75}]
+TIME_OF_USE_TRANSFER = [
+    {'price': 5.60, 'hours': [7, 22]},
+    {'price': 3.25},
+]
+SEASONAL_TRANSFER = [
+    # Winter weekdays (November-March, Monday-Saturday 07-22)
+    {'price': 6.85, 'months': [11, 12, 1, 2, 3], 'weekdays': [0, 1, 2, 3, 4, 5], 'hours': [7, 22]},
+    {'price': 3.50},
+]
+
+DEFAULT_TARIFFS = {
+    'spot': {
+        'components': {
+            'energy': [{'spot_margin': SPOT_MARGIN}],
+            'transfer': GENERAL_TRANSFER,
+            'electricity_tax': [{'price': ELECTRICITY_TAX}],
+        },
+        'monthly_fees': {'energy_base': 3.95, 'transfer_base': 13.49},
+    },
+    'spot_time_of_use': {
+        'components': {
+            'energy': [{'spot_margin': SPOT_MARGIN}],
+            'transfer': TIME_OF_USE_TRANSFER,
+            'electricity_tax': [{'price': ELECTRICITY_TAX}],
+        },
+        'monthly_fees': {'energy_base': 3.95, 'transfer_base': 16.49},
+    },
+    'spot_seasonal': {
+        'components': {
+            'energy': [{'spot_margin': SPOT_MARGIN}],
+            'transfer': SEASONAL_TRANSFER,
+            'electricity_tax': [{'price': ELECTRICITY_TAX}],
+        },
+        'monthly_fees': {'energy_base': 3.95, 'transfer_base': 16.49},
+    },
+    'fixed': {
+        'components': {
+            'energy': [{'price': FIXED_PRICE}],
+            'transfer': GENERAL_TRANSFER,
+            'electricity_tax': [{'price': ELECTRICITY_TAX}],
+        },
+        'monthly_fees': {'energy_base': 3.95, 'transfer_base': 13.49},
+    },
+}
+
+
+def load_tariffs(path=TARIFF_FILE):
+    """Default tariffs updated with the ones defined in ``path`` (if it exists)."""
+    tariffs = dict(DEFAULT_TARIFFS)
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            tariffs.update(json.load(f))
+    return tariffs
+
+
+def calendar_fields(series):
+    """Month (1-12), weekday, hour and day of every row, computed once per series."""
+    months = series.field('month')
+    return {
+        'month': months.astype(np.int64) % 12 + 1,
+        'weekday': series.field('weekday'),
+        'hour': series.field('hour'),
+        'day': series.field('day'),
+    }
+
+
+def rule_mask(rule, fields):
+    """Rows matching the conditions of one rule."""
+    mask = np.ones(len(fields['hour']), dtype=bool)
+    if 'months' in rule:
+        mask &= np.isin(fields['month'], rule['months'])
+    if 'weekdays' in rule:
+        mask &= np.isin(fields['weekday'], rule['weekdays'])
+    if 'hours' in rule:
+        start, end = rule['hours']
+        hour = fields['hour']
+        mask &= (hour >= start) & (hour < end) if start < end else (hour >= start) | (hour < end)
+    if 'from' in rule:
+        mask &= fields['day'] >= np.datetime64(rule['from'], 'D')
+    if 'until' in rule:
+        mask &= fields['day'] < np.datetime64(rule['until'], 'D')
+    return mask
+
+
+def component_prices(series, rules, fields=None, name='component'):
+    """snt/kWh of every row under a component's rules (first matching rule wins)."""
+    fields = fields or calendar_fields(series)
+    prices = np.full(len(series), np.nan)
+    for rule in rules:
+        mask = rule_mask(rule, fields) & np.isnan(prices)
+        if 'spot_margin' in rule:
+            prices[mask] = series.price[mask] + rule['spot_margin']
+        else:
+            prices[mask] = rule['price']
+    uncovered = int(np.isnan(prices).sum())
+    if uncovered:
+        raise ValueError(f"Rules of {name} do not cover {uncovered} rows; add a rule without conditions last")
+    return prices
+
+
+def per_kwh_prices(series, tariff):
+    """All-in snt/kWh of every row: the sum of the tariff's per-kWh components."""
+    fields = calendar_fields(series)
+    total = np.zeros(len(series))
+    for name, rules in tariff.get('components', {}).items():
+        total += component_prices(series, rules, fields, name)
+    return total
+
+
+def evaluate(series, tariff):
+    """Per-row cost breakdown in euros.
+
+    Returns a dict of component name to an array aligned with the series,
+    monthly fees spread evenly over the rows of each month, plus 'total'.
+    """
+    fields = calendar_fields(series)
+    breakdown = {}
+    for name, rules in tariff.get('components', {}).items():
+        breakdown[name] = series.consumption * component_prices(series, rules, fields, name) / 100
+    fees = tariff.get('monthly_fees', {})
+    if fees and len(series):
+        _, inverse, counts = np.unique(series.field('month'), return_inverse=True, return_counts=True)
+        share = 1.0 / counts[inverse]
+        for name, euros in fees.items():
+            breakdown[name] = euros * share
+    breakdown['total'] = sum(breakdown.values()) if breakdown else np.zeros(len(series))
+    return breakdown
+
+
+def bill(series, tariff, by='month'):
+    """Bill per month (or day, hour, weekday): (keys, {component: euros per key})."""
+    breakdown = evaluate(series, tariff)
+    keys, inverse = np.unique(series.field(by), return_inverse=True)
+    sums = {name: np.bincount(inverse, values, len(keys)) for name, values in breakdown.items()}
+    return keys.astype(str).tolist(), sums
@@ -0,0 +1,161 @@
+"""Resolution-aware time axis and resampling for consumption and price series.
+
+Series are NumPy arrays of interval start times (epoch seconds, int64) with
+a fixed step in seconds. Prices and consumption may come at different
+resolutions (15-minute market time unit vs hourly metering); ``resample``
+moves a series to another step:
+
+* energy (``how='sum'``): coarsening sums the intervals, refining splits
+  each interval evenly;
+* prices (``how='mean'``): coarsening averages, refining repeats.
+
+RESOLUTION_MINUTES (default 60) is the resolution of the combined output.
+"""
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+HELSINKI = ZoneInfo('Europe/Helsinki')
+RESOLUTION_MINUTES = int(os.getenv('RESOLUTION_MINUTES', 60))
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def output_step():
+    """Step of the combined output in seconds."""
+    return RESOLUTION_MINUTES * 60
+
+
+def _day_offsets(days, offset_at):
+    """UTC offset per day plus a mask of days with a DST transition."""
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    start = np.empty(len(unique_days), dtype=np.int64)
+    transition = np.zeros(len(unique_days), dtype=bool)
+    for i, day in enumerate(unique_days.tolist()):
+        first = offset_at(day * 86400)
+        last = offset_at(day * 86400 + 23 * 3600)
+        start[i] = first
+        transition[i] = first != last
+    return start[inverse], transition[inverse]
+
+
+def parse_local(timestamps, tz=HELSINKI):
+    """Naive local 'YYYY-MM-DDTHH:MM:SS' strings to epoch seconds.
+
+    Offsets are looked up once per calendar day; only rows on DST
+    transition days are resolved one by one. A wall-clock time that repeats
+    in the autumn is taken as the later instant on its second occurrence.
+    """
+    local = np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+    if len(local) == 0:
+        return local
+
+    def offset_at(local_seconds):
+        naive = _EPOCH + timedelta(seconds=local_seconds)
+        return int(naive.replace(tzinfo=tz).utcoffset().total_seconds())
+
+    offsets, transition = _day_offsets(local // 86400, offset_at)
+    seen = set()
+    for row in np.flatnonzero(transition).tolist():
+        value = int(local[row])
+        naive = (_EPOCH + timedelta(seconds=value)).replace(tzinfo=tz, fold=1 if value in seen else 0)
+        seen.add(value)
+        offsets[row] = int(naive.utcoffset().total_seconds())
+    return local - offsets
+
+
+def utc_offsets(epoch, tz=HELSINKI):
+    """UTC offset in seconds of each instant in ``tz``."""
+    epoch = np.asarray(epoch, dtype=np.int64)
+    if len(epoch) == 0:
+        return epoch.copy()
+
+    def offset_at(utc_seconds):
+        return int(datetime.fromtimestamp(utc_seconds, tz).utcoffset().total_seconds())
+
+    offsets, transition = _day_offsets(epoch // 86400, offset_at)
+    for row in np.flatnonzero(transition).tolist():
+        offsets[row] = offset_at(int(epoch[row]))
+    return offsets
+
+
+def format_local(epoch, tz=HELSINKI):
+    """Epoch seconds to '%Y-%m-%dT%H:%M:%S%z' strings in local time."""
+    if len(epoch) == 0:
+        return []
+    offsets = utc_offsets(epoch, tz)
+    local = (np.asarray(epoch, dtype=np.int64) + offsets).astype('datetime64[s]')
+    signs = np.where(offsets < 0, '-', '+')
+    minutes = np.abs(offsets) // 60
+    suffix = np.char.add(signs, np.char.zfill((minutes // 60 * 100 + minutes % 60).astype(str), 4))
+    return np.char.add(np.datetime_as_string(local, unit='s'), suffix).tolist()
+
+
+def interval_lengths(epoch, max_step=3600):
+    """Length in seconds of each interval of a sorted, duplicate-free series.
+
+    A row's length is the smaller of the gaps to its neighbours, capped at
+    ``max_step`` so holes in the data are not mistaken for long intervals.
+    """
+    gaps = np.diff(np.asarray(epoch, dtype=np.int64))
+    before = np.concatenate([[max_step], gaps])
+    after = np.concatenate([gaps, [max_step]])
+    return np.clip(np.minimum(before, after), 1, max_step)
+
+
+def to_uniform_step(epoch, values, how='sum', max_step=3600):
+    """Bring a sorted series with mixed resolutions to its finest step.
+
+    Each row's interval length comes from ``interval_lengths``; longer
+    intervals are split like ``resample`` does. Returns (epoch, values, step).
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(epoch) < 2:
+        return epoch, values, max_step
+    row_step = interval_lengths(epoch, max_step)
+    step = int(row_step.min())
+    factors = row_step // step
+    if np.all(factors == 1):
+        return epoch, values, step
+    new_epoch = np.repeat(epoch, factors) + (np.arange(factors.sum()) - np.repeat(np.cumsum(factors) - factors, factors)) * step
+    new_values = np.repeat(values / factors if how == 'sum' else values, factors)
+    return new_epoch, new_values, step
+
+
+def resample(epoch, values, step, target_step, how='sum'):
+    """Resample a regular series from ``step`` to ``target_step`` seconds.
+
+    Coarsening keeps only complete target intervals (all sub-intervals
+    present). Returns new (epoch, values) arrays.
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if step == target_step:
+        return epoch, values
+
+    if target_step < step:
+        if step % target_step:
+            raise ValueError(f"Cannot refine a {step}s series to {target_step}s")
+        factor = step // target_step
+        new_epoch = (epoch[:, None] + np.arange(factor) * target_step).ravel()
+        new_values = np.repeat(values / factor if how == 'sum' else values, factor)
+        return new_epoch, new_values
+
+    if target_step % step:
+        raise ValueError(f"Cannot coarsen a {step}s series to {target_step}s")
+    factor = target_step // step
+    buckets = epoch - epoch % target_step
+    new_epoch, inverse, counts = np.unique(buckets, return_inverse=True, return_counts=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(new_epoch))
+    complete = counts == factor
+    new_values = sums if how == 'sum' else sums / counts
+    return new_epoch[complete], new_values[complete]
+
+
+def align(epoch_a, epoch_b):
+    """Indices into ``epoch_a`` and ``epoch_b`` of the instants present in both."""
+    _, index_a, index_b = np.intersect1d(epoch_a, epoch_b, assume_unique=False, return_indices=True)
+    return index_a, index_b
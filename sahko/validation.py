@@ -0,0 +1,159 @@
+"""Data-quality checks for the downloaded consumption and price series.
+
+Every check runs as array operations over a whole series, so validating
+many meter-years costs about as much as loading them. The checks return
+findings (plain dicts) rather than raising, and ``format_report`` prints
+them as one line each:
+
+    findings = check_series('consumption', timestamps, kwh, CONSUMPTION_LIMITS)
+    findings += check_matching(consumption, prices)
+    print(format_report(findings))
+
+A finding's level is 'error' or 'warning'; callers decide which ones fail
+the run.
+"""
+import numpy as np
+
+from sahko.timeaxis import align, format_local, interval_lengths, parse_local, resample, utc_offsets
+
+# Plausible values per hour of interval: kWh per hour is the average power in
+# kW (a 3x25 A main fuse allows about 17 kW). Prices are snt/kWh with VAT;
+# the day-ahead market is capped at -50 and +400 snt/kWh before VAT.
+CONSUMPTION_LIMITS = {'min': 0.0, 'max': 25.0, 'per_hour': True}
+PRICE_LIMITS = {'min': -50.0, 'max': 510.0, 'per_hour': False}
+
+# Offending timestamps shown per finding
+SAMPLE_SIZE = 3
+
+
+def finding(series, check, level, count, detail=''):
+    return {'series': series, 'check': check, 'level': level, 'count': int(count), 'detail': detail}
+
+
+def _samples(epoch, mask=None):
+    epoch = epoch if mask is None else epoch[mask]
+    shown = format_local(epoch[:SAMPLE_SIZE])
+    more = len(epoch) - len(shown)
+    return ', '.join(shown) + (f" (+{more} more)" if more > 0 else '')
+
+
+def check_series(name, timestamps, values, limits, now=None, max_age_hours=None):
+    """Check one series given as local timestamp strings and values in file order.
+
+    Looks for missing (NaN) values, local times that do not exist (spring
+    DST gap), duplicate intervals, gaps, irregular days around DST changes,
+    values outside ``limits`` and, when ``now`` (epoch seconds) and
+    ``max_age_hours`` are given, data that ends too long ago.
+    """
+    findings = []
+    values = np.asarray(values, dtype=np.float64)
+    if len(timestamps) == 0:
+        return [finding(name, 'empty', 'error', 0, 'no records')]
+    local = np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+    epoch = parse_local(timestamps)
+
+    # A wall-clock time in the spring DST gap maps back to another local time
+    nonexistent = epoch + utc_offsets(epoch) != local
+    if nonexistent.any():
+        findings.append(finding(name, 'dst_nonexistent', 'warning', nonexistent.sum(),
+                                f"local times skipped by DST: {', '.join(np.array(timestamps)[nonexistent][:SAMPLE_SIZE])}"))
+    epoch = epoch[~nonexistent]
+    values = values[~nonexistent]
+
+    order = np.argsort(epoch, kind='stable')
+    epoch = epoch[order]
+    values = values[order]
+    duplicate = np.append(epoch[1:] == epoch[:-1], False)
+    if duplicate.any():
+        conflicting = duplicate & np.append(values[1:] != values[:-1], False)
+        findings.append(finding(name, 'duplicates', 'error' if conflicting.any() else 'warning', duplicate.sum(),
+                                f"{conflicting.sum()} with differing values: {_samples(epoch, duplicate)}"))
+        epoch = epoch[~duplicate]
+        values = values[~duplicate]
+
+    missing_value = np.isnan(values)
+    if missing_value.any():
+        findings.append(finding(name, 'missing_values', 'error', missing_value.sum(), _samples(epoch, missing_value)))
+
+    row_step = interval_lengths(epoch)
+    gaps = np.diff(epoch)
+    missing = np.where(gaps > row_step[:-1], gaps // row_step[:-1] - 1, 0)
+    if missing.any():
+        # Gap start = end of the interval before the hole
+        starts = epoch[:-1][missing > 0] + row_step[:-1][missing > 0]
+        findings.append(finding(name, 'gaps', 'error', missing.sum(),
+                                f"{(missing > 0).sum()} holes starting {_samples(starts)}"))
+
+    # Days around a DST change have 23 or 25 hours; anything else there
+    # points at timestamps converted with the wrong offset
+    offsets = utc_offsets(epoch)
+    day = (epoch + offsets) // 86400
+    firsts = np.concatenate([[0], np.flatnonzero(np.diff(day)) + 1])
+    lasts = np.append(firsts[1:] - 1, len(epoch) - 1)
+    shift = offsets[lasts] - offsets[firsts]
+    transition = shift != 0
+    if transition.any():
+        covered = np.add.reduceat(row_step, firsts)
+        wrong = transition & (covered != 86400 - shift)
+        if wrong.any():
+            lengths = ', '.join(f"{seconds / 3600:g}h" for seconds in covered[wrong][:SAMPLE_SIZE].tolist())
+            findings.append(finding(name, 'dst_day_length', 'error', wrong.sum(),
+                                    f"DST days covering {lengths}: {_samples(epoch[firsts], wrong)}"))
+
+    scaled = values / (row_step / 3600) if limits.get('per_hour') else values
+    too_low = scaled < limits['min']
+    too_high = scaled > limits['max']
+    if too_low.any():
+        findings.append(finding(name, 'below_min', 'error', too_low.sum(),
+                                f"min {values[too_low].min():.3f} < {limits['min']}: {_samples(epoch, too_low)}"))
+    if too_high.any():
+        findings.append(finding(name, 'above_max', 'error', too_high.sum(),
+                                f"max {values[too_high].max():.3f} > {limits['max']}: {_samples(epoch, too_high)}"))
+
+    if now is not None and max_age_hours is not None:
+        age_hours = (now - (epoch[-1] + row_step[-1])) / 3600
+        if age_hours > max_age_hours:
+            findings.append(finding(name, 'stale', 'error', 1,
+                                    f"ends {age_hours:.0f} h ago (limit {max_age_hours:g} h): {_samples(epoch[-1:])}"))
+    return findings
+
+
+def check_matching(consumption, prices, name='consumption'):
+    """Consumption intervals that have no price, as the combine stage would see them.
+
+    Both arguments are ``(epoch, values, step)`` tuples from ``sahko.raw``.
+    """
+    consumption_epoch, consumption_kwh, consumption_step = consumption
+    price_epoch, price_values, price_step = prices
+    fine_step = min(consumption_step, price_step)
+    consumption_epoch, _ = resample(consumption_epoch, consumption_kwh, consumption_step, fine_step, 'sum')
+    price_epoch, _ = resample(price_epoch, price_values, price_step, fine_step, 'mean')
+    matched, _ = align(consumption_epoch, price_epoch)
+    unmatched = np.ones(len(consumption_epoch), dtype=bool)
+    unmatched[matched] = False
+    if not unmatched.any():
+        return []
+    return [finding(name, 'unmatched_price', 'error', unmatched.sum(),
+                    f"{unmatched.sum() * fine_step / 3600:g} h without price: {_samples(consumption_epoch, unmatched)}")]
+
+
+def format_report(findings, summaries=()):
+    """Compact text report: one line per series summary, then one per finding."""
+    lines = [f"{'Series':<28} {'Check':<16} {'Level':<8} {'Count':>7}  Detail"]
+    for summary in summaries:
+        lines.append(f"{summary['series']:<28} {'records':<16} {'info':<8} {summary['count']:>7}  "
+                     f"{summary['first']} .. {summary['last']}")
+    for item in findings:
+        lines.append(f"{item['series']:<28} {item['check']:<16} {item['level']:<8} {item['count']:>7}  {item['detail']}")
+    errors = sum(item['level'] == 'error' for item in findings)
+    warnings = sum(item['level'] == 'warning' for item in findings)
+    lines.append(f"{errors} error(s), {warnings} warning(s)")
+    return '\n'.join(lines)
+
+
+def summarize(name, epoch):
+    """Record count and first/last local timestamp of a loaded series."""
+    if len(epoch) == 0:
+        return {'series': name, 'count': 0, 'first': '-', 'last': '-'}
+    first, last = format_local(np.array([epoch[0], epoch[-1]]))
+    return {'series': name, 'count': len(epoch), 'first': first, 'last': last}
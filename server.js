@@ -64,6 +64,82 @@ app.get('/api/analysis', async (req, res) => {
     }
 });
 
+// Precompressed aggregates written by the combine step (sahko/payloads.py).
+// The manifest holds the content hash used as ETag and the file per encoding;
+// file contents are cached in memory until the manifest changes.
+const payloadDir = path.join(__dirname, 'processed', 'api');
+const payloadCache = { mtimeMs: null, manifest: null, files: new Map() };
+
+async function loadPayloadManifest() {
+    const manifestPath = path.join(payloadDir, 'manifest.json');
+    const stat = await fs.stat(manifestPath);
+    if (stat.mtimeMs !== payloadCache.mtimeMs) {
+        payloadCache.manifest = JSON.parse(await fs.readFile(manifestPath, 'utf-8'));
+        payloadCache.mtimeMs = stat.mtimeMs;
+        payloadCache.files.clear();
+    }
+    return payloadCache.manifest;
+}
+
+function pickEncoding(acceptEncoding, available) {
+    const accepted = (acceptEncoding || '').split(',').map(part => part.trim().split(';')[0]);
+    for (const encoding of ['br', 'gzip']) {
+        if (available[encoding] && accepted.includes(encoding)) {
+            return encoding;
+        }
+    }
+    return 'identity';
+}
+
+app.get('/api/aggregates', async (req, res) => {
+    try {
+        const entry = (await loadPayloadManifest()).aggregates;
+        if (!entry) {
+            return res.status(404).json({ error: 'No aggregates have been generated yet' });
+        }
+        const etag = `"${entry.etag}"`;
+        res.set({ 'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding' });
+        if (req.headers['if-none-match'] === etag) {
+            return res.status(304).end();
+        }
+
+        const encoding = pickEncoding(req.headers['accept-encoding'], entry.files);
+        const file = entry.files[encoding];
+        if (!payloadCache.files.has(file)) {
+            payloadCache.files.set(file, await fs.readFile(path.join(payloadDir, file)));
+        }
+        res.type('application/json');
+        if (encoding !== 'identity') {
+            res.set('Content-Encoding', encoding);
+        }
+        res.send(payloadCache.files.get(file));
+    } catch (error) {
+        if (error.code === 'ENOENT') {
+            return res.status(404).json({ error: 'No aggregates have been generated yet' });
+        }
+        logError('Error reading aggregates:', error);
+        res.status(500).json({ error: 'Failed to retrieve aggregates', details: error.message });
+    }
+});
+
+// API endpoints answered by the Python analysis service (analysis_service.py)
+const analysisServiceUrl = process.env.ANALYSIS_SERVICE_URL;
+app.get(['/api/summary', '/api/monthly', '/api/hourly', '/api/daily'], async (req, res) => {
+    if (!analysisServiceUrl) {
+        return res.status(503).json({ error: 'ANALYSIS_SERVICE_URL is not configured' });
+    }
+    const target = `${analysisServiceUrl}${req.path.replace('/api', '')}`;
+    log(`Forwarding ${req.path} to analysis service: ${target}`);
+    try {
+        const response = await fetch(target);
+        const body = await response.json();
+        res.status(response.status).json(body);
+    } catch (error) {
+        logError('Error contacting analysis service:', error);
+        res.status(502).json({ error: 'Analysis service unavailable', details: error.message });
+    }
+});
+
 // API endpoint to get configuration
 app.get('/api/config', (req, res) => {
     log('Received request for configuration');
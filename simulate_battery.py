@@ -0,0 +1,89 @@
+"""Size a home battery against the combined consumption and spot prices.
+
+Every (capacity, power) pair is dispatched optimally (or greedily with
+--mode greedy) over the combined data and priced with a tariff's all-in
+per-kWh price (see sahko/tariff.py); the pairs run in parallel processes:
+
+    python simulate_battery.py
+    python simulate_battery.py --capacity 5 10 15 20 --power 3 5 --tariff spot_time_of_use
+    python simulate_battery.py --mode greedy --export spot
+"""
+import argparse
+import logging
+import sys
+
+import numpy as np
+
+from sahko.battery import EFFICIENCY, MODES, SOC_RESOLUTION, sweep
+from sahko.instrumentation import stage, add_rows
+from sahko.series import HourlySeries
+from sahko.tariff import load_tariffs, per_kwh_prices
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def print_sweep(results, days):
+    capacities = sorted({result['capacity'] for result in results})
+    powers = sorted({result['power'] for result in results})
+    by_pair = {(result['capacity'], result['power']): result for result in results}
+    scale = 365 / days if days else 0.0
+
+    print(f"\nBaseline cost without a battery: {results[0]['baseline_cost']:.2f} EUR over {days} days")
+    print("Savings per year (EUR) and full cycles per year, by capacity (kWh) and power (kW):\n")
+    print(f"{'kWh':>8}" + ''.join(f"{f'{power:g} kW':>22}" for power in powers))
+    for capacity in capacities:
+        cells = []
+        for power in powers:
+            result = by_pair[(capacity, power)]
+            cells.append(f"{result['savings'] * scale:>12.2f} {result['cycles'] * scale:>7.0f} cyc")
+        print(f"{capacity:>8g}" + ''.join(f"{cell:>22}" for cell in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate home battery savings over the combined data')
+    parser.add_argument('--data', default='processed/combined_data.csv', help='Combined data CSV')
+    parser.add_argument('--capacity', type=float, nargs='+', default=[5, 10, 15], help='Capacities to try (kWh)')
+    parser.add_argument('--power', type=float, nargs='+', default=[3, 5], help='Charge/discharge powers to try (kW)')
+    parser.add_argument('--efficiency', type=float, default=EFFICIENCY, help='Round-trip efficiency (default: 0.9)')
+    parser.add_argument('--mode', choices=list(MODES), default='optimal',
+                        help='optimal: dynamic programming; greedy: cheapest/dearest rows of each day')
+    parser.add_argument('--tariff', default='spot', help='Tariff whose per-kWh price is paid for imports (default: spot)')
+    parser.add_argument('--export', choices=['none', 'spot'], default='none',
+                        help='Value exported energy at nothing or at the spot price (default: none)')
+    parser.add_argument('--resolution', type=float, default=SOC_RESOLUTION,
+                        help='State-of-charge step (kWh) for the optimal mode (default: 0.05)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+
+    tariffs = load_tariffs()
+    if args.tariff not in tariffs:
+        parser.error(f"Unknown tariff {args.tariff}; known: {', '.join(tariffs)}")
+
+    with stage("battery_sweep"):
+        series = HourlySeries.read_csv(args.data)
+        add_rows(len(series))
+        buy = per_kwh_prices(series, tariffs[args.tariff])
+        sell = series.price if args.export == 'spot' else np.zeros(len(series))
+        options = {'efficiency': args.efficiency, 'interval_hours': series.interval_hours}
+        if args.mode == 'optimal':
+            if args.resolution <= 0:
+                parser.error('--resolution must be positive')
+            options['resolution'] = args.resolution
+        else:
+            options['days'] = series.field('day')
+        logger.info(f"Simulating {len(args.capacity) * len(args.power)} batteries over {len(series)} rows ({args.mode})")
+        results = sweep(series.consumption, buy, sell, args.capacity, args.power, mode=args.mode,
+                        workers=args.workers, **options)
+
+    days = len(np.unique(series.field('day')))
+    print_sweep(results, days)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Check the downloaded consumption and price files before they are combined.
+
+Reports gaps, duplicate intervals, DST problems, implausible values,
+consumption hours without a price and stale data in one compact table, and
+exits with status 1 when any error is found (also on warnings with
+--strict), so cron jobs and CI can stop on bad data:
+
+    python validate_data.py
+    python validate_data.py --consumption meter1.json meter2.json --prices hinnat_2024.csv hinnat_2025.csv
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from dotenv import load_dotenv
+
+from sahko.instrumentation import stage, add_rows, add_bytes_read
+from sahko.raw import consumption_records, iter_months, price_records, sorted_series
+from sahko.timeaxis import parse_local
+from sahko.validation import (CONSUMPTION_LIMITS, PRICE_LIMITS, check_matching, check_series,
+                              format_report, summarize)
+
+# Load environment variables
+load_dotenv()
+
+YEAR = os.getenv('YEAR')
+
+
+def validate(consumption_files, price_files, max_age_hours=None, now=None):
+    """Run every check; returns (findings, summaries)."""
+    findings = []
+    summaries = []
+
+    # Price files are checked as one series so year boundaries are not gaps
+    timestamps = []
+    values = []
+    for filename in price_files:
+        file_timestamps, file_values = price_records(filename)
+        add_bytes_read(os.path.getsize(filename))
+        timestamps.extend(file_timestamps)
+        values.append(file_values)
+    values = np.concatenate(values) if values else np.empty(0)
+    price_name = os.path.basename(price_files[0]) if len(price_files) == 1 else 'prices'
+    findings += check_series(price_name, timestamps, values, PRICE_LIMITS, now, max_age_hours)
+    prices = sorted_series(parse_local(timestamps), values, 'mean')
+    summaries.append(summarize(price_name, prices[0]))
+    add_rows(len(timestamps))
+
+    for filename in consumption_files:
+        name = os.path.basename(filename)
+        timestamps, kwh = consumption_records(iter_months(filename), YEAR)
+        add_bytes_read(os.path.getsize(filename))
+        findings += check_series(name, timestamps, kwh, CONSUMPTION_LIMITS, now, max_age_hours)
+        consumption = sorted_series(parse_local(timestamps), kwh, 'sum')
+        summaries.append(summarize(name, consumption[0]))
+        if len(consumption[0]) and len(prices[0]):
+            findings += check_matching(consumption, prices, name)
+        add_rows(len(timestamps))
+    return findings, summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate downloaded consumption and price data')
+    parser.add_argument('--consumption', nargs='+', default=['downloads/consumption_data.json'],
+                        help='Elenia consumption JSON file(s)')
+    parser.add_argument('--prices', nargs='+', default=[f'downloads/vattenfall_hinnat_{YEAR}.csv'],
+                        help='Vattenfall price CSV file(s), checked as one series')
+    parser.add_argument('--max-age-hours', type=float, default=float(os.getenv('VALIDATION_MAX_AGE_HOURS', 72)),
+                        help='Fail when data ends longer ago than this; only checked for the current year (default: 72)')
+    parser.add_argument('--strict', action='store_true', help='Fail on warnings too')
+    args = parser.parse_args(argv)
+
+    # Staleness only makes sense while the year is still running
+    current_year = str(datetime.now().year) == str(YEAR)
+    with stage("validate"):
+        findings, summaries = validate(args.consumption, args.prices,
+                                       max_age_hours=args.max_age_hours if current_year else None,
+                                       now=time.time())
+    print(format_report(findings, summaries))
+
+    failing = ('error', 'warning') if args.strict else ('error',)
+    return 1 if any(item['level'] in failing for item in findings) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())